@@ -0,0 +1,558 @@
+import logging
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from images import DecodedImage, decode_image, decode_pixmap, decode_xref, load_fitz, open_fitz_document
+from ocr import image_key
+from spatial import CharIndex, PageChars, to_rgb
+
+DEFAULT_ENGINE = "pdfplumber"
+
+# pdfplumber metadata keys and their PyMuPDF counterparts
+_METADATA_KEYS = {
+    "Author": "author",
+    "Title": "title",
+    "Subject": "subject",
+    "Keywords": "keywords",
+    "Producer": "producer",
+    "Creator": "creator",
+    "CreationDate": "creationDate",
+    "ModDate": "modDate",
+}
+
+
+class PageImage:
+    """ An image drawn on a page. It can be identified without decoding it, and is only decoded on demand. """
+
+    @property
+    def size(self) -> tuple[int, int]:
+        """ Width and height in pixels. """
+        raise NotImplementedError
+
+    @property
+    def bbox(self) -> tuple[float, float, float, float]:
+        """ Where the image is drawn, as (x0, y0, x1, y1) in PDF coordinates like the chars of its page. """
+        raise NotImplementedError
+
+    @property
+    def visible_bbox(self) -> Optional[tuple[float, float, float, float]]:
+        """ The part of `bbox` that is not clipped away, or None when nothing of the image shows. """
+        return self.bbox
+
+    @property
+    def order(self) -> Optional[int]:
+        """ Position of the image in the drawing order of its page, comparable with `PageChars.order`, or None when it
+        is not known or the image may let what is below it show through. """
+        return None
+
+    def key(self, languages: list[str]) -> str:
+        raise NotImplementedError
+
+    def decode(self) -> DecodedImage:
+        raise NotImplementedError
+
+
+class DocumentPage:
+    """ The view of a page the detectors work on, modelled on `pdfplumber.Page`.
+
+    `chars` and `rects` are dicts with pdfplumber's keys (`text`, `x0`, `y0`, `x1`, `y1`, `fill`, `non_stroking_color`)
+    in PDF coordinates, with the origin at the bottom left of the page. Chars may also have a font `size`, a
+    `render_mode` and a `seqno` giving their position in the drawing order of the page.
+    """
+    page_number: int
+    _char_columns: Optional[PageChars] = None
+    _char_index: Optional[CharIndex] = None
+
+    @property
+    def area(self) -> float:
+        """ Area of the page in square points. """
+        raise NotImplementedError
+
+    @property
+    def chars(self) -> list[dict]:
+        raise NotImplementedError
+
+    @property
+    def rects(self) -> list[dict]:
+        raise NotImplementedError
+
+    @property
+    def images(self) -> list[PageImage]:
+        raise NotImplementedError
+
+    @property
+    def char_columns(self) -> PageChars:
+        """ `chars` as columns, built on first use and shared by the detectors until the page is closed. """
+        if self._char_columns is None:
+            self._char_columns = PageChars.from_chars(self.chars)
+        return self._char_columns
+
+    @property
+    def char_index(self) -> CharIndex:
+        """ A spatial index over `chars`, built on first use and shared by the detectors until the page is closed. """
+        if self._char_index is None:
+            self._char_index = CharIndex(self.char_columns)
+        return self._char_index
+
+    def extract_text(self) -> str:
+        raise NotImplementedError
+
+    def load(self):
+        """ Parses the page, which otherwise happens on first use. """
+        pass
+
+    def close(self):
+        """ Releases everything parsed for this page. """
+        self._char_columns = None
+        self._char_index = None
+
+
+class Document:
+    """ An open PDF: its path, pdfplumber-style metadata (`Author`, `CreationDate`, ...) and pages. """
+    path: Path
+    metadata: dict
+    pages: list[DocumentPage]
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _PdfplumberImage(PageImage):
+    def __init__(self, image: dict, document: 'PdfplumberDocument'):
+        self.image = image
+        self.document = document
+
+    @property
+    def size(self) -> tuple[int, int]:
+        width, height = self.image['srcsize']
+        return int(width), int(height)
+
+    @property
+    def bbox(self) -> tuple[float, float, float, float]:
+        return self.image['x0'], self.image['y0'], self.image['x1'], self.image['y1']
+
+    def key(self, languages: list[str]) -> str:
+        stream = self.image['stream']
+        attrs = stream.attrs
+        return image_key(stream.get_data(), (attrs.get("Width"), attrs.get("Height"), str(attrs.get("Filter"))), languages)
+
+    def decode(self) -> DecodedImage:
+        return decode_image(self.image, self.document.fitz_doc)
+
+
+class PdfplumberPage(DocumentPage):
+    def __init__(self, page: 'pdfplumber.page.Page', document: 'PdfplumberDocument'):
+        self.page = page
+        self.document = document
+        self.page_number: int = page.page_number
+
+    @property
+    def area(self) -> float:
+        return float(self.page.width * self.page.height)
+
+    @property
+    def chars(self) -> list[dict]:
+        return self.page.objects.get("char", [])
+
+    @property
+    def rects(self) -> list[dict]:
+        return self.page.objects.get("rect", [])
+
+    @property
+    def images(self) -> list[PageImage]:
+        return [_PdfplumberImage(image, self.document) for image in self.page.images]
+
+    def extract_text(self) -> str:
+        return self.page.extract_text(x_tolerance=1, y_tolerance=1)
+
+    def load(self):
+        self.page.objects
+
+    def close(self):
+        super().close()
+        self.page.close()
+
+
+class PdfplumberDocument(Document):
+    """ Extraction through pdfplumber and pdfminer. Images that pdfminer cannot decode are decoded by PyMuPDF when it
+    is installed (see `images.decode_image`). """
+
+    def __init__(self, path: Path):
+        import pdfplumber  # imported on first use like PyMuPDF, to keep the startup of the CLI and server short
+
+        self.path: Path = Path(path)
+        self.pdf = pdfplumber.open(self.path)
+        self.metadata: dict = self.pdf.metadata
+        self.pages: list[DocumentPage] = [PdfplumberPage(page, self) for page in self.pdf.pages]
+        self._fitz_doc = None
+        self._fitz_opened = False
+
+    @property
+    def fitz_doc(self):
+        if not self._fitz_opened:
+            self._fitz_doc = open_fitz_document(self.path)
+            self._fitz_opened = True
+        return self._fitz_doc
+
+    def close(self):
+        if self._fitz_doc is not None:
+            self._fitz_doc.close()
+            self._fitz_doc = None
+        self.pdf.close()
+
+
+class _PyMuPDFImage(PageImage):
+    def __init__(self, page: 'PyMuPDFPage', info: dict, index: int):
+        self.page = page
+        self.info = info
+        self.index: int = index
+        self.xref: int = info.get("xref", 0)
+        self._pixmap = None
+
+    @property
+    def size(self) -> tuple[int, int]:
+        return self.info["width"], self.info["height"]
+
+    @property
+    def bbox(self) -> tuple[float, float, float, float]:
+        return self.page._to_pdf(self.info["bbox"])
+
+    @property
+    def visible_bbox(self) -> Optional[tuple[float, float, float, float]]:
+        traced = self.page._image_trace()[self.index]
+        if traced is None:
+            return self.bbox
+        x0, y0, x1, y1 = traced[1]
+        return self.page._to_pdf(traced[1]) if x0 < x1 and y0 < y1 else None
+
+    @property
+    def order(self) -> Optional[int]:
+        # "number" in the image info is a block number, not a position in the drawing order
+        traced = self.page._image_trace()[self.index]
+        return None if self.info.get("has-mask") or traced is None else traced[0]
+
+    def key(self, languages: list[str]) -> str:
+        doc = self.page.document.doc
+        if self.xref:
+            data = doc.xref_stream_raw(self.xref)
+            attributes = (self.info["width"], self.info["height"], doc.xref_get_key(self.xref, "Filter")[1])
+        else:
+            data = self._inline_pixmap().samples
+            attributes = (self.info["width"], self.info["height"], "inline")
+        return image_key(data, attributes, languages)
+
+    def decode(self) -> DecodedImage:
+        if self.xref:
+            return decode_xref(self.page.document.doc, self.xref)
+        return decode_pixmap(self._inline_pixmap())
+
+    def _inline_pixmap(self):
+        # Inline images have no xref to decode, render their area of the page at the image's own resolution instead
+        if self._pixmap is None:
+            fitz = load_fitz()
+            bbox = fitz.Rect(self.info["bbox"])
+            scale = fitz.Matrix(self.info["width"] / max(bbox.width, 1), self.info["height"] / max(bbox.height, 1))
+            self._pixmap = self.page.fitz_page.get_pixmap(matrix=scale, clip=bbox)
+        return self._pixmap
+
+
+@lru_cache(maxsize=None)
+def _image_tracer():
+    """ A MuPDF device that numbers the drawing operations of a page like the "seqno" of text spans and `get_bboxlog`
+    do, and records every image with its box and the part of it the clips in force leave visible. Defined on first use,
+    PyMuPDF is only imported once a document needs it. """
+    mupdf = load_fitz().mupdf
+    everywhere = (-float("inf"), -float("inf"), float("inf"), float("inf"))
+
+    def rect(r) -> tuple:
+        return r.x0, r.y0, r.x1, r.y1
+
+    def intersect(a: tuple, b: tuple) -> tuple:
+        return max(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), min(a[3], b[3])
+
+    class ImageTracer(mupdf.FzDevice2):
+        def __init__(self):
+            super().__init__()
+            self.seqno: int = 0
+            # (seqno, box, visible part of the box)
+            self.images: list[tuple[int, tuple, tuple]] = []
+            self.clips: list[tuple] = [everywhere]
+            for name in ("fill_path", "stroke_path", "fill_text", "stroke_text", "ignore_text", "fill_shade", "fill_image",
+                         "fill_image_mask", "clip_path", "clip_stroke_path", "clip_text", "clip_stroke_text",
+                         "clip_image_mask", "begin_mask", "pop_clip"):
+                getattr(self, f"use_virtual_{name}")()
+
+        def draw(self, *args):
+            self.seqno += 1
+
+        fill_path = stroke_path = fill_text = stroke_text = ignore_text = fill_shade = draw
+
+        def fill_image(self, ctx, image, ctm, *args):
+            box = rect(mupdf.ll_fz_transform_rect(mupdf.fz_unit_rect, ctm))
+            self.images.append((self.seqno, box, intersect(box, self.clips[-1])))
+            self.seqno += 1
+
+        fill_image_mask = fill_image
+
+        def clip(self, box: tuple):
+            self.clips.append(intersect(self.clips[-1], box))
+
+        def clip_path(self, ctx, path, even_odd, ctm, scissor):
+            self.clip(rect(mupdf.ll_fz_bound_path(path, None, ctm)))
+
+        def clip_stroke_path(self, ctx, path, stroke, ctm, scissor):
+            self.clip(rect(mupdf.ll_fz_bound_path(path, stroke, ctm)))
+
+        def clip_text(self, ctx, text, ctm, scissor):
+            self.clip(rect(mupdf.ll_fz_bound_text(text, None, ctm)))
+
+        def clip_stroke_text(self, ctx, text, stroke, ctm, scissor):
+            self.clip(rect(mupdf.ll_fz_bound_text(text, stroke, ctm)))
+
+        def clip_image_mask(self, ctx, image, ctm, scissor):
+            self.clip(rect(mupdf.ll_fz_transform_rect(mupdf.fz_unit_rect, ctm)))
+
+        def begin_mask(self, ctx, area, luminosity, colorspace, color, color_params):
+            # Ended by `pop_clip` like a clip. A soft mask may show what lies outside its area, it clips nothing here
+            self.clips.append(self.clips[-1])
+
+        def pop_clip(self, ctx):
+            if len(self.clips) > 1:
+                self.clips.pop()
+
+    return ImageTracer
+
+
+class PyMuPDFPage(DocumentPage):
+    """ A page read with MuPDF, which is loaded on first use and converted to pdfplumber's layout of chars and rects. """
+
+    def __init__(self, document: 'PyMuPDFDocument', index: int):
+        self.document = document
+        self.index: int = index
+        self.page_number: int = index + 1
+        self._page = None
+        self._chars: Optional[list[dict]] = None
+        self._rects: Optional[list[dict]] = None
+        self._images: Optional[list[PageImage]] = None
+        self._traced: Optional[list[Optional[tuple]]] = None
+        self._matrix: Optional[tuple] = None
+
+    @property
+    def fitz_page(self):
+        if self._page is None:
+            self._page = self.document.doc.load_page(self.index)
+        return self._page
+
+    @property
+    def area(self) -> float:
+        rect = self.fitz_page.rect
+        return rect.width * rect.height
+
+    def _to_pdf(self, box) -> tuple[float, float, float, float]:
+        # MuPDF puts the origin at the top left, pdfplumber's x0/y0/x1/y1 are in PDF space
+        if self._matrix is None:
+            self._matrix = tuple(~self.fitz_page.transformation_matrix)
+        a, b, c, d, e, f = self._matrix
+        x0, y0, x1, y1 = box
+        xs = (a * x0 + c * y0, a * x1 + c * y0, a * x0 + c * y1, a * x1 + c * y1)
+        ys = (b * x0 + d * y0, b * x1 + d * y0, b * x0 + d * y1, b * x1 + d * y1)
+        return min(xs) + e, min(ys) + f, max(xs) + e, max(ys) + f
+
+    def _trace(self) -> tuple:
+        """ The chars of the page as columns in pdfplumber's layout: texts, boxes in PDF space, fill colours, and per
+        char the index of its span in `spans`. Read span by span from MuPDF's text trace, without a dict per char. """
+        texts, boxes, spans, span_of_char = [], [], [], []
+        for span in self.fitz_page.get_texttrace():
+            chars = span["chars"]
+            if not chars:
+                continue
+            texts += [chr(char[0]) for char in chars]
+            box = np.array([char[3] for char in chars], dtype=float).reshape(-1, 4)
+            if span["dir"] == (1.0, 0.0) and not span["wmode"]:
+                # pdfminer's char box: one font size high, starting at the font's descent below the baseline
+                bottom = np.array([char[2][1] for char in chars], dtype=float) - span["descender"] * span["size"]
+                box[:, 1], box[:, 3] = bottom - span["size"], bottom
+            boxes.append(box)
+            span_of_char.append(np.full(len(chars), len(spans)))
+            spans.append(span)
+        if not spans:
+            return [], np.zeros((0, 4)), [], np.zeros(0, dtype=np.int64)
+        return texts, self._to_pdf_array(np.concatenate(boxes)), spans, np.concatenate(span_of_char)
+
+    def _to_pdf_array(self, boxes: np.ndarray) -> np.ndarray:
+        # `_to_pdf` on every row of an (n, 4) array
+        if self._matrix is None:
+            self._matrix = tuple(~self.fitz_page.transformation_matrix)
+        a, b, c, d, e, f = self._matrix
+        x0, y0, x1, y1 = boxes.T
+        xs = np.stack((a * x0 + c * y0, a * x1 + c * y0, a * x0 + c * y1, a * x1 + c * y1))
+        ys = np.stack((b * x0 + d * y0, b * x1 + d * y0, b * x0 + d * y1, b * x1 + d * y1))
+        return np.column_stack((xs.min(axis=0) + e, ys.min(axis=0) + f, xs.max(axis=0) + e, ys.max(axis=0) + f))
+
+    @property
+    def char_columns(self) -> PageChars:
+        if self._char_columns is None:
+            texts, boxes, spans, span_of_char = self._trace()
+            self._char_columns = PageChars(
+                texts, boxes,
+                rgb=to_rgb([span["color"] for span in spans])[span_of_char],
+                size=np.array([span["size"] for span in spans], dtype=float)[span_of_char],
+                render_mode=np.array([span["type"] for span in spans], dtype=np.int8)[span_of_char],
+                order=np.array([span["seqno"] for span in spans], dtype=np.int64)[span_of_char],
+            )
+        return self._char_columns
+
+    @property
+    def chars(self) -> list[dict]:
+        if self._chars is None:
+            texts, boxes, spans, span_of_char = self._trace()
+            self._chars = [
+                {
+                    "object_type": "char",
+                    "text": text,
+                    "x0": x0, "y0": y0, "x1": x1, "y1": y1,
+                    "non_stroking_color": spans[i]["color"],  # in the span's own colour space, like pdfplumber
+                    "size": spans[i]["size"],
+                    "render_mode": spans[i]["type"],  # 3 is invisible
+                    "seqno": spans[i]["seqno"],  # position in the drawing order of the page, see `PageImage.order`
+                }
+                for text, (x0, y0, x1, y1), i in zip(texts, boxes.tolist(), span_of_char.tolist())
+            ]
+        return self._chars
+
+    @property
+    def rects(self) -> list[dict]:
+        if self._rects is None:
+            self._rects = []
+            for path in self.fitz_page.get_drawings():
+                fill = path.get("fill")
+                for item in path["items"]:
+                    if item[0] == "re":
+                        rect = item[1]
+                    elif item[0] == "qu" and item[1].is_rectangular:
+                        rect = item[1].rect
+                    else:
+                        continue
+                    x0, y0, x1, y1 = self._to_pdf(rect)
+                    self._rects.append({
+                        "object_type": "rect",
+                        "x0": x0, "y0": y0, "x1": x1, "y1": y1,
+                        "fill": fill is not None,
+                        "stroke": path.get("color") is not None,
+                        "non_stroking_color": fill or (),  # MuPDF reports fills as RGB
+                    })
+        return self._rects
+
+    @property
+    def images(self) -> list[PageImage]:
+        if self._images is None:
+            self._images = [_PyMuPDFImage(self, info, i) for i, info in enumerate(self.fitz_page.get_image_info(xrefs=True))]
+        return self._images
+
+    def _image_trace(self) -> list[Optional[tuple]]:
+        """ For every image of `images` its position in the drawing order counted by the "seqno" of text spans, and the
+        part of its box left by the clips it is drawn in (MuPDF coordinates), or None when it cannot be told. The images
+        drawn while running the page (see `_image_tracer`) are matched to the images in order by their boxes. """
+        if self._traced is None:
+            tracer = _image_tracer()()
+            mupdf = load_fitz().mupdf
+            # In the unrotated space of the page, like the image info and the text trace
+            mupdf.fz_run_page(self.fitz_page.this, tracer, mupdf.FzMatrix(*self.fitz_page.derotation_matrix), mupdf.FzCookie())
+            mupdf.fz_close_device(tracer)
+            self._traced, start = [], 0
+            for image in self.images:
+                bbox = image.info["bbox"]
+                match = next((i for i in range(start, len(tracer.images)) if max(abs(a - b) for a, b in zip(tracer.images[i][1], bbox)) <= 1), None)
+                self._traced.append(None if match is None else (tracer.images[match][0], tracer.images[match][2]))
+                start = start if match is None else match + 1
+        return self._traced
+
+    def extract_text(self) -> str:
+        return self.fitz_page.get_text("text")
+
+    def load(self):
+        self.fitz_page
+
+    def close(self):
+        super().close()
+        self._page = None
+        self._chars = None
+        self._rects = None
+        self._images = None
+        self._traced = None
+        self._matrix = None
+
+
+class PyMuPDFDocument(Document):
+    """ Extraction through PyMuPDF, which is much faster than pdfplumber on text-heavy documents. """
+
+    def __init__(self, path: Path):
+        fitz = load_fitz()
+        if fitz is None:
+            raise RuntimeError("The pymupdf engine requires PyMuPDF, install it with `pip install pymupdf`")
+        self.path: Path = Path(path)
+        self.doc = fitz.open(self.path)
+        self.metadata: dict = {key: self.doc.metadata[name] for key, name in _METADATA_KEYS.items() if self.doc.metadata.get(name)}
+        self.pages: list[DocumentPage] = [PyMuPDFPage(self, i) for i in range(self.doc.page_count)]
+
+    def close(self):
+        self.doc.close()
+
+
+ENGINES = {
+    "pdfplumber": PdfplumberDocument,
+    "pymupdf": PyMuPDFDocument,
+}
+
+
+def open_document(path: Path, engine: str = DEFAULT_ENGINE) -> Document:
+    """ Opens a PDF with the given extraction engine, one of `ENGINES`. """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown PDF engine: {engine}")
+    logging.debug(f"Opening {path} with the {engine} engine")
+    return ENGINES[engine](path)
+
+
+class UnreadablePDF(Exception):
+    """ A file that cannot be opened as a PDF, e.g. because it is missing or damaged. """
+
+
+def page_count(path: Path, engine: str = DEFAULT_ENGINE) -> int:
+    """ Counts the pages of a PDF without parsing them. PyMuPDF only reads the page tree, so it is used whenever it is
+    installed; the count can then differ from the engine's own for damaged files.
+
+    Counts are remembered by file size and modification time, so that ordering documents by pages and sharding them
+    read every file once. Raises `UnreadablePDF` for a file that cannot be opened.
+    """
+    try:
+        stat = path.stat()
+    except OSError as e:
+        raise UnreadablePDF(f"Cannot read {path}: {e}") from e
+    return _page_count(path, engine, stat.st_size, stat.st_mtime_ns)
+
+
+@lru_cache(maxsize=1 << 16)
+def _page_count(path: Path, engine: str, size: int, mtime_ns: int) -> int:
+    fitz = load_fitz()
+    if fitz is not None:
+        try:
+            with fitz.open(path) as doc:
+                return doc.page_count
+        except (OSError, RuntimeError) as e:  # MuPDF's errors, e.g. `FileDataError`, are RuntimeErrors
+            raise UnreadablePDF(f"Cannot open {path}: {e}") from e
+    from pdfplumber.utils.exceptions import PdfminerException
+
+    try:
+        with open_document(path, engine) as pdf:
+            return len(pdf.pages)
+    except (OSError, PdfminerException) as e:
+        raise UnreadablePDF(f"Cannot open {path}: {e}") from e
@@ -0,0 +1,60 @@
+""" Timing of the pdfplumber and pymupdf extraction engines (see `backends.py`): the detectors that do not need OCR on a
+synthetic text-heavy document. Their parity is checked by test/test_engines.py.
+
+    python benchmarks/bench_engines.py [--pages 50]
+"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import pymupdf as fitz
+
+from backends import ENGINES, open_document
+from classes import ScannedPDF
+from helpers import CoveredTextDetector, FilledRectangleDetector, InvisibleTextDetector, SignatureDetector, TextPIIDetector, WhiteTextDetector
+from pipeline import PagePipeline
+
+
+def make_text_pdf(path: Path, pages: int):
+    """ Writes a text-heavy PDF: 60 lines of prose per page with an occasional PII-like token. """
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page(width=595, height=842)
+        lines = [
+            f"Line {line} of page {i + 1}: the invoice total was paid to account {1000 + line} "
+            + ("mail jan.jansen@example.nl or 06-12345678" if line % 20 == 0 else "in full and on time.")
+            for line in range(60)
+        ]
+        page.insert_text((40, 40), "\n".join(lines), fontsize=8)
+        page.draw_rect(fitz.Rect(40, 400, 300, 412), color=None, fill=(0, 0, 0))
+    doc.save(path)
+    doc.close()
+
+
+def time_engine(pdf_path: Path, engine: str) -> float:
+    start = time.perf_counter()
+    with open_document(pdf_path, engine) as pdf:
+        PagePipeline([WhiteTextDetector(), InvisibleTextDetector(), CoveredTextDetector(), FilledRectangleDetector(), SignatureDetector(ScannedPDF(pdf_path.as_posix())), TextPIIDetector()]).run(pdf)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=50, help="Pages of the synthetic document used for timing.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        text_pdf = Path(tmp) / "text.pdf"
+        make_text_pdf(text_pdf, args.pages)
+        timings = {engine: time_engine(text_pdf, engine) for engine in ENGINES}
+
+    print(f"{args.pages} text pages without OCR: " + "  ".join(f"{engine}: {seconds:.3f}s" for engine, seconds in timings.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+""" Benchmark of `helpers.extract_text_inside_filled_rectangles` against the original rects x chars loop, on a
+synthetic page with thousands of dark filled rectangles. Their parity is checked by test/test_filled_rectangles.py.
+
+    python benchmarks/bench_filled_rectangles.py [--rects 5000] [--chars 30000]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "test"))
+
+from helpers import extract_text_inside_filled_rectangles
+from test_filled_rectangles import reference_extract_text_inside_filled_rectangles, synthetic_pdf
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rects", type=int, default=5000)
+    parser.add_argument("--chars", type=int, default=30000)
+    args = parser.parse_args()
+
+    pdf = synthetic_pdf(args.rects, args.chars)
+    expected, reference_seconds = timed(lambda: list(reference_extract_text_inside_filled_rectangles(pdf)))
+    actual, indexed_seconds = timed(lambda: [(a.page_number, a.text) for a in extract_text_inside_filled_rectangles(pdf, None)])
+    print(f"synthetic page: {args.rects} rects, {args.chars} chars, {len(actual)} artifacts")
+    print(f"reference: {reference_seconds:.3f}s  indexed: {indexed_seconds:.3f}s  speedup: {reference_seconds / indexed_seconds:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+""" Benchmark and parity check for the hidden text detectors: white, invisible and covered text (see `helpers.py`).
+
+Compares white text detection on the columnar char arrays with the original loop over the char dicts, on the sample
+PDFs in test/data and on a synthetic corpus (see `synthetic.py`), then times the three hidden text detectors against
+the other detectors that do not need OCR, so that their share of a scan can be checked under both engines. Also checks
+that text drawn under an image is found as covered text when the page draws vector paths before the text, as
+test/test_hidden_text.py does.
+
+    python benchmarks/bench_hidden_text.py [--pages 50]
+"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+sys.path.insert(0, str(ROOT / "test"))
+
+from backends import ENGINES, open_document
+from classes import ScannedPDF
+from helpers import CoveredTextDetector, FilledRectangleDetector, InvisibleTextDetector, SignatureDetector, TextPIIDetector, WhiteTextDetector, extract_white_text_from_page
+from pipeline import PagePipeline
+from synthetic import CorpusSpec, make_corpus_pdf
+from test_hidden_text import covered_text, make_covered_text_pdf
+
+
+def reference_extract_white_text_from_page(page):
+    """ The original loop, which concatenates consecutive white chars across lines, kept as the parity oracle. """
+    captured_white_text = ""
+    for obj in page.chars:
+        if obj['object_type'] == 'char' and all(0.8 <= c <= 1.0 for c in obj.get('non_stroking_color', [])):
+            captured_white_text += obj['text']
+        elif captured_white_text:
+            yield captured_white_text
+            captured_white_text = ""
+    if captured_white_text:
+        yield captured_white_text
+
+
+def compare_white_text(pdf_path: Path) -> tuple[bool, float, float]:
+    """ Whether both implementations capture the same white chars, and their time. Runs are split per line now, so
+    they are compared without the whitespace between them. """
+    reference_seconds = columnar_seconds = 0.0
+    same = True
+    with open_document(pdf_path, "pdfplumber") as pdf:
+        for page in pdf.pages:
+            page.load()
+            page.chars
+            start = time.perf_counter()
+            expected = "".join(reference_extract_white_text_from_page(page))
+            reference_seconds += time.perf_counter() - start
+            start = time.perf_counter()
+            actual = "".join(artifact.text for artifact in extract_white_text_from_page(page))
+            columnar_seconds += time.perf_counter() - start
+            same &= "".join(expected.split()) == "".join(actual.split())
+            page.close()
+    return same, reference_seconds, columnar_seconds
+
+
+def check_covered_text(tmp: Path) -> bool:
+    """ Whether the pymupdf engine finds the text under the image, whatever was drawn before it. """
+    found_all = True
+    for paths_before_text in (0, 50):
+        pdf_path = tmp / f"covered_{paths_before_text}.pdf"
+        make_covered_text_pdf(pdf_path, paths_before_text)
+        covered = covered_text(pdf_path)
+        found = "jan.jansen@example.nl" in covered and "visible" not in covered
+        found_all &= found
+        print(f"{'covered text ok' if found else 'MISSED'}: {paths_before_text} vector paths before the text, found {covered!r}")
+    return found_all
+
+
+def time_detectors(pdf_path: Path, engine: str) -> tuple[float, float]:
+    """ Seconds spent in the hidden text detectors and in the other detectors that do not need OCR. """
+    hidden = [WhiteTextDetector(), InvisibleTextDetector(), CoveredTextDetector()]
+    others = [FilledRectangleDetector(), SignatureDetector(ScannedPDF(pdf_path.as_posix())), TextPIIDetector()]
+    seconds = {id(detector): 0.0 for detector in hidden + others}
+    with open_document(pdf_path, engine) as pdf:
+        for i, page in enumerate(pdf.pages):
+            page.load()
+            for detector in others + hidden:
+                start = time.perf_counter()
+                detector.visit_page(page, i == len(pdf.pages) - 1)
+                seconds[id(detector)] += time.perf_counter() - start
+            page.close()
+    return sum(seconds[id(d)] for d in hidden), sum(seconds[id(d)] for d in others)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=50, help="Pages of the synthetic corpus.")
+    args = parser.parse_args()
+
+    problems = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = Path(tmp) / "corpus.pdf"
+        make_corpus_pdf(corpus, CorpusSpec(pages=args.pages, images_per_page=0))
+        for pdf_path in [*sorted((ROOT / "test" / "data").glob("*.pdf")), corpus]:
+            same, reference_seconds, columnar_seconds = compare_white_text(pdf_path)
+            problems += not same
+            print(f"{'parity ok' if same else 'MISMATCH'}: {pdf_path.name}  white text reference: {reference_seconds:.3f}s  columnar: {columnar_seconds:.3f}s")
+
+        problems += not check_covered_text(Path(tmp))
+
+        for engine in ENGINES:
+            hidden, others = time_detectors(corpus, engine)
+            print(f"{engine}: hidden text detectors {hidden:.3f}s, other detectors without OCR {others:.3f}s ({hidden / others:.0%})")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
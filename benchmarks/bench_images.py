@@ -0,0 +1,75 @@
+""" Benchmark of the image path from PDF stream to OCR input, on an image-heavy scanned PDF.
+
+Compares the old path (Pillow decode, PNG encode, PNG decode on the OCR side) with the NumPy decoder and with MuPDF
+decoding by xref. That both decoders agree on every image kind is checked by test/test_images.py.
+
+    python benchmarks/bench_images.py [--pages 40] [--size 1200]
+"""
+import argparse
+import io
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "test"))
+
+import numpy as np
+import pdfplumber
+from PIL import Image
+
+from images import decode_image, decode_xref, open_fitz_document
+from test_images import make_scanned_pdf
+
+
+def reference_ocr_input(image: dict) -> np.ndarray:
+    """ The old path: Pillow frombytes with L/RGB only, PNG round trip, then the decode easyocr does on the PNG bytes. """
+    attrs = image['stream'].attrs
+    data = image['stream'].get_data()
+    width, height = attrs.get("Width"), attrs.get("Height")
+    if 'DCTDecode' in str(attrs.get("Filter")):
+        pil_image = Image.open(io.BytesIO(data))
+    else:
+        mode = "L" if "DeviceGray" in str(attrs.get("ColorSpace")) else "RGB"
+        expected_len = width * height if mode == "L" else width * height * 3
+        data = data[:expected_len] + b'\x00' * max(0, expected_len - len(data))
+        pil_image = Image.frombytes(mode, (width, height), data)
+    buffer = io.BytesIO()
+    pil_image.save(buffer, format="PNG")
+    return np.asarray(Image.open(io.BytesIO(buffer.getvalue())))
+
+
+def run(pdf_path: Path, decode) -> tuple[float, int]:
+    start = time.perf_counter()
+    pixels = 0
+    with pdfplumber.open(pdf_path) as pdf:
+        for page in pdf.pages:
+            for image in page.images:
+                pixels += decode(image).size
+            page.close()
+    return time.perf_counter() - start, pixels
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--size", type=int, default=1200, help="Image width and height in pixels.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        scanned_pdf = Path(tmp) / "scanned.pdf"
+        make_scanned_pdf(scanned_pdf, args.pages, args.size, ["gray", "rgb", "jpeg"])
+        reference_seconds, _ = run(scanned_pdf, reference_ocr_input)
+        numpy_seconds, _ = run(scanned_pdf, lambda image: decode_image(image).pixels)
+        fitz_doc = open_fitz_document(scanned_pdf)
+        mupdf_seconds, _ = run(scanned_pdf, lambda image: decode_xref(fitz_doc, image['stream'].objid).pixels)
+        fitz_doc.close()
+
+    print(f"{args.pages} pages of {args.size}x{args.size} images (gray, RGB, JPEG)")
+    print(f"PNG round trip: {reference_seconds:.3f}s  NumPy: {numpy_seconds:.3f}s  MuPDF: {mupdf_seconds:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+""" Checks that the time limits are enforced (see `limits.py` and `workers.py`), on a document with one pathological page:
+tens of thousands of vector rectangles, which take pdfplumber seconds to parse.
+
+Runs `main.py` on it without limits, with a page time limit in the main process and on workers, and with a document
+time limit, and reports the wall time, status and skipped pages of each run. Then checks that the pool kills and
+replaces a worker stuck where the limit cannot interrupt it (simulated by blocking SIGALRM), and that the rest of the
+tasks still complete.
+
+    python benchmarks/bench_limits.py [--rects 60000] [--timeout 1]
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pymupdf
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import limits
+import workers
+from classes import LimitsConfiguration
+from workers import WorkerKilled, WorkerPool
+
+
+def make_pathological_pdf(path: Path, rects: int, pages: int = 3):
+    """ A document whose middle page holds `rects` tiny filled rectangles, every page has some PII. """
+    doc = pymupdf.open()
+    for i in range(pages):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Page {i + 1}, contact john.doe@example.com", fontsize=12)
+        if i == pages // 2:
+            shape = page.new_shape()
+            for j in range(rects):
+                x, y = (j * 7) % 500 + 20, (j * 13) % 700 + 20
+                shape.draw_rect(pymupdf.Rect(x, y, x + 1, y + 1))
+            shape.finish(fill=(0, 0, 0))
+            shape.commit()
+    doc.save(path)
+
+
+def run_cli(pdf_path: Path, extra: list[str]) -> tuple[float, dict]:
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "main.py", str(pdf_path), "--no-cache", "-o", tmp, *extra], cwd=ROOT, check=True, capture_output=True)
+        seconds = time.perf_counter() - start
+        with open(Path(tmp) / "results.json") as f:
+            return seconds, json.load(f)[0]
+
+
+def _stuck(seconds: float) -> int:
+    # Like native code that never returns to Python, the page timer cannot interrupt it
+    signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGALRM})
+    time.sleep(seconds)
+    return os.getpid()
+
+
+def check_kill(timeout: float) -> bool:
+    """ Whether a stuck task is killed after the page time limit and the grace period, while the others complete. """
+    with WorkerPool(2, LimitsConfiguration(page_seconds=timeout)) as pool:
+        start = time.perf_counter()
+        stuck = pool.submit(_stuck, 3600)
+        others = [pool.submit(_stuck, 0.1) for _ in range(4)]
+        try:
+            stuck.result()
+            killed = False
+        except WorkerKilled as e:
+            killed = True
+            print(f"stuck worker: {e} after {time.perf_counter() - start:.1f}s")
+        completed = sum(1 for future in others if future.result())
+    print(f"other tasks completed: {completed} of {len(others)}")
+    return killed and completed == len(others)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rects", type=int, default=60000, help="Rectangles on the pathological page.")
+    parser.add_argument("--timeout", type=float, default=1, help="Page and document time limit in seconds.")
+    args = parser.parse_args()
+
+    problems = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = Path(tmp) / "pathological.pdf"
+        make_pathological_pdf(pdf_path, args.rects)
+        timeout = str(args.timeout)
+        runs = [
+            ("no limits", [], "complete"),
+            ("page timeout, in process", ["-w", "0", "--page-timeout", timeout], "page_timeout"),
+            ("page timeout, on workers", ["-w", "2", "--page-timeout", timeout], "page_timeout"),
+            ("document timeout", ["-w", "0", "--doc-timeout", timeout], "timeout"),
+        ]
+        for label, extra, expected in runs:
+            seconds, result = run_cli(pdf_path, extra)
+            problems += result["status"] != expected
+            print(f"{label}: {seconds:.2f}s, status {result['status']} (expected {expected}), skipped pages {result.get('skipped_pages', [])}, {len(result['findings'])} findings")
+
+    # Kill after one second of grace instead of ten, the pool enforces it from this process
+    limits.KILL_GRACE_SECONDS = workers.KILL_GRACE_SECONDS = 1.0
+    problems += not check_kill(args.timeout)
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
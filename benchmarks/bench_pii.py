@@ -0,0 +1,85 @@
+""" Micro-benchmark and parity check for `pii.PIIScanner` against one `re.findall` pass per pattern.
+
+    python benchmarks/bench_pii.py [--megabytes 4]
+"""
+import argparse
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from pii import PIIScanner
+from regexes import re_objects
+
+WORDS = "de het een en van in is op te dat the of and to invoice contract page total amount street".split()
+
+
+def synthetic_text(megabytes: float, seed: int = 0) -> str:
+    """ Page-like text with sparse PII and the long digit/punctuation runs that make the email pattern backtrack. """
+    rng = random.Random(seed)
+    parts, size = [], 0
+    while size < megabytes * 1024 * 1024:
+        roll = rng.random()
+        if roll < 0.002:
+            part = f"{rng.choice(WORDS)}.{rng.choice(WORDS)}@example{rng.randrange(100)}.nl"
+        elif roll < 0.004:
+            part = f"06-{rng.randrange(10**8):08d}"
+        elif roll < 0.006:
+            part = f"{rng.randrange(1000, 9999)} {rng.choice('ABCDEFGH')}{rng.choice('KLMNOPRS')}"
+        elif roll < 0.02:
+            part = "".join(rng.choice("0123456789.-/+") for _ in range(rng.randrange(20, 400)))
+        elif roll < 0.1:
+            part = str(rng.randrange(10**rng.randrange(1, 12)))
+        else:
+            part = rng.choice(WORDS)
+        parts.append(part)
+        parts.append("\n" if rng.random() < 0.08 else " ")
+        size += len(part) + 1
+    return "".join(parts)
+
+
+def reference_scan(text: str) -> list[tuple[str, str, int, int]]:
+    return [
+        (kind, match.group(0), match.start(), match.end())
+        for kind, pattern in re_objects.items()
+        for match in re.compile(pattern).finditer(text)
+        if match.group(0)
+    ]
+
+
+def findall_scan(text: str) -> int:
+    """ What `helpers.extract_pii` used to do. """
+    return sum(len(re.findall(re.compile(pattern), text)) for pattern in re_objects.values())
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--megabytes", type=float, default=4.0)
+    args = parser.parse_args()
+
+    scanner = PIIScanner(re_objects)
+    for pattern in scanner.patterns:
+        print(f"{pattern.kind:>10}: literals={pattern.literals!r} needs_digit={pattern.needs_digit} separators={pattern.separators!r}")
+
+    text = synthetic_text(args.megabytes)
+    expected, reference_seconds = timed(lambda: reference_scan(text))
+    actual, scanner_seconds = timed(lambda: [tuple(match) for match in scanner.scan(text)])
+    assert actual == expected, "Parity failure between PIIScanner and per-pattern finditer"
+    _, findall_seconds = timed(lambda: findall_scan(text))
+
+    print(f"parity ok: {len(actual)} matches in {len(text) / 1024 / 1024:.1f} MB")
+    print(f"findall per pattern: {findall_seconds:.3f}s  finditer per pattern: {reference_seconds:.3f}s  scanner: {scanner_seconds:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
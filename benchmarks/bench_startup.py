@@ -0,0 +1,122 @@
+""" Startup cost of a one-off CLI run against a warm scan server (see `server.py`).
+
+Measures how long `import main` takes and which heavy libraries it loads, the wall time of a cold `main.py` run on one
+document with and without OCR, and for `main.py --serve`: the time until the server answers /health and the latency of
+scanning the same document once it is warm. Every measurement runs in a fresh interpreter with the current environment.
+
+    python benchmarks/bench_startup.py [--runs 3] [--workers 0] [PDF]
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+DOCUMENT = ROOT / "test" / "data" / "testdoc.pdf"
+
+# Libraries that should only be imported by the stage that needs them
+HEAVY_MODULES = ("easyocr", "torch", "pymupdf", "pdfplumber", "pdfminer", "cv2")
+
+IMPORT_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import main
+print(time.perf_counter() - start)
+print(",".join(name for name in {heavy!r} if name in sys.modules))
+"""
+
+
+class _UnixConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+def _request(address: str, method: str, url: str, body: dict = None, timeout: float = 600) -> tuple[int, dict]:
+    connection = _UnixConnection(address, timeout)
+    try:
+        connection.request(method, url, body=json.dumps(body) if body is not None else None, headers={"Content-Type": "application/json"})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        connection.close()
+
+
+def time_import(runs: int) -> tuple[float, str]:
+    seconds, loaded = [], ""
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT.format(heavy=HEAVY_MODULES)], cwd=ROOT, capture_output=True, text=True, check=True).stdout.split("\n")
+        seconds.append(float(output[0]))
+        loaded = output[1]
+    return statistics.median(seconds), loaded or "none"
+
+
+def time_cli(pdf_path: Path, runs: int, workers: int, extra: list[str]) -> float:
+    seconds = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for _ in range(runs):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "main.py", str(pdf_path), "-w", str(workers), "--no-cache", "-o", tmp, *extra], cwd=ROOT, check=True)
+            seconds.append(time.perf_counter() - start)
+    return statistics.median(seconds)
+
+
+def time_server(pdf_path: Path, runs: int, workers: int, extra: list[str]) -> tuple[float, float, float]:
+    """ Seconds until the server is healthy, and the latency of its first and of its median later scan. """
+    with tempfile.TemporaryDirectory() as tmp:
+        address = os.path.join(tmp, "scan.sock")
+        start = time.perf_counter()
+        server = subprocess.Popen([sys.executable, "main.py", "--serve", address, "-w", str(workers), "--no-cache", "-o", tmp, *extra], cwd=ROOT)
+        try:
+            while True:
+                if server.poll() is not None:
+                    raise RuntimeError(f"The server exited with status {server.returncode}")
+                try:
+                    if _request(address, "GET", "/health", timeout=1)[0] == 200:
+                        break
+                except OSError:
+                    time.sleep(0.05)
+            ready = time.perf_counter() - start
+
+            latencies = []
+            for _ in range(runs + 1):
+                start = time.perf_counter()
+                status, data = _request(address, "POST", "/scan", {"path": str(pdf_path.resolve())})
+                if status != 200:
+                    raise RuntimeError(f"Scan failed with status {status}: {data.get('error')}")
+                latencies.append(time.perf_counter() - start)
+        finally:
+            server.terminate()
+            server.wait()
+    return ready, latencies[0], statistics.median(latencies[1:])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("document", type=Path, nargs="?", default=DOCUMENT)
+    parser.add_argument("--runs", type=int, default=3, help="Runs per measurement, the median is reported.")
+    parser.add_argument("-w", "--workers", type=int, default=0, help="Worker processes of the CLI runs and the server.")
+    args = parser.parse_args()
+
+    seconds, loaded = time_import(args.runs)
+    print(f"import main: {seconds * 1000:.0f}ms, heavy modules loaded: {loaded}")
+    for label, extra in (("with OCR", []), ("without OCR", ["--no-regex"])):
+        cli = time_cli(args.document, args.runs, args.workers, extra)
+        ready, first, warm = time_server(args.document, args.runs, args.workers, extra)
+        print(f"{label}: cold CLI run {cli:.2f}s | server ready after {ready:.2f}s, first scan {first:.3f}s, warm scan {warm:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+""" Throughput benchmark of every detector stage on a synthetic corpus (see `synthetic.py`).
+
+Each stage runs in a fresh process, so that its peak RSS is its own. The OCR model is loaded before the clock starts,
+as a long-running worker would have it loaded already. The report is JSON with pages/sec and peak RSS per stage.
+With --baseline it is compared to an earlier report, and the script exits with status 1 when a stage got slower or
+bigger than the tolerance allows.
+
+    python benchmarks/bench_suite.py [--pages 20] [--engine pymupdf] [--output report.json] [--baseline old.json]
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing as mp
+import platform
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from synthetic import add_spec_arguments, make_corpus_pdf, spec_from_args
+
+STAGES = ["filled_rectangles", "text", "pii", "images", "process_pdf"]
+MIN_SECONDS = 0.5
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+async def _consume(async_iterator) -> int:
+    return len([item async for item in async_iterator])
+
+
+def _run_stage(stage: str, pdf_path: Path, engine: str, gpu: bool) -> dict:
+    """ Times one stage on the whole document, inside a worker process. """
+    import helpers
+    from backends import open_document
+    from classes import OCRConfiguration
+    from ocr import get_ocr_service
+
+    ocr_config = OCRConfiguration(gpu=gpu)
+    if stage in ("images", "process_pdf"):
+        get_ocr_service(ocr_config).reader
+    texts = []
+    rounds = 1
+    with open_document(pdf_path, engine) as pdf:
+        pages = len(pdf.pages)
+        if stage == "pii":
+            texts = [artifact.text for artifact in helpers.extract_text_from_pdf(pdf)]
+
+    start_rss = _peak_rss_mb()
+    start = time.perf_counter()
+    if stage == "pii":
+        # Matching is too fast for a single pass to be timed reliably, repeat it for at least MIN_SECONDS
+        rounds = 0
+        while rounds == 0 or time.perf_counter() - start < MIN_SECONDS:
+            items = sum(len(list(helpers.extract_pii(text))) for text in texts)
+            rounds += 1
+    elif stage == "process_pdf":
+        with tempfile.TemporaryDirectory() as output_dir:
+            scanned_pdf = asyncio.run(helpers.process_pdf(pdf_path, True, Path(output_dir), ocr_config, engine=engine))
+        items = len(scanned_pdf.findings)
+    else:
+        with open_document(pdf_path, engine) as pdf:
+            if stage == "filled_rectangles":
+                items = len(list(helpers.extract_text_inside_filled_rectangles(pdf, None)))
+            elif stage == "text":
+                items = len(list(helpers.extract_text_from_pdf(pdf)))
+            else:
+                items = asyncio.run(_consume(helpers.extract_images_from_pdf(pdf, ocr_config)))
+    seconds = time.perf_counter() - start
+
+    return {
+        "stage": stage,
+        "pages": pages,
+        "items": items,
+        "rounds": rounds,
+        "seconds": round(seconds, 4),
+        "pages_per_second": round(pages * rounds / seconds, 2) if seconds else None,
+        "start_rss_mb": round(start_rss, 1),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+    }
+
+
+def run_suite(pdf_path: Path, stages: list[str], engine: str, gpu: bool, repeat: int) -> list[dict]:
+    results = []
+    for stage in stages:
+        runs = []
+        for _ in range(repeat):
+            with ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context("spawn")) as pool:
+                runs.append(pool.submit(_run_stage, stage, pdf_path, engine, gpu).result())
+        best = min(runs, key=lambda run: run["seconds"])
+        print(f"{stage:>18}: {best['pages_per_second']:>8} pages/s  {best['seconds']:>8}s  peak RSS {best['peak_rss_mb']} MB", file=sys.stderr)
+        results.append(best)
+    return results
+
+
+def regressions(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    """ The stages that are more than `tolerance` (a fraction) slower or bigger than in the baseline report. """
+    found = []
+    before = {stage["stage"]: stage for stage in baseline["stages"]}
+    for stage in report["stages"]:
+        old = before.get(stage["stage"])
+        if old is None:
+            continue
+        if old["pages_per_second"] and stage["pages_per_second"] < old["pages_per_second"] * (1 - tolerance):
+            found.append(f"{stage['stage']}: {stage['pages_per_second']} pages/s, was {old['pages_per_second']}")
+        if stage["peak_rss_mb"] > old["peak_rss_mb"] * (1 + tolerance):
+            found.append(f"{stage['stage']}: peak RSS {stage['peak_rss_mb']} MB, was {old['peak_rss_mb']}")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_spec_arguments(parser)
+    parser.add_argument("--stages", type=str, default=",".join(STAGES), help=f"Comma-separated stages to run (default: all of {','.join(STAGES)}).")
+    parser.add_argument("--engine", type=str, default="pdfplumber")
+    parser.add_argument("--no-gpu", action="store_true")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per stage, the fastest is reported.")
+    parser.add_argument("--output", type=Path, default=None, help="Write the JSON report here instead of to stdout.")
+    parser.add_argument("--baseline", type=Path, default=None, help="An earlier JSON report to check for regressions.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown and RSS growth against the baseline (default: 0.2).")
+    args = parser.parse_args()
+
+    stages = [stage.strip() for stage in args.stages.split(",") if stage.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"Unknown stages: {', '.join(sorted(unknown))}")
+
+    spec = spec_from_args(args)
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = Path(tmp) / "corpus.pdf"
+        make_corpus_pdf(pdf_path, spec)
+        report = {
+            "corpus": spec.to_dict(),
+            "engine": args.engine,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "stages": run_suite(pdf_path, stages, args.engine, not args.no_gpu, args.repeat),
+        }
+
+    payload = json.dumps(report, indent=4)
+    if args.output:
+        args.output.write_text(payload)
+    else:
+        print(payload)
+
+    if args.baseline:
+        found = regressions(report, json.loads(args.baseline.read_text()), args.tolerance)
+        for regression in found:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        sys.exit(1 if found else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+""" Deterministic synthetic PDFs for the benchmarks.
+
+A document has `pages` pages of prose in which a `pii_density` fraction of the lines carries a PII value matched by
+`regexes.py`. Every page also gets `rects_per_page` dark filled rectangles drawn over a line of text, `white_lines_per_page`
+lines of white text and `images_per_page` raster images with PII rendered into them. The same spec and seed always give
+the same document.
+
+    python benchmarks/synthetic.py OUT.pdf [--pages 20] [--rects-per-page 2] [--images-per-page 1] ...
+"""
+import argparse
+import io
+import random
+from pathlib import Path
+
+import pymupdf as fitz
+from PIL import Image, ImageDraw
+
+WORDS = (
+    "de het een en van in is op te dat the of and to invoice contract page total amount street payment customer "
+    "agreement delivery account number reference period statement balance"
+).split()
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842
+MARGIN = 40
+FONT_SIZE = 9
+LINE_HEIGHT = 12
+
+
+class CorpusSpec:
+    def __init__(self, pages: int = 20, rects_per_page: int = 2, white_lines_per_page: int = 2, images_per_page: int = 1, pii_density: float = 0.1, seed: int = 0):
+        self.pages: int = pages
+        self.rects_per_page: int = rects_per_page
+        self.white_lines_per_page: int = white_lines_per_page
+        self.images_per_page: int = images_per_page
+        self.pii_density: float = pii_density
+        self.seed: int = seed
+
+    def to_dict(self) -> dict:
+        return dict(vars(self))
+
+
+def pii_value(rng: random.Random) -> str:
+    """ A random value of one of the kinds in `regexes.re_objects`. """
+    kind = rng.choice(("email", "phone", "postcode", "bsn", "address"))
+    if kind == "email":
+        return f"{rng.choice(WORDS)}.{rng.choice(WORDS)}@example{rng.randrange(100)}.nl"
+    if kind == "phone":
+        return f"06-{rng.randrange(10**8):08d}"
+    if kind == "postcode":
+        return f"{rng.randrange(1000, 9999)} {rng.choice('ABCDEFGH')}{rng.choice('KLMNOPRS')}"
+    if kind == "bsn":
+        return f"{rng.randrange(10**8, 10**9)}"
+    return f"{rng.randrange(1, 999)} {rng.choice(WORDS)} {rng.choice(WORDS)}, Amsterdam {rng.randrange(10000, 99999)}"
+
+
+def text_line(rng: random.Random, pii_density: float) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randrange(8, 14))]
+    if rng.random() < pii_density:
+        words.insert(rng.randrange(len(words)), pii_value(rng))
+    return " ".join(words)
+
+
+def pii_image(rng: random.Random, width: int = 480, height: int = 120) -> bytes:
+    """ A PNG 'scan' of a few lines of text with a PII value in it. """
+    image = Image.new("L", (width, height), 245)
+    draw = ImageDraw.Draw(image)
+    for i in range(3):
+        line = f"{rng.choice(WORDS)} {rng.choice(WORDS)}: {pii_value(rng)}" if i == 1 else text_line(rng, 0)
+        draw.text((10, 10 + i * 35), line, fill=20)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _append_content(doc, page, content: str):
+    """ Draws raw operators on top of the page. PyMuPDF's own draw_rect writes `re h f`, which pdfminer does not
+    recognise as a rectangle, while PDF producers write `re f`. """
+    xref = doc.get_new_xref()
+    doc.update_object(xref, "<< >>")
+    doc.update_stream(xref, content.encode())
+    contents = page.get_contents() + [xref]
+    doc.xref_set_key(page.xref, "Contents", "[" + " ".join(f"{x} 0 R" for x in contents) + "]")
+
+
+def make_corpus_pdf(path: Path, spec: CorpusSpec):
+    rng = random.Random(spec.seed)
+    doc = fitz.open()
+    lines_per_page = (PAGE_HEIGHT - 2 * MARGIN) // LINE_HEIGHT
+    for _ in range(spec.pages):
+        page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+        special = rng.sample(range(lines_per_page), min(lines_per_page, spec.rects_per_page + spec.white_lines_per_page))
+        redacted, white = set(special[:spec.rects_per_page]), set(special[spec.rects_per_page:])
+        image_rows = [rng.randrange(lines_per_page - 10) for _ in range(spec.images_per_page)]
+
+        rects = []
+        for row in range(lines_per_page):
+            if any(start <= row < start + 10 for start in image_rows):
+                continue
+            baseline = MARGIN + (row + 1) * LINE_HEIGHT
+            line = text_line(rng, spec.pii_density)
+            color = (1, 1, 1) if row in white else (0, 0, 0)
+            page.insert_text((MARGIN, baseline), line, fontsize=FONT_SIZE, color=color)
+            if row in redacted:
+                # Covers the whole char boxes, from below the descent to a font size above it (PDF space, origin bottom left)
+                width = fitz.get_text_length(line, fontsize=FONT_SIZE)
+                rects.append(f"{MARGIN - 2} {PAGE_HEIGHT - baseline - 4} {width + 4:.2f} {FONT_SIZE + 6} re f")
+        if rects:
+            _append_content(doc, page, "q 0 g " + " ".join(rects) + " Q")
+
+        for start in image_rows:
+            top = MARGIN + start * LINE_HEIGHT
+            page.insert_image(fitz.Rect(MARGIN, top, MARGIN + 480 * 0.75, top + 120 * 0.75), stream=pii_image(rng))
+    doc.save(path)
+    doc.close()
+
+
+def add_spec_arguments(parser: argparse.ArgumentParser):
+    defaults = CorpusSpec()
+    parser.add_argument("--pages", type=int, default=defaults.pages)
+    parser.add_argument("--rects-per-page", type=int, default=defaults.rects_per_page, help="Dark filled rectangles over text per page.")
+    parser.add_argument("--white-lines-per-page", type=int, default=defaults.white_lines_per_page)
+    parser.add_argument("--images-per-page", type=int, default=defaults.images_per_page, help="Raster images with PII per page.")
+    parser.add_argument("--pii-density", type=float, default=defaults.pii_density, help="Fraction of text lines with a PII value.")
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+
+
+def spec_from_args(args: argparse.Namespace) -> CorpusSpec:
+    return CorpusSpec(args.pages, args.rects_per_page, args.white_lines_per_page, args.images_per_page, args.pii_density, args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("output", type=Path)
+    add_spec_arguments(parser)
+    args = parser.parse_args()
+    make_corpus_pdf(args.output, spec_from_args(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from classes import CacheConfiguration
+from regexes import re_objects
+
+# Bump whenever the layout of ScannedPDF.to_dict() or the detectors change in a way that invalidates stored results
+CACHE_FORMAT_VERSION = 4
+# The columns of the results table, a table with others is dropped and created again
+_COLUMNS = ("key", "result", "size", "created", "accessed")
+
+
+def file_digest(path: Path, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def settings_fingerprint(settings: dict) -> str:
+    """ Fingerprints everything besides the file content that determines a result: the PII patterns and detector settings. """
+    payload = json.dumps({"version": CACHE_FORMAT_VERSION, "patterns": re_objects, "settings": settings}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResultCache:
+    """ A persistent SQLite cache of `ScannedPDF.to_dict()` results, keyed by file content hash and settings fingerprint.
+
+    Safe to share between worker processes: every process opens its own connection and SQLite serialises the writes.
+    A connection can only be used by the thread that opened it, see `get_result_cache`. A file that is not a readable
+    cache, such as a damaged one or one with another layout, is replaced by an empty cache.
+    """
+
+    def __init__(self, path: Path):
+        self.path: Path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            self._connection = self._open()
+        except sqlite3.DatabaseError as e:
+            # Not a SQLite file or a damaged one. Every result in it can be computed again
+            logging.warning(f"Rebuilding unreadable result cache {self.path}: {e}")
+            for stale in (self.path, self.path.with_name(self.path.name + "-wal"), self.path.with_name(self.path.name + "-shm")):
+                stale.unlink(missing_ok=True)
+            self._connection = self._open()
+
+    def _open(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            columns = tuple(row[1] for row in connection.execute("PRAGMA table_info(results)"))
+            if columns and columns != _COLUMNS:
+                logging.warning(f"Rebuilding result cache {self.path}, its table has the columns of another version")
+                connection.execute("DROP TABLE results")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " key TEXT PRIMARY KEY, result TEXT NOT NULL, size INTEGER NOT NULL,"
+                " created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+        except sqlite3.DatabaseError:
+            connection.close()
+            raise
+        return connection
+
+    @staticmethod
+    def key_for(pdf_path: Path, settings: dict) -> str:
+        return f"{file_digest(pdf_path)}:{settings_fingerprint(settings)}"
+
+    def get(self, key: str) -> Optional[dict]:
+        row = self._connection.execute("SELECT result FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self._connection.execute("UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    def put(self, key: str, result: dict):
+        payload = json.dumps(result)
+        now = time.time()
+        self._connection.execute(
+            "INSERT OR REPLACE INTO results (key, result, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+            (key, payload, len(payload), now, now),
+        )
+
+    def evict(self, max_size_mb: float, max_age_days: float) -> int:
+        """ Removes entries not used for `max_age_days`, then the least recently used ones until the cache fits in `max_size_mb`. """
+        evicted = 0
+        if max_age_days > 0:
+            cutoff = time.time() - max_age_days * 24 * 3600
+            evicted += self._connection.execute("DELETE FROM results WHERE accessed < ?", (cutoff,)).rowcount
+
+        if max_size_mb > 0:
+            max_size = max_size_mb * 1024 * 1024
+            total = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+            if total > max_size:
+                doomed = []
+                for key, size in self._connection.execute("SELECT key, size FROM results ORDER BY accessed ASC"):
+                    if total <= max_size:
+                        break
+                    doomed.append((key,))
+                    total -= size
+                self._connection.executemany("DELETE FROM results WHERE key = ?", doomed)
+                evicted += len(doomed)
+
+        if evicted:
+            logging.info(f"Evicted {evicted} entries from result cache {self.path}")
+        return evicted
+
+    def close(self):
+        self._connection.close()
+
+
+class _ThreadCaches(threading.local):
+    def __init__(self):
+        self.by_path: dict[Path, ResultCache] = {}
+
+
+# Per thread, the request threads of a `--serve` server each need their own connection. It is closed with its thread
+_caches = _ThreadCaches()
+
+
+def get_result_cache(config: CacheConfiguration) -> ResultCache:
+    """ Returns the result cache connection of this thread, opening it on first use. """
+    if config.path not in _caches.by_path:
+        _caches.by_path[config.path] = ResultCache(config.path)
+    return _caches.by_path[config.path]
@@ -1,23 +1,98 @@
 
 from datetime import datetime
 import enum
-from typing import Optional
+from typing import Iterable, Optional
 from pathlib import Path
 
+class OCRConfiguration():
+    def __init__(self, languages: Optional[list[str]] = None, batch_size: int = 8, gpu: bool = True, cache_size: int = 4096, cache_path: Optional[Path] = None,
+                 min_image_side: int = 20, max_aspect_ratio: float = 40, min_entropy: float = 0.1, text_layer_chars: int = 20, max_images: int = 0, max_seconds: float = 0):
+        self.languages: list[str] = languages or ['en', 'nl']
+        self.batch_size: int = batch_size
+        self.gpu: bool = gpu
+        self.cache_size: int = cache_size
+        self.cache_path: Optional[Path] = cache_path
+        # Triage (see `triage.ImageTriage`), 0 disables a check
+        self.min_image_side: int = min_image_side
+        self.max_aspect_ratio: float = max_aspect_ratio
+        self.min_entropy: float = min_entropy
+        self.text_layer_chars: int = text_layer_chars
+        # Budget per document, 0 for no limit
+        self.max_images: int = max_images
+        self.max_seconds: float = max_seconds
+
+    def triage_settings(self) -> dict:
+        return {
+            "min_image_side": self.min_image_side,
+            "max_aspect_ratio": self.max_aspect_ratio,
+            "min_entropy": self.min_entropy,
+            "text_layer_chars": self.text_layer_chars,
+            "max_images": self.max_images,
+            "max_seconds": self.max_seconds,
+        }
+
+class CacheConfiguration():
+    def __init__(self, path: Path, enabled: bool = True, rebuild: bool = False, max_size_mb: float = 1024, max_age_days: float = 30):
+        self.path: Path = path
+        self.enabled: bool = enabled
+        self.rebuild: bool = rebuild
+        self.max_size_mb: float = max_size_mb
+        self.max_age_days: float = max_age_days
+
+class LimitsConfiguration():
+    def __init__(self, page_seconds: float = 0, document_seconds: float = 0, memory_mb: float = 0):
+        # 0 for no limit, see `limits.PageGuard` and `workers.WorkerPool`
+        self.page_seconds: float = page_seconds
+        self.document_seconds: float = document_seconds
+        self.memory_mb: float = memory_mb
+
+    @property
+    def enabled(self) -> bool:
+        return self.page_seconds > 0 or self.document_seconds > 0 or self.memory_mb > 0
+
 class ExecutionConfiguration():
-    def __init__(self, pdf_files: list[Path], output_dir:Path, do_execute_regex:bool=True):
-        self.pdf_files: list[Path] = pdf_files
+    def __init__(self, pdf_files: Iterable[Path], output_dir:Path, do_execute_regex:bool=True, workers:int=1, ocr: Optional[OCRConfiguration]=None, cache: Optional[CacheConfiguration]=None, stream_results: bool=False, resume: bool=False, fsync_interval: float=5.0, engine: str="pdfplumber", profile: bool=False, shard_pages: int=200, keep_page_text: bool=False, order: str="discovery", serve: Optional[str]=None, limits: Optional[LimitsConfiguration]=None, allow_remote: bool=False):
+        # Consumed lazily, directories are still being scanned while the first documents are processed
+        self.pdf_files: Iterable[Path] = pdf_files
         self.output_dir: Path = output_dir
         self.do_execute_regex: bool = do_execute_regex
+        self.workers: int = workers
+        self.ocr: OCRConfiguration = ocr or OCRConfiguration()
+        self.cache: CacheConfiguration = cache or CacheConfiguration(output_dir / "results_cache.sqlite", enabled=False)
+        self.stream_results: bool = stream_results
+        self.resume: bool = resume
+        self.fsync_interval: float = fsync_interval
+        self.engine: str = engine
+        self.profile: bool = profile
+        self.shard_pages: int = shard_pages
+        self.keep_page_text: bool = keep_page_text
+        self.order: str = order
+        self.serve: Optional[str] = serve
+        self.allow_remote: bool = allow_remote
+        self.limits: LimitsConfiguration = limits or LimitsConfiguration()
 
 class ArtifactType(enum.Enum):
     UNSPECIFIED = "unspecified"
     REGULAR_TEXT = "text"
     IMAGE = "image"
     WHITE_TEXT = "white_text"
+    INVISIBLE_TEXT = "invisible_text"
+    COVERED_TEXT = "covered_text"
     FILLED_RECTANGLE = "filled_rectangle"
     POTENTIAL_SIGNATURE = "potential_signature"
 
+class ProcessingStatus(enum.Enum):
+    """ How far processing a document got, from best to worst. """
+    COMPLETE = "complete"
+    PAGE_TIMEOUT = "page_timeout"  # pages that ran out of time were skipped, the others are complete
+    TIMEOUT = "timeout"  # the document ran out of time, its remaining pages were not processed
+    MEMORY_LIMIT = "memory_limit"  # the document ran out of memory, its remaining pages were not processed
+    KILLED = "killed"  # the worker was killed or died, nothing was found
+
+    def worst(self, other: 'ProcessingStatus') -> 'ProcessingStatus':
+        statuses = list(ProcessingStatus)
+        return max(self, other, key=statuses.index)
+
 class ExtractedArtifact:
     def __init__(self, page_number, text, object_ref=None, description="", artifact_type: ArtifactType = ArtifactType.UNSPECIFIED):
         self.page_number : int = page_number
@@ -38,22 +113,38 @@ class ExtractedArtifact:
     def __repr__(self):
         return f"ExtractedArtifact(page_number={self.page_number}, text_length={len(self.text)}, object_ref={self.object_ref}, description={self.description})"
 
+# Chars of context kept on either side of a match in a finding's snippet
+SNIPPET_CONTEXT = 60
+
+def snippet(text: str, start: int, end: int) -> str:
+    return text[max(0, start - SNIPPET_CONTEXT):end + SNIPPET_CONTEXT]
+
 class PossibleArtifactFinding():
-    def __init__(self, page_number, text, artifact_type: ArtifactType, matched_data: str, matched_data_type: str):
+    """ A match of `matched_data` at chars `start` to `end` of the text of an artifact (the page text, the recognised
+    text of an image, ...). `text` is a snippet of that text around the match, not the whole of it. """
+    __slots__ = ("page_number", "text", "artifact_type", "matched_data", "matched_data_type", "start", "end")
+
+    def __init__(self, page_number, text, artifact_type: ArtifactType, matched_data: str, matched_data_type: str, start: int = 0, end: Optional[int] = None):
         self.page_number : int = page_number
         self.text : str = text
         self.artifact_type = artifact_type
         self.matched_data = matched_data
         self.matched_data_type = matched_data_type
+        self.start : int = start
+        self.end : int = end if end is not None else start + len(matched_data)
 
     @staticmethod
-    def from_extracted_artifact(extracted_artifact: ExtractedArtifact, matched_data: str, matched_data_type: str) -> 'PossibleArtifactFinding':
+    def from_extracted_artifact(extracted_artifact: ExtractedArtifact, matched_data: str, matched_data_type: str, start: int = 0, end: Optional[int] = None, text: Optional[str] = None) -> 'PossibleArtifactFinding':
+        """ `text` is the text the match was found in, the artifact's own text by default. """
+        end = end if end is not None else start + len(matched_data)
         return PossibleArtifactFinding(
             page_number=extracted_artifact.page_number,
-            text=extracted_artifact.text,
+            text=snippet(text if text is not None else extracted_artifact.text, start, end),
             artifact_type=extracted_artifact.artifact_type,
             matched_data=matched_data,
-            matched_data_type=matched_data_type
+            matched_data_type=matched_data_type,
+            start=start,
+            end=end,
         )
     
     def to_dict(self):
@@ -62,11 +153,25 @@ class PossibleArtifactFinding():
             "text": self.text,
             "artifact_type": self.artifact_type.value,
             "matched_data": self.matched_data,
-            "matched_data_type": self.matched_data_type
+            "matched_data_type": self.matched_data_type,
+            "start": self.start,
+            "end": self.end,
         }
+
+    @staticmethod
+    def from_dict(data: dict) -> 'PossibleArtifactFinding':
+        return PossibleArtifactFinding(
+            page_number=data["page_number"],
+            text=data["text"],
+            artifact_type=ArtifactType(data["artifact_type"]),
+            matched_data=data["matched_data"],
+            matched_data_type=data["matched_data_type"],
+            start=data.get("start", 0),
+            end=data.get("end"),
+        )
     
 class ScannedPDF:
-    def __init__(self, path: str, author: str = "", title: str = "", subject: str = "", keywords: str = "", producer: str = "", creator: str = "", creation_date : datetime = None, modification_date : datetime = None, potential_signatures: bool=False):
+    def __init__(self, path: str, author: str = "", title: str = "", subject: str = "", keywords: str = "", producer: str = "", creator: str = "", creation_date : datetime = None, modification_date : datetime = None, potential_signatures: Optional[bool]=False):
         self.path: str = path
         self.author: str = author
         self.title: str = title
@@ -74,16 +179,24 @@ class ScannedPDF:
         self.keywords: str = keywords
         self.producer: str = producer
         self.creator: str = creator
-        self.potential_signatures: bool = potential_signatures
+        # None when the last page was not checked, e.g. because its worker was killed
+        self.potential_signatures: Optional[bool] = potential_signatures
         self.creation_date : Optional[datetime] = creation_date
         self.modification_date : Optional[datetime] = modification_date
         self.findings : list[PossibleArtifactFinding] = []
+        self.stats : dict[str, int] = {}
+        self.profile : Optional[dict] = None
+        # The text of every page by page number, only kept when requested
+        self.page_texts : dict[int, str] = {}
+        self.status : ProcessingStatus = ProcessingStatus.COMPLETE
+        # Pages skipped because they ran out of time
+        self.skipped_pages : list[int] = []
 
     def add_findings(self, findings: list[PossibleArtifactFinding]):
         self.findings = findings
 
     def to_dict(self):
-        return {
+        data = {
             "path": self.path,
             "author": self.author,
             "title": self.title,
@@ -94,5 +207,46 @@ class ScannedPDF:
             "producer": self.producer,
             "creator": self.creator,
             "potential_signatures": self.potential_signatures,
+            "status": self.status.value,
+            "stats": self.stats,
             "findings": [finding.to_dict() for finding in self.findings]
-        }
\ No newline at end of file
+        }
+        if self.skipped_pages:
+            data["skipped_pages"] = self.skipped_pages
+        if self.page_texts:
+            data["page_texts"] = {str(page): text for page, text in self.page_texts.items()}
+        if self.profile is not None:
+            data["profile"] = self.profile
+        return data
+
+    @staticmethod
+    def from_dict(data: dict) -> 'ScannedPDF':
+        scanned_pdf = ScannedPDF(
+            path=data["path"],
+            author=data["author"],
+            title=data["title"],
+            subject=data["subject"],
+            keywords=data["keywords"],
+            producer=data["producer"],
+            creator=data["creator"],
+            creation_date=datetime.fromisoformat(data["creation_date"]) if data["creation_date"] else None,
+            modification_date=datetime.fromisoformat(data["modification_date"]) if data["modification_date"] else None,
+            potential_signatures=data["potential_signatures"],
+        )
+        scanned_pdf.stats = data.get("stats", {})
+        scanned_pdf.profile = data.get("profile")
+        scanned_pdf.page_texts = {int(page): text for page, text in data.get("page_texts", {}).items()}
+        scanned_pdf.status = ProcessingStatus(data.get("status", ProcessingStatus.COMPLETE.value))
+        scanned_pdf.skipped_pages = data.get("skipped_pages", [])
+        scanned_pdf.add_findings([PossibleArtifactFinding.from_dict(finding) for finding in data["findings"]])
+        return scanned_pdf
+
+class ProcessingResult:
+    def __init__(self, pdf_path: Path, scanned_pdf: Optional[ScannedPDF] = None, error: Optional[str] = None):
+        self.pdf_path: Path = pdf_path
+        self.scanned_pdf: Optional[ScannedPDF] = scanned_pdf
+        self.error: Optional[str] = error
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
@@ -0,0 +1,23 @@
+import argparse
+import logging
+from pathlib import Path
+
+from results import JSON_RESULTS, JSONL_RESULTS, compact_results
+
+logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def main():
+    parser = argparse.ArgumentParser(description=f"Compacts the {JSONL_RESULTS} of a streamed run into {JSON_RESULTS}.")
+    parser.add_argument("output_dir", type=str, help=f"The output directory containing {JSONL_RESULTS}.")
+    args = parser.parse_args()
+
+    output_dir = Path(args.output_dir)
+    jsonl_path = output_dir / JSONL_RESULTS
+    if not jsonl_path.is_file():
+        raise ValueError(f"No {JSONL_RESULTS} found in: {output_dir}")
+
+    count = compact_results(jsonl_path, output_dir / JSON_RESULTS)
+    logging.info(f"Wrote {count} results to {output_dir / JSON_RESULTS}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import logging
+import os
+from fnmatch import fnmatchcase
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from backends import DEFAULT_ENGINE, UnreadablePDF, page_count
+
+DEFAULT_INCLUDE = ["*.pdf"]
+ORDERS = ["discovery", "size", "pages"]
+
+
+def _matches(relative: str, name: str, patterns: list[str]) -> bool:
+    # Case-insensitive, so that "*.pdf" also finds "SCAN.PDF"; a pattern may match the path below the root or the name
+    relative, name = relative.lower(), name.lower()
+    return any(fnmatchcase(relative, pattern) or fnmatchcase(name, pattern) for pattern in patterns)
+
+
+def _walk(root: Path, include: list[str], exclude: list[str]) -> Iterator[Path]:
+    """ Yields the files below `root` matching `include` and not `exclude`, depth first, as the directories are read. """
+    include = [pattern.lower() for pattern in include]
+    exclude = [pattern.lower() for pattern in exclude]
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = os.scandir(directory)
+        except OSError as e:
+            logging.warning(f"Cannot read directory {directory}: {e}")
+            continue
+        subdirectories = []
+        with entries:
+            for entry in entries:
+                relative = Path(entry.path).relative_to(root).as_posix()
+                try:
+                    # Symbolic links to directories are not followed, they can form cycles
+                    if entry.is_dir(follow_symlinks=False):
+                        if not _matches(relative, entry.name, exclude):
+                            subdirectories.append(Path(entry.path))
+                    elif entry.is_file() and _matches(relative, entry.name, include) and not _matches(relative, entry.name, exclude):
+                        yield Path(entry.path)
+                except OSError as e:
+                    logging.warning(f"Cannot read {entry.path}: {e}")
+        # Reversed, so that subdirectories are visited in the order they were listed
+        stack.extend(reversed(subdirectories))
+
+
+def discover_pdfs(paths: Iterable[Path], include: list[str] = None, exclude: list[str] = None) -> Iterator[Path]:
+    """ Yields the PDF files to process while the directories are still being scanned.
+
+    Files given explicitly are always yielded. Directories are searched recursively for files matching one of the
+    `include` globs (default: `*.pdf`) and none of the `exclude` globs. Globs are matched case-insensitively against the
+    path below the directory and against the file name; a directory matching an `exclude` glob is not searched at all.
+    """
+    include = include or DEFAULT_INCLUDE
+    exclude = exclude or []
+    for path in paths:
+        if path.is_dir():
+            found = 0
+            for pdf_path in _walk(path, include, exclude):
+                found += 1
+                yield pdf_path
+            logging.debug(f"Found {found} PDF files in directory: {path}")
+        else:
+            logging.debug(f"Processing single PDF file: {path}")
+            yield path
+
+
+def _size(path: Path) -> int:
+    try:
+        return path.stat().st_size
+    except OSError:
+        return 0
+
+
+def _pages(path: Path, engine: str) -> int:
+    try:
+        return page_count(path, engine)
+    except UnreadablePDF:
+        logging.debug(f"Could not count the pages of {path}", exc_info=True)
+        return 0
+
+
+def schedule(pdf_files: Iterable[Path], order: str = "discovery", engine: str = DEFAULT_ENGINE) -> Iterable[Path]:
+    """ Orders the documents to process: as discovered, or largest first by file size or page count.
+
+    Largest first shortens the tail of a run, as the big documents no longer start last, but it has to wait for the
+    whole discovery to finish before the first document can start.
+    """
+    if order == "discovery":
+        return pdf_files
+    if order == "size":
+        return sorted(pdf_files, key=_size, reverse=True)
+    if order == "pages":
+        return sorted(pdf_files, key=lambda path: _pages(path, engine), reverse=True)
+    raise ValueError(f"Unknown order: {order}")
@@ -0,0 +1,201 @@
+import asyncio
+import logging
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+from backends import DEFAULT_ENGINE, UnreadablePDF, page_count
+from classes import OCRConfiguration, ProcessingResult, ProcessingStatus, ScannedPDF
+from helpers import merge_shards, process_pdf
+from ocr import get_ocr_service
+from workers import WorkerKilled, WorkerPool
+
+# The keyword arguments of `process_pdf` that determine its result, passed on to `merge_shards`
+_RESULT_SETTINGS = ("do_regex", "ocr_config", "cache_config", "engine", "keep_page_text")
+
+
+def _result_settings(kwargs: dict) -> dict:
+    return {key: kwargs[key] for key in _RESULT_SETTINGS if key in kwargs}
+
+
+def _process_pdf_in_worker(pdf_path: Path, kwargs: dict, pages: Optional[slice] = None, deadline: Optional[float] = None) -> ProcessingResult:
+    """ Runs `process_pdf` for a single document, or one page-range shard of it by `deadline`, inside a worker process.
+
+    Exceptions never leave the worker: they are turned into a failed `ProcessingResult` carrying the
+    formatted traceback, so the parent can report them instead of losing them.
+    """
+    try:
+        scanned_pdf = asyncio.run(process_pdf(pdf_path=pdf_path, pages=pages, deadline=deadline, **kwargs))
+        return ProcessingResult(pdf_path, scanned_pdf=scanned_pdf)
+    except Exception:
+        return ProcessingResult(pdf_path, error=traceback.format_exc())
+
+
+def _collect(future: Future, pdf_path: Path) -> ProcessingResult:
+    try:
+        return future.result()
+    except WorkerKilled as e:
+        # Killed for exceeding a limit, or died (e.g. a segfault in a native library): a result without findings, so
+        # that the document ends up on the retry list
+        logging.warning(f"No result for PDF: {pdf_path}. {e}")
+        scanned_pdf = ScannedPDF(pdf_path.as_posix())
+        scanned_pdf.status = ProcessingStatus.KILLED
+        scanned_pdf.potential_signatures = None
+        return ProcessingResult(pdf_path, scanned_pdf=scanned_pdf)
+    except Exception:
+        return ProcessingResult(pdf_path, error=traceback.format_exc())
+
+
+def plan_shards(pdf_path: Path, kwargs: dict, shard_pages: int) -> list[Optional[slice]]:
+    """ The page ranges a document is processed in: the whole document at once, unless it has more than `shard_pages`
+    pages. The last shard runs to the end of the document, whatever its engine counts.
+
+    Runs in the parent for every document before it is submitted, so it only counts the pages, which ordering by pages
+    has counted already (see `backends.page_count`). The workers look up cached results, also for shards.
+    """
+    if shard_pages <= 0:
+        return [None]
+    try:
+        pages = page_count(pdf_path, kwargs.get("engine", DEFAULT_ENGINE))
+    except UnreadablePDF:
+        # Let the worker run into the same error and report it
+        logging.debug(f"Could not count the pages of {pdf_path}, processing it as a whole", exc_info=True)
+        return [None]
+    if pages <= shard_pages:
+        return [None]
+    starts = range(0, pages, shard_pages)
+    logging.debug(f"Splitting {pdf_path} with {pages} pages into {len(starts)} shards")
+    return [slice(start, start + shard_pages if start + shard_pages < pages else None) for start in starts]
+
+
+class _ShardedDocument:
+    """ Collects the shards of a document as they complete, in any order.
+
+    The shards share the time limit of the document, which counts from when the first shard is submitted: every shard
+    gets the same `deadline`, and shards that are not submitted by then are never started.
+    """
+
+    def __init__(self, pdf_path: Path, shards: int, document_seconds: float = 0):
+        self.pdf_path: Path = pdf_path
+        self.results: list[Optional[ScannedPDF]] = [None] * shards
+        self.remaining: int = shards
+        self.error: Optional[str] = None
+        self.document_seconds: float = document_seconds
+        self.deadline: Optional[float] = None
+
+    def start(self, index: int) -> bool:
+        """ Whether the shard may still be submitted. One that may not counts as done, without a result. """
+        if self.document_seconds <= 0:
+            return True
+        if self.deadline is None:
+            self.deadline = time.time() + self.document_seconds
+        elif time.time() >= self.deadline:
+            logging.warning(f"{self.pdf_path} took longer than {self.document_seconds}s, not starting shard {index + 1} of it")
+            self.remaining -= 1
+            return False
+        return True
+
+    def add(self, index: int, result: ProcessingResult) -> bool:
+        """ Records the result of a shard, returns whether the document is complete. """
+        self.remaining -= 1
+        if result.ok:
+            self.results[index] = result.scanned_pdf
+        elif self.error is None:
+            self.error = result.error
+        return self.remaining == 0
+
+    def merge(self, kwargs: dict) -> ProcessingResult:
+        if self.error is not None:
+            return ProcessingResult(self.pdf_path, error=self.error)
+        try:
+            scanned_pdf = merge_shards(self.pdf_path, self.results, output_path=kwargs["output_path"], **_result_settings(kwargs))
+            return ProcessingResult(self.pdf_path, scanned_pdf=scanned_pdf)
+        except Exception:
+            return ProcessingResult(self.pdf_path, error=traceback.format_exc())
+
+
+def warm_up(kwargs: dict):
+    """ Loads everything `process_pdf` will need with these keyword arguments, so the first document does not wait for it. """
+    if kwargs.get("do_regex"):
+        get_ocr_service(kwargs.get("ocr_config") or OCRConfiguration()).reader
+
+
+def _ready() -> bool:
+    return True
+
+
+def start_pool(workers: int, kwargs: dict) -> WorkerPool:
+    """ Starts a pool of `workers` processes that have loaded the OCR model, for a long-running server. """
+    pool = WorkerPool(workers, kwargs.get("limits"), initializer=warm_up, initargs=(kwargs,))
+    # Processes are started as tasks are submitted, one task per worker starts all of them now
+    for future in [pool.submit(_ready) for _ in range(workers)]:
+        future.result()
+    return pool
+
+
+def run_in_pool(pdf_files: Iterable[Path], kwargs: dict, workers: int, max_in_flight: int = 0, shard_pages: int = 0, pool: Optional[WorkerPool] = None) -> Iterator[ProcessingResult]:
+    """ Processes PDF files on a pool of worker processes, yielding results as soon as they complete.
+
+    Documents with more than `shard_pages` pages are split into shards of that many pages that run on separate workers,
+    each opening the file itself, so that one huge document does not keep a single core busy long after the rest of the
+    run is done. Their results are merged back into one result per document (see `helpers.merge_shards`). The shards
+    share the time limit of their document, the memory limit applies to each worker.
+
+    Args:
+        pdf_files: The documents to process. Consumed lazily, never more than `max_in_flight` ahead of the results.
+        kwargs: Keyword arguments passed to `process_pdf` for every document.
+        workers: Number of worker processes. 0 processes every document in the calling process, without sharding.
+        max_in_flight: Maximum number of submitted but unfinished documents or shards (default: twice the worker count).
+        shard_pages: Page count above which documents are sharded, 0 never shards.
+        pool: A running pool to submit to (see `start_pool`), which is left running. By default a pool is started for
+            this call only.
+    Yields:
+        ProcessingResult: One per document, in completion order. A document whose worker was killed for exceeding the
+            limits in `kwargs`, or died, has a result with status killed and without findings.
+    """
+    if workers <= 0:
+        for pdf_path in pdf_files:
+            yield _process_pdf_in_worker(pdf_path, kwargs)
+        return
+
+    max_in_flight = max_in_flight or workers * 2
+    if pool is not None:
+        yield from _run(pool, pdf_files, kwargs, max_in_flight, shard_pages)
+        return
+    with WorkerPool(workers, kwargs.get("limits")) as pool:
+        yield from _run(pool, pdf_files, kwargs, max_in_flight, shard_pages)
+
+
+def _run(pool: WorkerPool, pdf_files: Iterable[Path], kwargs: dict, max_in_flight: int, shard_pages: int) -> Iterator[ProcessingResult]:
+    limits = kwargs.get("limits")
+    in_flight: dict[Future, tuple[Path, Optional[_ShardedDocument], int]] = {}
+
+    def complete(done: set[Future]) -> Iterator[ProcessingResult]:
+        for future in done:
+            pdf_path, document, index = in_flight.pop(future)
+            result = _collect(future, pdf_path)
+            if document is None:
+                yield result
+            elif document.add(index, result):
+                yield document.merge(kwargs)
+
+    for pdf_path in pdf_files:
+        shards = plan_shards(pdf_path, kwargs, shard_pages)
+        document = _ShardedDocument(pdf_path, len(shards), limits.document_seconds if limits else 0) if len(shards) > 1 else None
+        for index, pages in enumerate(shards):
+            if len(in_flight) >= max_in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                yield from complete(done)
+            if document is not None and not document.start(index):
+                if document.remaining == 0:
+                    yield document.merge(kwargs)
+                continue
+            deadline = document.deadline if document is not None else None
+            logging.debug(f"Submitting {pdf_path} to worker pool" + (f" (pages {pages.start + 1}-{pages.stop or 'end'})" if pages else ""))
+            in_flight[pool.submit_by(deadline, _process_pdf_in_worker, pdf_path, kwargs, pages, deadline)] = (pdf_path, document, index)
+
+    while in_flight:
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        yield from complete(done)
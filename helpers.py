@@ -1,18 +1,31 @@
 from datetime import datetime, timedelta, timezone
-import io
+import hashlib
 import json
 import logging
+import time
 from pathlib import Path
-from pydoc import resolve
-from classes import ExtractedArtifact, PossibleArtifactFinding, ScannedPDF, ArtifactType
-import pdfplumber 
-import easyocr
+from classes import CacheConfiguration, ExtractedArtifact, LimitsConfiguration, OCRConfiguration, PossibleArtifactFinding, ProcessingStatus, ScannedPDF, ArtifactType
+from cache import ResultCache, get_result_cache
+from backends import DEFAULT_ENGINE, Document, DocumentPage, PageImage, open_document
 import re
-from PIL import Image
+from pii import PIIScanner
+from ocr import get_ocr_cache, get_ocr_service
+from spatial import RENDER_INVISIBLE, PageChars, to_rgb
+from images import DecodedImage
+from limits import PageGuard
+from pipeline import PageDetector, PagePipeline
+from triage import ImageTriage
+from profiling import Profiler, measure, merge_profiles
+from typing import Optional
 from regexes import re_objects
-import fitz
+import numpy as np
 
-PATTERNS = { key: re.compile(pattern) for key, pattern in re_objects.items() }
+PII_SCANNER = PIIScanner(re_objects)
+
+# Every RGB component of white text is at least this bright
+WHITE_TEXT_MIN = 0.8
+# Text in a smaller font size, in points, cannot be read without zooming in
+MIN_VISIBLE_FONT_SIZE = 1.0
 
 
 def parse_pdf_date(pdf_date: str) -> datetime:
@@ -64,147 +77,270 @@ def parse_pdf_date(pdf_date: str) -> datetime:
 
     return dt.replace(tzinfo=tz)
 
-def extract_text_inside_filled_rectangles(pdf: pdfplumber.PDF, out:Path):
-    last_page_number = -1
+def extract_text_inside_filled_rectangles_from_page(page):
     last_y_offset = -1
-    has_dark_rects = False
-    try:
-        for page in pdf.pages:
-            last_page_number = page.page_number
-            captured_text = ""
-            for rect in page.objects.get("rect", []):
-                # Capture rectangle boundaries
-                x0, y0, x1, y1 = round(rect['x0']), round(rect['y0']), round(rect['x1']), round(rect['y1'])
-                if last_y_offset != y0:
-                    if captured_text:
-                        logging.debug(f"Captured text inside filled rectangle on page {page.page_number} at offset{last_y_offset}: {captured_text}")
-                        yield ExtractedArtifact(page.page_number, captured_text, artifact_type=ArtifactType.FILLED_RECTANGLE)
-                        captured_text = ""
-                    # indent
-                    last_y_offset = y0
-
-
-                # Check if the rectangle is filled
-                if not rect.get('fill', None) == True:
-                    continue
-                else:
-                    has_dark_rects = True
-
-                # check if the rectangle has a dark color
-                non_stroking_color = rect.get('non_stroking_color', [])
-                if isinstance(non_stroking_color, float) or isinstance(non_stroking_color, int):
-                    non_stroking_color = [non_stroking_color]
-                if not all(0.0 <= c <= 0.2 for c in non_stroking_color):
-                    continue
-
-                for i, char in enumerate(page.objects.get("char", [])):
-                    if (
-                        round(char['x0']) >= x0 and round(char['x1']) <= x1 and
-                        round(char['y0']) >= y0 and round(char['y1']) <= y1
-                    ):
-                        captured_text += char['text']
-            
-            # flush last bit of captured text
+    captured_text = ""
+    rects = page.rects
+    # Filled rectangles in a dark colour, tested on all rectangles of the page at once
+    dark = np.array([rect.get('fill', None) == True for rect in rects], dtype=bool) & np.all(to_rgb([rect.get('non_stroking_color') for rect in rects]) <= 0.2, axis=1)
+    for rect, is_dark in zip(rects, dark):
+        # Capture rectangle boundaries
+        x0, y0, x1, y1 = round(rect['x0']), round(rect['y0']), round(rect['x1']), round(rect['y1'])
+        if last_y_offset != y0:
             if captured_text:
                 logging.debug(f"Captured text inside filled rectangle on page {page.page_number} at offset{last_y_offset}: {captured_text}")
                 yield ExtractedArtifact(page.page_number, captured_text, artifact_type=ArtifactType.FILLED_RECTANGLE)
+                captured_text = ""
+            # indent
+            last_y_offset = y0
+
+        if is_dark:
+            captured_text += page.char_index.text_within(x0, y0, x1, y1)
+
+    # flush last bit of captured text
+    if captured_text:
+        logging.debug(f"Captured text inside filled rectangle on page {page.page_number} at offset{last_y_offset}: {captured_text}")
+        yield ExtractedArtifact(page.page_number, captured_text, artifact_type=ArtifactType.FILLED_RECTANGLE)
+
+def extract_text_inside_filled_rectangles(pdf: Document, out:Path):
+    last_page_number = -1
+    try:
+        for page in pdf.pages:
+            last_page_number = page.page_number
+            yield from extract_text_inside_filled_rectangles_from_page(page)
     except Exception as e:
         errmsg = f"Error extracting text inside filled rectangles on page {last_page_number} from PDF: {pdf.path.as_posix()}"
         logging.error(errmsg, exc_info=True)
         raise RuntimeError(errmsg) from e
 
-def extract_white_text_from_pdf(pdf: pdfplumber.PDF):
+def _hidden_runs(page, mask, artifact_type: ArtifactType):
+    for text in page.char_columns.runs(mask):
+        if text.strip():
+            logging.debug(f"Captured {artifact_type.value} on page {page.page_number}: {text}")
+            yield ExtractedArtifact(page.page_number, text, artifact_type=artifact_type)
+
+def _behind_images(page, chars: PageChars) -> np.ndarray:
+    """ Chars lying below an image of the page, whether the image is drawn over them or not. """
+    behind = np.zeros(len(chars), dtype=bool)
+    for img in page.images:
+        behind |= chars.within(*img.bbox)
+    return behind
+
+def extract_white_text_from_page(page):
+    chars = page.char_columns
+    white = chars.light(WHITE_TEXT_MIN) & (chars.render_mode != RENDER_INVISIBLE)
+    if not white.any():
+        return
+    # White text on a dark filled rectangle or on an image can be read, like the inverted headers of a table
+    rects = page.rects
+    backdrop = np.array([rect.get('fill', None) == True for rect in rects], dtype=bool) & ~np.all(to_rgb([rect.get('non_stroking_color') for rect in rects]) >= WHITE_TEXT_MIN, axis=1)
+    for rect in (rect for rect, is_backdrop in zip(rects, backdrop) if is_backdrop):
+        white &= ~chars.within(rect['x0'], rect['y0'], rect['x1'], rect['y1'])
+    if white.any() and page.images:
+        white &= ~_behind_images(page, chars)
+    yield from _hidden_runs(page, white, ArtifactType.WHITE_TEXT)
+
+def extract_invisible_text_from_page(page):
+    chars = page.char_columns
+    invisible = (chars.render_mode == RENDER_INVISIBLE) | ((chars.size > 0) & (chars.size < MIN_VISIBLE_FONT_SIZE))
+    # Invisible text below an image is the text layer of a scan, which the text detector reads anyway
+    if invisible.any() and page.images:
+        invisible &= ~_behind_images(page, chars)
+    yield from _hidden_runs(page, invisible, ArtifactType.INVISIBLE_TEXT)
+
+def extract_covered_text_from_page(page):
+    chars = page.char_columns
+    covered = np.zeros(len(chars), dtype=bool)
+    if (chars.order >= 0).any():
+        visible = chars.render_mode != RENDER_INVISIBLE
+        for img in page.images:
+            # Only known for engines that report the drawing order, see `PageImage.order`
+            if img.order is not None and img.visible_bbox is not None:
+                covered |= visible & (chars.order >= 0) & (chars.order < img.order) & chars.within(*img.visible_bbox)
+    yield from _hidden_runs(page, covered, ArtifactType.COVERED_TEXT)
+
+def extract_white_text_from_pdf(pdf: Document):
     last_page_number = -1
-    captured_white_text = ""
     try:
         for page in pdf.pages:
             last_page_number = page.page_number
-            for obj in page.objects.get("char", []):
-                if (
-                    obj['object_type'] == 'char' and
-                    all(0.8 <= c <= 1.0 for c in obj.get('non_stroking_color', []))
-                ):
-                    captured_white_text += obj['text']
-                elif captured_white_text:
-                    logging.debug(f"Captured white text on page {page.page_number}: {captured_white_text}")
-                    yield ExtractedArtifact(page.page_number, captured_white_text, artifact_type=ArtifactType.WHITE_TEXT)
-                    captured_white_text = ""
+            yield from extract_white_text_from_page(page)
     except Exception as e:
         errmsg = f"Error extracting white text on page {last_page_number} from PDF: {pdf.path.as_posix()}"
         logging.error(errmsg, exc_info=True)
         raise RuntimeError(errmsg) from e
 
-def extract_text_from_pdf(pdf: pdfplumber.PDF):
+def extract_text_from_page(page) -> ExtractedArtifact:
+    logging.debug(f"Extracting text from page {page.page_number}")
+    page_text = page.extract_text() + '\n'
+    logging.debug(f"Extracted text with length {len(page_text)} from page {page.page_number}")
+    return ExtractedArtifact(page.page_number, page_text)
+
+def extract_text_from_pdf(pdf: Document):
     try:
         for page in pdf.pages:
-            logging.debug(f"Extracting text from page {page.page_number}")
-            page_text = page.extract_text(x_tolerance=1, y_tolerance=1)  + '\n'
-            logging.debug(f"Extracted text with length {len(page_text)} from page {page.page_number}")
-            yield ExtractedArtifact(page.page_number, page_text)
+            yield extract_text_from_page(page)
     except Exception as e:
         logging.error(f"Error extracting text from PDF: {e}", exc_info=True)
         raise RuntimeError(f"Failed to extract text from PDF: {pdf}") from e
 
-def _extract_image_data_from_pdf_image(image: dict) -> Image.Image:
-    attrs = image['stream'].attrs
-    data = image['stream'].get_data()
-
-    width = attrs.get("Width")
-    height = attrs.get("Height")
-    color_space = attrs.get("ColorSpace")
-    bits_per_component = attrs.get("BitsPerComponent")
-    filter_ = attrs.get("Filter")
-
-    # Step 2: Handle common filters
-    if 'DCTDecode' in str(filter_):
-        # JPEG format
-        return Image.open(io.BytesIO(data))
-
-    elif  "FlateDecode" in str(filter_):
-        # Assume RGB or grayscale (add more checks if needed)
-        mode = "L" if "DeviceGray" in resolve(color_space) else "RGB"
-        expected_len = width * height if mode == "L" else width * height * 3
-        if len(data) < expected_len:
-            # Pad with zeros if data is too short
-            data += b'\x00' * (expected_len - len(data))
-        elif len(data) > expected_len:
-            # Truncate if data is too long
-            data = data[:expected_len]
-        return Image.frombytes(mode, (width, height), data)
-
-    else: 
-        # JPEG2000 - supported by Pillow
-        return Image.open(io.BytesIO(data), formats=None) # Try loading all formats
-
-
-def _extract_images_from_page(page):
+def _extract_images_from_page(page: DocumentPage):
     for img in page.images:
-        buffer = io.BytesIO()
-        image = _extract_image_data_from_pdf_image(img)
-        image.save(buffer, format="PNG")
-        yield buffer
+        yield img.decode()
+
+class _PendingImage:
+    def __init__(self, page_number: int, key: Optional[str], image: Optional[DecodedImage] = None, text: Optional[list[str]] = None, same_as: Optional['_PendingImage'] = None):
+        self.page_number = page_number
+        self.key = key
+        self.image = image
+        self.text = text
+        self.same_as = same_as  # an identical image earlier in the batch whose text is reused
+
+class _ImageBatch:
+    """ Collects page images until a full OCR batch is available.
+
+    Images that fail triage (see `ImageTriage`) are skipped, and counted per reason in `skipped`. Images recognised
+    before (see `OCRResultCache`) take their text from the cache without being decoded, and repeats of an image within
+    a batch are only recognised once. The others are decoded straight to pixel arrays by the document's engine and
+    handed to OCR as they are, until the document's OCR budget is spent.
+    """
 
-async def extract_images_from_pdf(pdf: pdfplumber.PDF):
+    def __init__(self, pdf_path: Path, ocr_config: OCRConfiguration = None):
+        ocr_config = ocr_config or OCRConfiguration()
+        self.pdf_path = pdf_path
+        self.config = ocr_config
+        self.ocr = get_ocr_service(ocr_config)
+        self.cache = get_ocr_cache(ocr_config)
+        self.triage = ImageTriage(ocr_config)
+        self.pending: list[_PendingImage] = []
+        self.to_read: dict[str, _PendingImage] = {}
+        self.last_image: Optional[DecodedImage] = None
+        self.hits = 0
+        self.misses = 0
+        self.skipped: dict[str, int] = {}
+        self.read = 0
+        self.ocr_seconds = 0.0
+        # The images of a batch a time limit interrupted whose text was known without OCR
+        self.interrupted: list[ExtractedArtifact] = []
+
+    def add_page(self, page: DocumentPage) -> list[ExtractedArtifact]:
+        """ Queues the images of a page, returning the artifacts of every batch that filled up in the meantime. """
+        artifacts = []
+        try:
+            for img in page.images:
+                pending = self._queue(page, img)
+                if pending is None:
+                    continue
+                self.pending.append(pending)
+                if len(self.pending) >= self.ocr.config.batch_size:
+                    artifacts += self.flush()
+        except BaseException:
+            # The batches this page filled before a time limit interrupted it were read, they are matched all the same
+            self.interrupted = artifacts + self.interrupted
+            raise
+        return artifacts
+
+    def _skip(self, reason: str):
+        self.skipped[reason] = self.skipped.get(reason, 0) + 1
+
+    def _over_budget(self) -> bool:
+        return bool(
+            (self.config.max_images and self.read + len(self.to_read) >= self.config.max_images) or
+            (self.config.max_seconds and self.ocr_seconds >= self.config.max_seconds)
+        )
+
+    def _queue(self, page: DocumentPage, img: PageImage) -> Optional[_PendingImage]:
+        reason = self.triage.before_decode(page, img)
+        if reason:
+            self._skip(reason)
+            return None
+
+        key = None
+        if self.cache:
+            key = img.key(self.ocr.config.languages)
+            if key in self.to_read:
+                self.hits += 1
+                return _PendingImage(page.page_number, key, same_as=self.to_read[key])
+            text = self.cache.get(key)
+            if text is not None:
+                self.hits += 1
+                return _PendingImage(page.page_number, key, text=text)
+            self.misses += 1
+
+        if self._over_budget():
+            self._skip("budget")
+            return None
+        image = img.decode()
+        self.last_image = image
+        reason = self.triage.after_decode(image)
+        if reason:
+            self._skip(reason)
+            return None
+        pending = _PendingImage(page.page_number, key, image)
+        self.to_read[key if key is not None else str(id(pending))] = pending
+        return pending
+
+    def flush(self) -> list[ExtractedArtifact]:
+        if not self.pending:
+            return []
+
+        # Taken off the batch first, so that a batch interrupted by a time limit is dropped rather than read again
+        pending_images, to_read = self.pending, list(self.to_read.values())
+        self.pending, self.to_read = [], {}
+        if to_read:
+            start = time.perf_counter()
+            try:
+                texts = self.ocr.readtext_batch([pending.image.pixels for pending in to_read])
+            except BaseException:
+                # Interrupted by the timer of `limits.PageGuard`, which is not an Exception: the images still to be
+                # read are dropped, and repeats of them, the others already have their text
+                known = [pending for pending in pending_images if pending.same_as is None and pending.text is not None]
+                for _ in range(len(pending_images) - len(known)):
+                    self._skip("timeout")
+                self.interrupted = self._artifacts(known)
+                raise
+            self.ocr_seconds += time.perf_counter() - start
+            self.read += len(to_read)
+            for pending, text in zip(to_read, texts):
+                pending.text = text
+                if self.cache:
+                    self.cache.put(pending.key, text)
+        return self._artifacts(pending_images)
+
+    @staticmethod
+    def _artifacts(pending_images: list[_PendingImage]) -> list[ExtractedArtifact]:
+        artifacts = []
+        for pending in pending_images:
+            image_text = pending.same_as.text if pending.same_as else pending.text
+            artifacts.append(ExtractedArtifact(
+                pending.page_number,
+                image_text if image_text else "",
+                object_ref=pending.image,
+                description=f"Image on page {pending.page_number}",
+                artifact_type=ArtifactType.IMAGE
+            ))
+        return artifacts
+
+    def save_last_image(self):
+        if self.last_image:
+            Path(f"image_error_{self.pdf_path.stem}.png").write_bytes(self.last_image.to_png())
+
+async def extract_images_from_pdf(pdf: Document, ocr_config: OCRConfiguration = None):
+    """ Runs OCR on every image in the PDF. Images are collected across pages and recognised in batches of
+    `ocr_config.batch_size` by the OCR service of the current process, which keeps its model loaded between documents.
+    """
     last_page_number = -1
-    last_image = None
-    n = len(pdf.pages)
+    batch = _ImageBatch(pdf.path, ocr_config)
     try:
-        reader = easyocr.Reader(['en', 'nl'], gpu=True)
         logging.info(f"Extracting images from PDF: {pdf.path.as_posix()} with {len(pdf.pages)} pages")
-        for i, page in enumerate(pdf.pages):
+        for page in pdf.pages:
             last_page_number = page.page_number
-            for img_buffer in _extract_images_from_page(page):
-                last_image = img_buffer
-                image_text = reader.readtext(img_buffer.getvalue(), detail=0)
-                yield ExtractedArtifact(
-                    page.page_number,
-                    image_text if image_text else "",
-                    object_ref=img_buffer,
-                    description=f"Image on page {page.page_number}"
-                )
+            for artifact in batch.add_page(page):
+                yield artifact
+        for artifact in batch.flush():
+            yield artifact
     except Exception as e:
-        if last_image:
-            last_image.save(f"image_error_{pdf.path.stem}.png", format="PNG")
+        batch.save_last_image()
 
         errmsg = f"Error extracting images from PDF: {pdf.path.as_posix()} at page {last_page_number}"
         logging.error(errmsg, exc_info=True)
@@ -212,27 +348,183 @@ async def extract_images_from_pdf(pdf: pdfplumber.PDF):
 
 
 def extract_pii(text: str):
-    for key, value in PATTERNS.items():
-        pii_match = re.findall(value, text)
-        for match in pii_match:
-            if match:
-                yield (key, match)
+    for match in PII_SCANNER.scan(text):
+        yield (match.kind, match.text)
+
+def page_has_signature(page) -> bool:
+    return any(page.images)
+
+def check_for_signatures(pdf: Document) -> bool:
+    return page_has_signature(pdf.pages[-1])
+
+def _pii_findings(artifact: ExtractedArtifact, text: str, source: str) -> list[PossibleArtifactFinding]:
+    findings = []
+    for match in PII_SCANNER.scan(text):
+        logging.debug(f"Extracted {match.kind}: {match.text} from page {artifact.page_number} in {source}")
+        findings.append(PossibleArtifactFinding.from_extracted_artifact(artifact, match.text, match.kind, match.start, match.end, text))
+    return findings
 
-def check_for_signatures(pdf: pdfplumber.PDF) -> bool:
-    last_page = pdf.pages[-1]
-    return any(last_page.images)
+class FilledRectangleDetector(PageDetector):
+    name = "filled_rectangle"
 
-async def process_pdf(pdf_path:Path, do_regex:bool, output_path: Path) -> ScannedPDF:
+    def visit_page(self, page, is_last_page):
+        for artifact in extract_text_inside_filled_rectangles_from_page(page):
+            if artifact.text:
+                logging.debug(f"Extracted text inside filled rectangle from page {artifact.page_number}: {artifact.text}")
+                self.findings.append(PossibleArtifactFinding.from_extracted_artifact(artifact, artifact.text, "filled_rectangle"))
+
+class WhiteTextDetector(PageDetector):
+    name = "white_text"
+
+    def visit_page(self, page, is_last_page):
+        for artifact in extract_white_text_from_page(page):
+            if artifact.text:
+                logging.debug(f"Extracted white text from page {artifact.page_number}: {artifact.text}")
+                self.findings.append(PossibleArtifactFinding.from_extracted_artifact(artifact, artifact.text, "white_text"))
+
+class InvisibleTextDetector(PageDetector):
+    name = "invisible_text"
+
+    def visit_page(self, page, is_last_page):
+        for artifact in extract_invisible_text_from_page(page):
+            self.findings.append(PossibleArtifactFinding.from_extracted_artifact(artifact, artifact.text, "invisible_text"))
+
+class CoveredTextDetector(PageDetector):
+    name = "covered_text"
+
+    def visit_page(self, page, is_last_page):
+        for artifact in extract_covered_text_from_page(page):
+            self.findings.append(PossibleArtifactFinding.from_extracted_artifact(artifact, artifact.text, "covered_text"))
+
+class TextPIIDetector(PageDetector):
+    name = "text"
+
+    def __init__(self, page_texts: Optional[dict[int, str]] = None):
+        super().__init__()
+        # Keeps the text of every page here when given, the offsets of the findings point into it
+        self.page_texts = page_texts
+
+    def visit_page(self, page, is_last_page):
+        artifact = extract_text_from_page(page)
+        if self.page_texts is not None:
+            self.page_texts[artifact.page_number] = artifact.text
+        if artifact.text:
+            self.findings += _pii_findings(artifact, artifact.text, "text")
+
+class ImagePIIDetector(PageDetector):
+    """ OCRs the images of every page in batches that may span pages, and matches PII in the recognised text. """
+    name = "images"
+
+    def __init__(self, pdf_path: Path, ocr_config: OCRConfiguration = None, stats: Optional[dict] = None):
+        super().__init__()
+        self.pdf_path = pdf_path
+        self.batch = _ImageBatch(pdf_path, ocr_config)
+        self.stats = stats if stats is not None else {}
+
+    def visit_page(self, page, is_last_page):
+        self._run(self.batch.add_page, page)
+
+    def finish(self):
+        self._run(self.batch.flush)
+
+    def _record_stats(self):
+        self.stats["ocr_cache_hits"] = self.batch.hits
+        self.stats["ocr_cache_misses"] = self.batch.misses
+        self.stats["ocr_skipped"] = sum(self.batch.skipped.values())
+        for reason, count in self.batch.skipped.items():
+            self.stats[f"ocr_skipped_{reason}"] = count
+
+    def _run(self, fn, *args):
+        try:
+            artifacts = fn(*args)
+        except Exception:
+            self.batch.save_last_image()
+            raise
+        except BaseException:
+            # Interrupted by a time limit, the images of the batch whose text was known are still matched
+            artifacts, self.batch.interrupted = self.batch.interrupted, []
+            self._match(artifacts)
+            raise
+        finally:
+            # Also when a time limit interrupts, a document that runs out of time is never finished
+            self._record_stats()
+        self._match(artifacts)
+
+    def _match(self, artifacts: list[ExtractedArtifact]):
+        for artifact in artifacts:
+            if artifact.text:
+                self.findings += _pii_findings(artifact, " ".join(artifact.text), "image")
+
+class SignatureDetector(PageDetector):
+    name = "signature"
+
+    def __init__(self, scanned_pdf: ScannedPDF):
+        super().__init__()
+        self.scanned_pdf = scanned_pdf
+        # Unknown until the last page is visited, which a shard or a document that runs out of time may not get to
+        self.scanned_pdf.potential_signatures = None
+
+    def visit_page(self, page, is_last_page):
+        if is_last_page:
+            self.scanned_pdf.potential_signatures = page_has_signature(page)
+
+def detector_settings(do_regex: bool, ocr_config: OCRConfiguration = None, engine: str = DEFAULT_ENGINE, keep_page_text: bool = False) -> dict:
+    """ The settings that change what `process_pdf` finds, as fingerprinted by the result cache. """
+    return {
+        "engine": engine,
+        "do_regex": do_regex,
+        "ocr_languages": (ocr_config or OCRConfiguration()).languages if do_regex else [],
+        "ocr_triage": (ocr_config or OCRConfiguration()).triage_settings() if do_regex else {},
+        "page_text": keep_page_text and do_regex,
+    }
+
+async def process_pdf(pdf_path:Path, do_regex:bool, output_path: Optional[Path], ocr_config: OCRConfiguration = None, cache_config: CacheConfiguration = None, engine: str = DEFAULT_ENGINE, profile: bool = False, pages: Optional[slice] = None, keep_page_text: bool = False, limits: Optional[LimitsConfiguration] = None, deadline: Optional[float] = None) -> ScannedPDF:
     """ Processes a PDF file to extract text and images, yielding PII data found in the text.
-    
+
+    Every page is parsed once and visited by each detector in turn (see `PagePipeline`), after which its layout is released.
+    When a result cache is configured and holds a result for the same file content and settings, the file is not opened at all.
+
     Args:
         pdf_path (str): The path to the PDF file.
+        output_path (Path): The directory the result file is written to (see `result_file`), None writes none.
+        ocr_config (OCRConfiguration): Languages, batch size and device of the OCR model.
+        cache_config (CacheConfiguration): Location and behaviour of the result cache, None disables it.
+        engine (str): The extraction backend, one of `backends.ENGINES`.
+        profile (bool): Measure every stage on every page and attach a summary to the result (see `profiling.Profiler`).
+        pages (slice): Only process these page indices, as one shard of a large document. A shard is neither cached nor
+            written, `merge_shards` combines the shards of a document into its result. When the whole document has a
+            cached result, the shard takes its pages from that.
+        keep_page_text (bool): Keep the text of every page once in `ScannedPDF.page_texts`, findings only hold a snippet.
+        limits (LimitsConfiguration): Time and memory limits, see `limits.PageGuard`. A document that exceeds them comes
+            back with the findings collected so far and a `ScannedPDF.status` other than complete, and is not cached.
+        deadline (float): The wall-clock time (`time.time()`) by which a shard must stop, as the shards of a document
+            share its time limit.
     Yields:
         PossibleArtifactFinding: An object containing the page number, extracted text, and artifact type.
     """
+    profiler = Profiler() if profile else None
+    cache: Optional[ResultCache] = None
+    cache_key = ""
+    if cache_config and cache_config.enabled:
+        with measure(profiler, "cache_lookup"):
+            cache = get_result_cache(cache_config)
+            cache_key = ResultCache.key_for(pdf_path, detector_settings(do_regex, ocr_config, engine, keep_page_text))
+            cached = None if cache_config.rebuild else cache.get(cache_key)
+        if cached is not None:
+            logging.debug(f"Using cached result for PDF: {pdf_path}")
+            scanned_pdf = ScannedPDF.from_dict(cached)
+            scanned_pdf.path = pdf_path.as_posix()
+            if profiler:
+                scanned_pdf.profile = dict(profiler.summary(), cached=True)
+            if pages is not None:
+                return _shard_of(scanned_pdf, pages)
+            _write_result(scanned_pdf, pdf_path, output_path)
+            return scanned_pdf
+
     scanned_pdf = ScannedPDF(pdf_path.as_posix())
-    findings: list[PossibleArtifactFinding] = []
-    with pdfplumber.open(scanned_pdf.path) as pdf:
+    with measure(profiler, "open"):
+        pdf = open_document(pdf_path, engine)
+    with pdf:
         if not pdf.pages:
             logging.error(f"No pages found in PDF: {pdf_path}")
             raise StopAsyncIteration(f"No pages found in PDF: {pdf_path}")
@@ -252,43 +544,109 @@ async def process_pdf(pdf_path:Path, do_regex:bool, output_path: Path) -> Scanne
         except Exception as e:
             pass
 
-        logging.info(f"Processing PDF: {pdf_path} with {len(pdf.pages)} pages")
-        # white_text = extract_white_text_from_pdf(pdf)
-        masked_text = extract_text_inside_filled_rectangles(pdf, output_path)
-        scanned_pdf.potential_signatures = check_for_signatures(pdf)
+        if pages is None:
+            logging.info(f"Processing PDF: {pdf_path} with {len(pdf.pages)} pages")
+        else:
+            shard = range(len(pdf.pages))[pages]
+            logging.info(f"Processing pages {shard.start + 1}-{shard.stop} of PDF: {pdf_path} with {len(pdf.pages)} pages")
+        detectors: list[PageDetector] = [
+            WhiteTextDetector(),
+            InvisibleTextDetector(),
+            CoveredTextDetector(),
+            FilledRectangleDetector(),
+            SignatureDetector(scanned_pdf),
+        ]
+        if do_regex:
+            detectors += [TextPIIDetector(scanned_pdf.page_texts if keep_page_text else None), ImagePIIDetector(pdf_path, ocr_config, scanned_pdf.stats)]
 
-        # for artifact in white_text:
-        #     if artifact.text:
-        #         logging.debug(f"Extracted white text from page {artifact.page_number} in PDF {pdf_path}: {artifact.text}")
-        #         findings.append(PossibleArtifactFinding.from_extracted_artifact(artifact, artifact.text, "white_text"))
+        guard = PageGuard(limits or LimitsConfiguration(), deadline) if (limits and limits.enabled) or deadline is not None else None
+        findings = PagePipeline(detectors, profiler, guard).run(pdf, pages)
 
-        for artifact in masked_text:
-            if artifact.text:
-                logging.debug(f"Extracted text inside filled rectangle from page {artifact.page_number} in PDF {pdf_path}: {artifact.text}")
-                findings.append(PossibleArtifactFinding.from_extracted_artifact(artifact, artifact.text, "filled_rectangle"))
+    scanned_pdf.add_findings(findings)
+    if guard:
+        scanned_pdf.status = guard.status
+        scanned_pdf.skipped_pages = guard.skipped_pages
+    if cache and pages is None and scanned_pdf.status is ProcessingStatus.COMPLETE:
+        cache.put(cache_key, scanned_pdf.to_dict())
+    if profiler:
+        # Attached after caching, a cached result was not profiled when it is reused
+        scanned_pdf.profile = profiler.summary()
+    if pages is None:
+        _write_result(scanned_pdf, pdf_path, output_path)
 
-                                
-        if do_regex:
-            text = extract_text_from_pdf(pdf)
-            images = extract_images_from_pdf(pdf)
-
-            for artifact in text:
-                if artifact.text:
-                    for data_type, data in extract_pii(artifact.text):
-                        logging.debug(f"Extracted {data_type}: {data} from page {artifact.page_number} in text of PDF {pdf_path}")
-                        findings.append(PossibleArtifactFinding.from_extracted_artifact(artifact, data, data_type))
-
-            async for artifact in images:
-                if artifact.text:
-                    for data_type, data in extract_pii(" ".join(artifact.text)):
-                        logging.debug(f"Extracted {data_type}: {data} from page {artifact.page_number} in image of PDF {pdf_path}")
-                        findings.append(PossibleArtifactFinding.from_extracted_artifact(artifact, data, data_type))
-        # endof do_regex
+    return scanned_pdf
 
-    scanned_pdf.add_findings(findings)
-    output_file = output_path / (pdf_path.stem + ".json")
-    with open(output_file, 'w') as f:
-        json.dump(scanned_pdf.to_dict(), f)
+def _shard_of(scanned_pdf: ScannedPDF, pages: slice) -> ScannedPDF:
+    """ The part of the result of a whole document that the shard of `pages` finds, as `merge_shards` expects it: the
+    counts of the whole document go with the first shard, and only the last one knows about signatures. """
+    start, stop = pages.start or 0, pages.stop
+    def on_shard(page_number: int) -> bool:
+        return start < page_number and (stop is None or page_number <= stop)
+
+    scanned_pdf.add_findings([finding for finding in scanned_pdf.findings if on_shard(finding.page_number)])
+    scanned_pdf.page_texts = {page: text for page, text in scanned_pdf.page_texts.items() if on_shard(page)}
+    if start > 0:
+        scanned_pdf.stats = {}
+    if stop is not None:
+        scanned_pdf.potential_signatures = None
+    return scanned_pdf
+
+def has_cached_result(pdf_path: Path, do_regex: bool, ocr_config: OCRConfiguration = None, cache_config: CacheConfiguration = None, engine: str = DEFAULT_ENGINE, keep_page_text: bool = False) -> bool:
+    """ Whether `process_pdf` would reuse a cached result for this document instead of processing it. """
+    if not cache_config or not cache_config.enabled or cache_config.rebuild:
+        return False
+    cache_key = ResultCache.key_for(pdf_path, detector_settings(do_regex, ocr_config, engine, keep_page_text))
+    return get_result_cache(cache_config).get(cache_key) is not None
 
+# The artifact types found by the detectors, in the order `process_pdf` registers the detectors
+FINDING_ORDER = [ArtifactType.WHITE_TEXT, ArtifactType.INVISIBLE_TEXT, ArtifactType.COVERED_TEXT, ArtifactType.FILLED_RECTANGLE, ArtifactType.REGULAR_TEXT, ArtifactType.IMAGE]
+
+def merge_shards(pdf_path: Path, shards: list[Optional[ScannedPDF]], do_regex: bool, output_path: Optional[Path], ocr_config: OCRConfiguration = None, cache_config: CacheConfiguration = None, engine: str = DEFAULT_ENGINE, keep_page_text: bool = False) -> ScannedPDF:
+    """ Combines the results of the page-range shards of a document, in page order, into the result `process_pdf` would
+    have produced for the whole document, and caches and writes it like `process_pdf` does.
+
+    Metadata is the same in every shard, it is taken from the first shard whose worker was not killed. Only the shard
+    holding the last page checks it for signatures, which are unknown (None) when it did not get to it. The status is
+    the worst of the shards, and like in `process_pdf` only a complete result is cached. A shard that was never started
+    because the document ran out of time is None, and makes the document a timeout.
+    """
+    started = [shard for shard in shards if shard is not None]
+    first = next((shard for shard in started if shard.status is not ProcessingStatus.KILLED), started[0])
+    last = shards[-1]
+    scanned_pdf = ScannedPDF(
+        pdf_path.as_posix(), first.author, first.title, first.subject, first.keywords, first.producer, first.creator,
+        first.creation_date, first.modification_date, last.potential_signatures if last is not None else None,
+    )
+    # Within a shard the findings are grouped per detector, a stable sort regroups them across shards in page order
+    rank = {artifact_type: i for i, artifact_type in enumerate(FINDING_ORDER)}
+    findings = [finding for shard in started for finding in shard.findings]
+    scanned_pdf.add_findings(sorted(findings, key=lambda finding: rank.get(finding.artifact_type, len(rank))))
+    if len(started) < len(shards):
+        scanned_pdf.status = ProcessingStatus.TIMEOUT
+    for shard in started:
+        scanned_pdf.page_texts.update(shard.page_texts)
+        for name, value in shard.stats.items():
+            scanned_pdf.stats[name] = scanned_pdf.stats.get(name, 0) + value
+        scanned_pdf.status = scanned_pdf.status.worst(shard.status)
+        scanned_pdf.skipped_pages += shard.skipped_pages
+
+    if cache_config and cache_config.enabled and scanned_pdf.status is ProcessingStatus.COMPLETE:
+        cache_key = ResultCache.key_for(pdf_path, detector_settings(do_regex, ocr_config, engine, keep_page_text))
+        get_result_cache(cache_config).put(cache_key, scanned_pdf.to_dict())
+    profiles = [shard.profile for shard in started if shard.profile]
+    if profiles:
+        scanned_pdf.profile = merge_profiles(profiles)
+    _write_result(scanned_pdf, pdf_path, output_path)
     return scanned_pdf
 
+def result_file(pdf_path: Path, output_path: Path) -> Path:
+    """ Where the result of a document is written: its name and a short hash of its absolute path, as documents found in
+    different directories may have the same name. """
+    path_hash = hashlib.sha1(pdf_path.resolve().as_posix().encode()).hexdigest()[:8]
+    return output_path / f"{pdf_path.stem}-{path_hash}.json"
+
+def _write_result(scanned_pdf: ScannedPDF, pdf_path: Path, output_path: Optional[Path]):
+    if output_path is None:
+        return
+    with open(result_file(pdf_path, output_path), 'w') as f:
+        json.dump(scanned_pdf.to_dict(), f)
@@ -0,0 +1,220 @@
+import io
+import logging
+from functools import lru_cache
+from typing import Optional
+
+import numpy as np
+from PIL import Image
+
+_COMPONENTS = {"DeviceGray": 1, "CalGray": 1, "G": 1, "DeviceRGB": 3, "CalRGB": 3, "RGB": 3, "Lab": 3, "DeviceCMYK": 4, "CMYK": 4}
+_ENCODED_FILTERS = ("DCTDecode", "DCT", "JPXDecode")
+# Filters pdfminer leaves encoded and Pillow cannot (reliably) decode
+_MUPDF_FILTERS = ("CCITTFaxDecode", "CCF", "JBIG2Decode", "JPXDecode")
+
+
+@lru_cache(maxsize=None)
+def load_fitz():
+    """ Imports PyMuPDF on first use, it takes a good part of the startup time. None when it is not installed. """
+    try:
+        import pymupdf
+    except ImportError:  # PyMuPDF is optional, images are then decoded from the pdfminer stream
+        return None
+    return pymupdf
+
+
+def resolve1(obj):
+    # pdfminer is only imported once a pdfplumber image is decoded, the pymupdf engine does not need it
+    from pdfminer.pdftypes import resolve1
+    return resolve1(obj)
+
+
+class DecodedImage:
+    """ The pixels of a PDF image as a uint8 array of shape (H, W) or (H, W, 3).
+
+    Where possible `pixels` is a view into the decoder's buffer instead of a copy.
+    """
+
+    def __init__(self, pixels: np.ndarray):
+        self.pixels: np.ndarray = pixels
+
+    @property
+    def size(self) -> tuple[int, int]:
+        return self.pixels.shape[1], self.pixels.shape[0]
+
+    def to_png(self) -> bytes:
+        buffer = io.BytesIO()
+        Image.fromarray(self.pixels).save(buffer, format="PNG")
+        return buffer.getvalue()
+
+
+def _name(obj) -> str:
+    return getattr(obj, "name", str(obj))
+
+
+def _filters(attrs: dict) -> list[str]:
+    filters = resolve1(attrs.get("Filter"))
+    if filters is None:
+        return []
+    if not isinstance(filters, list):
+        filters = [filters]
+    return [_name(resolve1(f)) for f in filters]
+
+
+def _cmyk_to_rgb(cmyk: np.ndarray) -> np.ndarray:
+    cmyk = cmyk.astype(np.uint16)
+    white = 255 - cmyk[..., 3:4]
+    return ((255 - cmyk[..., :3]) * white // 255).astype(np.uint8)
+
+
+def _to_rgb_or_gray(samples: np.ndarray, components: int) -> np.ndarray:
+    if components == 1:
+        return samples[..., 0]
+    if components == 3:
+        return samples
+    if components == 4:
+        return _cmyk_to_rgb(samples)
+    # Unusual DeviceN spaces, keep the first channel as an intensity
+    return samples[..., 0]
+
+
+def _color_space(attrs: dict) -> tuple[int, Optional[np.ndarray], int]:
+    """ Returns (components, palette, palette components) of an image's colour space; palette is None unless Indexed. """
+    if attrs.get("ImageMask"):
+        return 1, None, 0
+    color_space = resolve1(attrs.get("ColorSpace"))
+    if isinstance(color_space, list) and color_space:
+        family = _name(resolve1(color_space[0]))
+        if family == "Indexed" and len(color_space) >= 4:
+            base_components, _, _ = _color_space({"ColorSpace": color_space[1]})
+            lookup = resolve1(color_space[3])
+            lookup = lookup.get_data() if hasattr(lookup, "get_data") else lookup
+            lookup = lookup.encode("latin-1") if isinstance(lookup, str) else bytes(lookup)
+            palette = np.frombuffer(lookup, dtype=np.uint8)
+            entries = len(palette) // base_components
+            return 1, palette[:entries * base_components].reshape(entries, base_components), base_components
+        if family == "ICCBased":
+            return int(resolve1(color_space[1]).attrs.get("N", 3)), None, 0
+        if family in ("Separation",):
+            return 1, None, 0
+        if family == "DeviceN":
+            return len(resolve1(color_space[1])), None, 0
+        return _COMPONENTS.get(family, 3), None, 0
+    return _COMPONENTS.get(_name(color_space), 1 if color_space is None else 3), None, 0
+
+
+def _unpack_samples(data: bytes, width: int, height: int, components: int, bits: int) -> np.ndarray:
+    """ Unpacks raw PDF samples to a (H, W, components) uint8 array, without copying for 8-bit data. """
+    row_bytes = (width * components * bits + 7) // 8
+    needed = row_bytes * height
+    if len(data) < needed:
+        logging.debug(f"Image data is {needed - len(data)} bytes short, padding with zeros")
+        data = bytes(data) + bytes(needed - len(data))
+    rows = np.frombuffer(data, dtype=np.uint8, count=needed).reshape(height, row_bytes)
+
+    if bits == 8:
+        samples = rows
+    elif bits == 16:
+        samples = rows.view(">u2").astype(np.uint16) >> 8
+    else:
+        samples = np.unpackbits(rows, axis=1)
+        if bits > 1:
+            weights = 1 << np.arange(bits - 1, -1, -1, dtype=np.uint8)
+            samples = samples[:, :row_bytes * 8 // bits * bits].reshape(height, -1, bits) @ weights
+    return np.ascontiguousarray(samples[:, :width * components].astype(np.uint8, copy=False)).reshape(height, width, components)
+
+
+def _decode_with_pdfminer(image: dict) -> DecodedImage:
+    stream = image['stream']
+    attrs = stream.attrs
+    data = stream.get_data()
+    filters = _filters(attrs)
+
+    if any(f in _ENCODED_FILTERS for f in filters):
+        # JPEG/JPEG2000 are left encoded by pdfminer, only a codec can decode them
+        pil_image = Image.open(io.BytesIO(data))
+        if pil_image.mode not in ("L", "RGB"):
+            pil_image = pil_image.convert("RGB")
+        return DecodedImage(np.asarray(pil_image))
+
+    width, height = int(resolve1(attrs.get("Width"))), int(resolve1(attrs.get("Height")))
+    bits = 1 if attrs.get("ImageMask") else int(resolve1(attrs.get("BitsPerComponent", 8)))
+    components, palette, palette_components = _color_space(attrs)
+    samples = _unpack_samples(data, width, height, components, bits)
+
+    if palette is not None:
+        indices = np.minimum(samples[..., 0], len(palette) - 1)
+        return DecodedImage(_to_rgb_or_gray(palette[indices], palette_components))
+
+    if bits < 8:
+        # Scale 1, 2 and 4-bit samples to the full 0-255 range
+        samples = (samples.astype(np.uint16) * 255 // ((1 << bits) - 1)).astype(np.uint8)
+    decode = resolve1(attrs.get("Decode"))
+    if decode and len(decode) >= 2 and decode[0] > decode[1]:
+        # A [1 0] Decode array inverts the samples (for image masks: 1 paints instead of 0)
+        samples = 255 - samples
+    return DecodedImage(_to_rgb_or_gray(samples, components))
+
+
+class _PixmapView:
+    """ Exposes the samples of a MuPDF pixmap to NumPy without copying. The array keeps this object, and so the
+    pixmap that owns the memory, alive through its `base`. """
+
+    def __init__(self, pixmap):
+        self.pixmap = pixmap
+        if pixmap.n == 1:
+            shape, strides = (pixmap.height, pixmap.width), (pixmap.stride, 1)
+        else:
+            shape, strides = (pixmap.height, pixmap.width, pixmap.n), (pixmap.stride, pixmap.n, 1)
+        self.__array_interface__ = {"version": 3, "typestr": "|u1", "shape": shape, "strides": strides, "data": (pixmap.samples_ptr, True)}
+
+
+def decode_pixmap(pixmap) -> DecodedImage:
+    """ Converts a MuPDF pixmap to gray or RGB without alpha and exposes its samples without copying. """
+    fitz = load_fitz()
+    if pixmap.alpha:
+        pixmap = fitz.Pixmap(pixmap, 0)
+    if pixmap.n not in (1, 3):
+        pixmap = fitz.Pixmap(fitz.csRGB, pixmap)
+    return DecodedImage(np.asarray(_PixmapView(pixmap)))
+
+
+def decode_xref(fitz_doc, xref: int) -> DecodedImage:
+    """ Decodes the image XObject `xref` of an open PyMuPDF document with MuPDF. """
+    return decode_pixmap(load_fitz().Pixmap(fitz_doc, xref))
+
+
+def decode_image(image: dict, fitz_doc=None) -> DecodedImage:
+    """ Decodes a pdfplumber image to pixels ready for OCR.
+
+    The pdfminer stream is unpacked with NumPy, which covers Gray, RGB, CMYK, ICC, Indexed and 1/2/4/8/16-bit images,
+    and JPEG through Pillow; for these it is faster than MuPDF. When an open PyMuPDF document of the same file is given,
+    MuPDF decodes the image from its xref instead for CCITT, JBIG2 and JPEG2000 images, and whenever NumPy decoding fails.
+    """
+    xref = getattr(image['stream'], "objid", None)
+    use_mupdf = fitz_doc is not None and bool(xref)
+    if use_mupdf and any(f in _MUPDF_FILTERS for f in _filters(image['stream'].attrs)):
+        try:
+            return decode_xref(fitz_doc, xref)
+        except Exception:
+            logging.debug(f"MuPDF could not decode image xref {xref}, falling back to pdfminer", exc_info=True)
+            use_mupdf = False
+
+    try:
+        return _decode_with_pdfminer(image)
+    except Exception:
+        if not use_mupdf:
+            raise
+        logging.debug(f"Could not decode image xref {xref} from its pdfminer stream, decoding with MuPDF", exc_info=True)
+        return decode_xref(fitz_doc, xref)
+
+
+def open_fitz_document(path):
+    """ Opens a PDF with PyMuPDF for image decoding, or returns None when PyMuPDF is unavailable or fails. """
+    fitz = load_fitz()
+    if fitz is None:
+        return None
+    try:
+        return fitz.open(path)
+    except Exception:
+        logging.debug(f"PyMuPDF could not open {path}, decoding images with pdfminer", exc_info=True)
+        return None
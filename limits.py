@@ -0,0 +1,123 @@
+import logging
+import os
+import signal
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from classes import LimitsConfiguration, ProcessingStatus
+
+# Seconds a worker gets past a time limit to stop by itself and return its partial result, before it is killed
+KILL_GRACE_SECONDS = 10.0
+
+_progress_callback: Optional[Callable[[], None]] = None
+
+
+def set_progress_callback(callback: Optional[Callable[[], None]]):
+    """ Called by the process whenever it starts on a page, which lets a `workers.WorkerPool` tell a page that hangs
+    from a document that is merely long. """
+    global _progress_callback
+    _progress_callback = callback
+
+
+def report_progress():
+    if _progress_callback is not None:
+        _progress_callback()
+
+
+def rss_mb(pid: Optional[int] = None) -> Optional[float]:
+    """ The resident memory of a process (this one by default) in MB, or None where /proc is not available. """
+    try:
+        with open(f"/proc/{pid or 'self'}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class LimitExceeded(Exception):
+    """ A document ran out of time or memory, no further pages of it are processed. """
+
+    def __init__(self, status: ProcessingStatus, message: str):
+        super().__init__(message)
+        self.status: ProcessingStatus = status
+
+
+class _Alarm(BaseException):
+    # Not an Exception, so that the `except Exception` of the detectors and of the libraries they call cannot swallow it
+    def __init__(self, status: ProcessingStatus):
+        super().__init__(status.value)
+        self.status: ProcessingStatus = status
+
+
+class PageGuard:
+    """ Enforces the limits of one document from inside the process that processes it, so that it ends with a partial
+    result instead of hanging.
+
+    Every page runs under a timer for whatever is left of the page and document time limits. A page that runs out of
+    time is skipped and the next one started; once the document is out of time, or the process over its memory limit,
+    `LimitExceeded` stops it. Timers need SIGALRM and the main thread of the process, elsewhere the limits are only
+    checked between pages. Code that does not return to Python, e.g. MuPDF parsing a huge content stream, cannot be
+    interrupted at all: that is left to the `workers.WorkerPool` killing the worker.
+
+    The shards of a document share its time limit through `deadline`, a wall-clock time (`time.time()`) that holds
+    when it comes before the document time limit counted from now.
+    """
+
+    def __init__(self, limits: LimitsConfiguration, deadline: Optional[float] = None):
+        self.limits: LimitsConfiguration = limits
+        self.deadline: Optional[float] = time.monotonic() + limits.document_seconds if limits.document_seconds > 0 else None
+        if deadline is not None:
+            shared = time.monotonic() + deadline - time.time()
+            self.deadline = shared if self.deadline is None else min(self.deadline, shared)
+        self.status: ProcessingStatus = ProcessingStatus.COMPLETE
+        self.skipped_pages: list[int] = []
+        self._timers: bool = hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread()
+
+    def _exceeded(self, status: ProcessingStatus, message: str) -> LimitExceeded:
+        self.status = self.status.worst(status)
+        return LimitExceeded(status, message)
+
+    def check(self):
+        """ Raises `LimitExceeded` when the document is out of time or the process over its memory limit. """
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            raise self._exceeded(ProcessingStatus.TIMEOUT, f"took longer than {self.limits.document_seconds}s")
+        if self.limits.memory_mb > 0:
+            rss = rss_mb()
+            if rss is not None and rss > self.limits.memory_mb:
+                raise self._exceeded(ProcessingStatus.MEMORY_LIMIT, f"used {rss:.0f}MB of memory, more than {self.limits.memory_mb}MB")
+
+    @contextmanager
+    def page(self, page_number: int):
+        """ Runs the work on a page under the time limits, skipping the rest of the page when it runs out of time. """
+        self.check()
+        report_progress()
+        seconds, status = self.limits.page_seconds, ProcessingStatus.PAGE_TIMEOUT
+        if self.deadline is not None and (seconds <= 0 or self.deadline - time.monotonic() < seconds):
+            seconds, status = self.deadline - time.monotonic(), ProcessingStatus.TIMEOUT
+        try:
+            with self._timer(seconds, status):
+                yield
+        except _Alarm as alarm:
+            if alarm.status is ProcessingStatus.TIMEOUT:
+                raise self._exceeded(ProcessingStatus.TIMEOUT, f"took longer than {self.limits.document_seconds}s") from None
+            logging.warning(f"Page {page_number} took longer than {self.limits.page_seconds}s, skipping the rest of it")
+            self.skipped_pages.append(page_number)
+            self.status = self.status.worst(ProcessingStatus.PAGE_TIMEOUT)
+
+    @contextmanager
+    def _timer(self, seconds: float, status: ProcessingStatus):
+        if seconds <= 0 or not self._timers:
+            yield
+            return
+
+        def expire(signum, frame):
+            raise _Alarm(status)
+
+        previous = signal.signal(signal.SIGALRM, expire)
+        signal.setitimer(signal.ITIMER_REAL, seconds)
+        try:
+            yield
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
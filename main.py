@@ -1,41 +1,83 @@
 import argparse
-import multiprocessing as mp
+import os
 from pathlib import Path
 import logging
-from helpers import process_pdf
-import asyncio
 import json
-from classes import ExecutionConfiguration
+from backends import DEFAULT_ENGINE, ENGINES
+from cache import ResultCache
+from classes import CacheConfiguration, ExecutionConfiguration, LimitsConfiguration, OCRConfiguration, ProcessingResult, ProcessingStatus
+from discovery import DEFAULT_INCLUDE, ORDERS, discover_pdfs, schedule
+from executor import run_in_pool
+from profiling import METRICS_FILE, MetricsCollector
+from triage import SKIP_REASONS
+from server import parse_address, serve
+from results import JSON_RESULTS, JSONL_RESULTS, JsonlResultsWriter, recorded_paths
+from collections import Counter
+from typing import Iterable, Iterator
 
 logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Paths of the documents that came back partial, one per line, to be passed back as @output/retry.txt
+RETRY_LIST = "retry.txt"
+
+# OCR triage and budget of --fast, the --ocr-* options below still override them
+FAST_OCR = dict(min_image_side=48, max_aspect_ratio=15, min_entropy=0.3, text_layer_chars=10, max_images=50, max_seconds=60)
+
 def parse_args() -> ExecutionConfiguration:
-    parser = argparse.ArgumentParser(description="A simple command-line tool for extracting data from PDF files using regex patterns.")
-    parser.add_argument("files_or_directory", type=str, nargs="+", help="A path to a PDF file or a directory containing them.")
+    parser = argparse.ArgumentParser(description="A simple command-line tool for extracting data from PDF files using regex patterns.", fromfile_prefix_chars="@")
+    parser.add_argument("files_or_directory", type=str, nargs="*", help="A path to a PDF file or a directory containing them.")
+    parser.add_argument("--include", type=str, action="append", default=None, help=f"Glob of the files to process in directories, which are searched recursively; may be repeated (default: '{DEFAULT_INCLUDE[0]}', case-insensitive).")
+    parser.add_argument("--exclude", type=str, action="append", default=None, help="Glob of files and directories to leave out; may be repeated.")
+    parser.add_argument("--order", choices=ORDERS, default="discovery", help="Process documents as they are discovered, or largest first by file size or page count once discovery is done, which shortens the tail of a run (default: 'discovery').")
     parser.add_argument("-o", "--output_dir", type=str, default="output", help="Directory to save output files (default: 'output').", required=False)
     parser.add_argument("--debug", action="store_true", help="Enable debug mode for more verbose output.")
     parser.add_argument("--no-regex", action="store_true", help="Disable regex matching on provided documents.")
+    parser.add_argument("--engine", choices=list(ENGINES), default=DEFAULT_ENGINE, help=f"Library used to extract text, shapes and images (default: '{DEFAULT_ENGINE}').")
+    parser.add_argument("--ocr-languages", type=str, default="en,nl", help="Comma-separated easyocr language codes (default: 'en,nl').")
+    parser.add_argument("--ocr-batch-size", type=int, default=8, help="Number of images recognised per OCR batch (default: 8).")
+    parser.add_argument("--ocr-cache-size", type=int, default=4096, help="Number of OCR results of repeated images kept in memory per worker, 0 disables deduplication (default: 4096).")
+    parser.add_argument("--ocr-cache-path", type=str, default=None, help="SQLite file to persist OCR results of images across workers and runs (default: memory only).")
+    parser.add_argument("--ocr-min-side", type=int, default=None, help="Skip images smaller than this many pixels on either side (default: 20).")
+    parser.add_argument("--ocr-max-aspect", type=float, default=None, help="Skip images more elongated than this ratio of their sides, 0 disables the check (default: 40).")
+    parser.add_argument("--ocr-min-entropy", type=float, default=None, help="Skip images whose grey levels have less entropy than this many bits, 0 disables the check (default: 0.1).")
+    parser.add_argument("--ocr-text-layer-chars", type=int, default=None, help="Skip scans covering at least half of a page when this many chars of the page's text layer lie on top of them, 0 disables the check (default: 20).")
+    parser.add_argument("--ocr-max-images", type=int, default=None, help="Recognise at most this many images per document, 0 for no limit (default: 0).")
+    parser.add_argument("--ocr-max-seconds", type=float, default=None, help="Stop recognising images of a document after this many seconds of OCR, 0 for no limit (default: 0).")
+    parser.add_argument("--fast", action="store_true", help=f"Triage images more aggressively and cap OCR per document: {', '.join(f'{k}={v}' for k, v in FAST_OCR.items())}.")
+    parser.add_argument("--no-gpu", action="store_true", help="Run OCR on the CPU even when a GPU is available.")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the result cache in the output directory.")
+    parser.add_argument("--rebuild-cache", action="store_true", help="Reprocess every document and overwrite its cached result.")
+    parser.add_argument("--cache-max-size", type=float, default=1024, help="Evict least recently used cache entries above this size in MB, 0 for no limit (default: 1024).")
+    parser.add_argument("--cache-max-age", type=float, default=30, help="Evict cache entries not used for this many days, 0 for no limit (default: 30).")
+    parser.add_argument("--jsonl", action="store_true", help=f"Append each result to {JSONL_RESULTS} as soon as it is done instead of writing {JSON_RESULTS} at the end.")
+    parser.add_argument("--resume", action="store_true", help=f"Skip documents already recorded in {JSONL_RESULTS} of the output directory (implies --jsonl).")
+    parser.add_argument("--fsync-interval", type=float, default=5.0, help=f"Seconds between fsyncs of {JSONL_RESULTS}, 0 to fsync every result (default: 5).")
+    parser.add_argument("--page-text", action="store_true", help="Keep the text of every page once per result under 'page_texts'; findings only hold a snippet around the match and its offsets.")
+    parser.add_argument("--profile", action="store_true", help=f"Measure wall time, CPU time and peak memory growth of every stage per page, add a summary to each result and write {METRICS_FILE} in Prometheus format.")
+    parser.add_argument("--shard-pages", type=int, default=200, help="Split documents with more pages than this into shards of this many pages that run on separate workers, 0 never splits (default: 200).")
+    parser.add_argument("--page-timeout", type=float, default=0, help="Skip the rest of a page after this many seconds, 0 for no limit (default: 0).")
+    parser.add_argument("--doc-timeout", type=float, default=0, help="Stop processing a document after this many seconds and keep its partial findings, 0 for no limit (default: 0). The shards of a document split by --shard-pages share this time, from when the first one is handed to the workers.")
+    parser.add_argument("--max-memory", type=float, default=0, help="Stop processing a document once its worker uses more than this many MB of memory and recycle the worker, 0 for no limit (default: 0). Applies to the worker of each shard of a document separately.")
+    parser.add_argument("--serve", type=str, metavar="ADDRESS", default=None, help="Instead of processing the given files, keep the OCR model and workers warm and scan documents sent to POST /scan; ADDRESS is a Unix socket path or [HOST:]PORT on localhost.")
+    parser.add_argument("--allow-remote", action="store_true", help="Let --serve bind to a HOST other than a loopback address; anyone who can reach it can have any file the server can read scanned.")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1, help="Number of worker processes; 0 processes documents in the main process (default: CPU count).")
     
     args = parser.parse_args()
+    if not args.files_or_directory and not args.serve:
+        parser.error("the following arguments are required: files_or_directory")
+    if args.serve:
+        parse_address(args.serve, args.allow_remote)
     
     files_or_directory = [ Path(f) for f in args.files_or_directory ]
     has_only_valid_paths = all([ f.is_dir() or f.is_file() for f in files_or_directory ])
     if not has_only_valid_paths:
         raise ValueError("One or more paths are invalid. ")
     
-    pdf_files = []
     for fp in files_or_directory:
-        if fp.is_dir():
-            pdf_files += list(fp.glob("*.pdf"))
-            logging.debug(f"Found {len(pdf_files)} PDF files in directory: {fp}")
-        elif fp.is_file() and fp.suffix.lower() == ".pdf":
-            pdf_files += [fp]
-            logging.debug(f"Processing single PDF file: {fp}")
-        else:
+        if not fp.is_dir() and fp.suffix.lower() != ".pdf":
             raise ValueError(f"Invalid input: {fp}. Please provide a valid PDF file or directory containing PDF files.")
-
-    if not pdf_files:
-        raise ValueError(f"No PDF files found in the provided paths. Please check the path and try again.")
+    # Directories are only scanned while the documents are being processed
+    pdf_files = discover_pdfs(files_or_directory, args.include, args.exclude)
     
     if args.debug:
         logging.getLogger().setLevel(logging.DEBUG)
@@ -47,35 +89,155 @@ def parse_args() -> ExecutionConfiguration:
         output_dir = Path(Path.cwd())
     logging.debug(f"Output will be placed in: {output_dir}")
 
-    return ExecutionConfiguration(pdf_files, output_dir, do_execute_regex=(not args.no_regex))
+    if args.workers < 0:
+        raise ValueError(f"Invalid number of workers: {args.workers}")
+    if args.shard_pages < 0:
+        raise ValueError(f"Invalid shard size: {args.shard_pages}")
+    if args.ocr_batch_size < 1:
+        raise ValueError(f"Invalid OCR batch size: {args.ocr_batch_size}")
+    for name, value in (("page timeout", args.page_timeout), ("document timeout", args.doc_timeout), ("memory limit", args.max_memory)):
+        if value < 0:
+            raise ValueError(f"Invalid {name}: {value}")
 
-async def run_in_thread(**kwargs):
-    loop = asyncio.get_running_loop()
-    try:
-        return await loop.run_in_executor(None, lambda: asyncio.run(process_pdf(**kwargs)))
-    except Exception as e:
-        logging.error(f"Error processing PDF {kwargs.get('pdf_path')}: {e}", exc_info=True)
-        return None
-    
-async def process_all_pdfs(config: ExecutionConfiguration):
-    tasks = [run_in_thread(pdf_path=path, do_regex=config.do_execute_regex, output_path=config.output_dir) for path in config.pdf_files]
-    results = await asyncio.gather(*tasks, return_exceptions=True)
-    return [res for res in results if res is not None]
+    triage = dict(FAST_OCR) if args.fast else {}
+    options = dict(min_image_side=args.ocr_min_side, max_aspect_ratio=args.ocr_max_aspect, min_entropy=args.ocr_min_entropy,
+                   text_layer_chars=args.ocr_text_layer_chars, max_images=args.ocr_max_images, max_seconds=args.ocr_max_seconds)
+    for name, value in options.items():
+        if value is not None:
+            if value < 0:
+                raise ValueError(f"Invalid OCR triage setting {name}: {value}")
+            triage[name] = value
+
+    ocr = OCRConfiguration(
+        languages=[lang.strip() for lang in args.ocr_languages.split(",") if lang.strip()],
+        batch_size=args.ocr_batch_size,
+        gpu=(not args.no_gpu),
+        cache_size=args.ocr_cache_size,
+        cache_path=Path(args.ocr_cache_path) if args.ocr_cache_path else None,
+        **triage,
+    )
+
+    cache = CacheConfiguration(
+        output_dir / "results_cache.sqlite",
+        enabled=(not args.no_cache),
+        rebuild=args.rebuild_cache,
+        max_size_mb=args.cache_max_size,
+        max_age_days=args.cache_max_age,
+    )
+
+    return ExecutionConfiguration(
+        pdf_files, output_dir,
+        do_execute_regex=(not args.no_regex),
+        workers=args.workers,
+        ocr=ocr,
+        cache=cache,
+        stream_results=(args.jsonl or args.resume),
+        resume=args.resume,
+        fsync_interval=args.fsync_interval,
+        engine=args.engine,
+        profile=args.profile,
+        shard_pages=args.shard_pages,
+        keep_page_text=args.page_text,
+        order=args.order,
+        serve=args.serve,
+        allow_remote=args.allow_remote,
+        limits=LimitsConfiguration(page_seconds=args.page_timeout, document_seconds=args.doc_timeout, memory_mb=args.max_memory),
+    )
+
+def process_pdf_kwargs(config: ExecutionConfiguration) -> dict:
+    return dict(do_regex=config.do_execute_regex, output_path=config.output_dir, ocr_config=config.ocr, cache_config=config.cache, engine=config.engine, profile=config.profile, keep_page_text=config.keep_page_text, limits=config.limits)
+
+def process_all_pdfs(config: ExecutionConfiguration, pdf_files: Iterable[Path]) -> Iterator[ProcessingResult]:
+    yield from run_in_pool(pdf_files, process_pdf_kwargs(config), workers=config.workers, shard_pages=config.shard_pages)
+
+def _not_recorded(pdf_files: Iterable[Path], done: set[str], counts: Counter) -> Iterator[Path]:
+    for pdf_path in pdf_files:
+        counts["found"] += 1
+        if pdf_path.as_posix() in done:
+            counts["skipped"] += 1
+        else:
+            yield pdf_path
+
+def _write_retry_list(path: Path, partial: list[str]):
+    if not partial:
+        # Left over from an earlier run
+        if path.exists():
+            path.unlink()
+        return
+    with open(path, "w") as f:
+        f.writelines(pdf_path + "\n" for pdf_path in partial)
+    logging.warning(f"{len(partial)} PDF files exceeded the limits and have partial results, listed in {path}")
 
 def main():
     config = parse_args()
-    logging.info(f"Starting processing of {len(config.pdf_files)} PDF files...")
-
+    if config.serve:
+        serve(config.serve, process_pdf_kwargs(config), config.workers, config.shard_pages, config.allow_remote)
+        return
+    counts = Counter()
+    done = recorded_paths(config.output_dir / JSONL_RESULTS) if config.resume else set()
+    pdf_files = schedule(_not_recorded(config.pdf_files, done, counts), config.order, config.engine)
+    logging.info(f"Starting processing with {config.workers} workers...")
 
-    loop = asyncio.get_event_loop()
+    results = []
+    writer = JsonlResultsWriter(config.output_dir / JSONL_RESULTS, config.fsync_interval) if config.stream_results else None
+    succeeded = 0
+    failures = 0
+    partial: list[str] = []
+    stats = Counter()
+    metrics = MetricsCollector() if config.profile else None
     try:
-        results = loop.run_until_complete(process_all_pdfs(config))
+        for result in process_all_pdfs(config, pdf_files):
+            if result.ok:
+                logging.debug(f"Finished processing PDF: {result.pdf_path}")
+                succeeded += 1
+                if result.scanned_pdf.status is not ProcessingStatus.COMPLETE:
+                    partial.append(result.scanned_pdf.path)
+                stats.update(result.scanned_pdf.stats)
+                if metrics:
+                    metrics.add(result.scanned_pdf.path, result.scanned_pdf.profile)
+                if writer:
+                    writer.write(result.scanned_pdf)
+                else:
+                    results.append(result.scanned_pdf)
+            else:
+                failures += 1
+                if metrics:
+                    metrics.add_failure()
+                logging.error(f"Error processing PDF {result.pdf_path}:\n{result.error}")
     except Exception as e:
         logging.error(f"An error occurred during processing: {e}", exc_info=True)
         return
+    finally:
+        if writer:
+            writer.close()
+
+    if not counts["found"]:
+        raise ValueError(f"No PDF files found in the provided paths. Please check the path and try again.")
+    if counts["skipped"]:
+        logging.info(f"Resumed: skipped {counts['skipped']} PDF files already in {JSONL_RESULTS}")
+    if failures:
+        logging.warning(f"Failed to process {failures} of {failures + succeeded} PDF files.")
+    _write_retry_list(config.output_dir / RETRY_LIST, partial)
+
+    ocr_lookups = stats["ocr_cache_hits"] + stats["ocr_cache_misses"]
+    if ocr_lookups:
+        logging.info(f"OCR dedup cache: {stats['ocr_cache_hits']} hits, {stats['ocr_cache_misses']} misses ({stats['ocr_cache_hits'] / ocr_lookups:.0%} hit rate)")
+    if stats["ocr_skipped"]:
+        reasons = ", ".join(f"{stats[f'ocr_skipped_{reason}']} {reason}" for reason in SKIP_REASONS if stats[f"ocr_skipped_{reason}"])
+        logging.info(f"OCR triage skipped {stats['ocr_skipped']} images: {reasons}")
+
+    if metrics:
+        metrics.write(config.output_dir / METRICS_FILE)
+        logging.info(f"Wrote profiling metrics to {config.output_dir / METRICS_FILE}")
+
+    if config.cache.enabled:
+        cache = ResultCache(config.cache.path)
+        cache.evict(config.cache.max_size_mb, config.cache.max_age_days)
+        cache.close()
 
-    with open(config.output_dir / "results.json", "w") as f:
-        json.dump([pdf.to_dict() for pdf in results], f, indent=4)
+    if not writer:
+        with open(config.output_dir / JSON_RESULTS, "w") as f:
+            json.dump([pdf.to_dict() for pdf in results], f, indent=4)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
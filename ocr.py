@@ -0,0 +1,138 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from itertools import groupby
+from pathlib import Path
+from typing import Any, Optional
+
+import numpy as np
+
+from classes import OCRConfiguration
+
+
+def _accelerator_available() -> bool:
+    try:
+        import torch
+    except ImportError:
+        return False
+    if torch.cuda.is_available():
+        return True
+    mps = getattr(torch.backends, "mps", None)
+    return bool(mps and mps.is_available())
+
+
+class OCRService:
+    """ A long-lived easyocr reader. The model is loaded on first use and kept for the lifetime of the process. """
+
+    def __init__(self, config: OCRConfiguration):
+        self.config: OCRConfiguration = config
+        self._reader: Optional[Any] = None
+
+    @property
+    def reader(self) -> 'easyocr.Reader':
+        if self._reader is None:
+            # easyocr pulls in torch, it is only imported when the first image needs OCR
+            import easyocr
+
+            gpu = self.config.gpu and _accelerator_available()
+            if self.config.gpu and not gpu:
+                logging.info("No GPU available for OCR, falling back to CPU")
+            logging.info(f"Loading OCR model for languages {self.config.languages} (gpu={gpu})")
+            self._reader = easyocr.Reader(self.config.languages, gpu=gpu, verbose=False)
+        return self._reader
+
+    def readtext_batch(self, images: list[np.ndarray]) -> list[list[str]]:
+        """ Runs OCR on a batch of decoded images and returns the recognised text lines of each image, in input order.
+
+        easyocr can only run detection on a batch of equally shaped images, so images are grouped by shape; every group
+        with more than one image goes through `readtext_batched`, recognition is batched with the configured batch size.
+        """
+        results: list[list[str]] = [[] for _ in images]
+        order = sorted(range(len(images)), key=lambda i: images[i].shape)
+        for _, group in groupby(order, key=lambda i: images[i].shape):
+            indices = list(group)
+            if len(indices) == 1:
+                batch_text = [self.reader.readtext(images[indices[0]], detail=0, batch_size=self.config.batch_size)]
+            else:
+                batch_text = self.reader.readtext_batched([images[i] for i in indices], detail=0, batch_size=self.config.batch_size)
+            for i, text in zip(indices, batch_text):
+                results[i] = text
+        return results
+
+
+_services: dict[tuple, OCRService] = {}
+
+
+def get_ocr_service(config: OCRConfiguration) -> OCRService:
+    """ Returns the OCR service of this process for the given configuration, creating it on first use. """
+    key = (tuple(config.languages), config.batch_size, config.gpu)
+    if key not in _services:
+        _services[key] = OCRService(config)
+    return _services[key]
+
+
+def image_key(data: bytes, attributes: tuple, languages: list[str]) -> str:
+    """ Identifies an image by its stream data and the attributes needed to decode it, before it is decoded. """
+    digest = hashlib.sha256(data)
+    digest.update(repr((*attributes, languages)).encode())
+    return digest.hexdigest()
+
+
+class OCRResultCache:
+    """ Remembers the OCR text of images by `image_key`, so repeated images (logos, stamps) are only recognised once.
+
+    Keeps up to `max_entries` results in an in-memory LRU and, when a path is given, also in a SQLite file that is
+    shared by all workers and later runs. Both are shared by the threads of the process, such as the request threads
+    of a `--serve` server without workers.
+    """
+
+    def __init__(self, max_entries: int, path: Optional[Path] = None):
+        self.max_entries: int = max_entries
+        self._entries: OrderedDict[str, list[str]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS ocr_results (key TEXT PRIMARY KEY, text TEXT NOT NULL)")
+
+    def get(self, key: str) -> Optional[list[str]]:
+        with self._lock:
+            text = self._entries.get(key)
+            if text is not None:
+                self._entries.move_to_end(key)
+            elif self._connection is not None:
+                row = self._connection.execute("SELECT text FROM ocr_results WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    text = json.loads(row[0])
+                    self._remember(key, text)
+        return text
+
+    def put(self, key: str, text: list[str]):
+        with self._lock:
+            self._remember(key, text)
+            if self._connection is not None:
+                self._connection.execute("INSERT OR REPLACE INTO ocr_results (key, text) VALUES (?, ?)", (key, json.dumps(text)))
+
+    def _remember(self, key: str, text: list[str]):
+        self._entries[key] = text
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+_caches: dict[tuple, OCRResultCache] = {}
+
+
+def get_ocr_cache(config: OCRConfiguration) -> Optional[OCRResultCache]:
+    """ Returns the OCR result cache of this process, or None when deduplication is disabled. """
+    if config.cache_size <= 0:
+        return None
+    key = (config.cache_size, config.cache_path)
+    if key not in _caches:
+        _caches[key] = OCRResultCache(config.cache_size, config.cache_path)
+    return _caches[key]
@@ -0,0 +1,194 @@
+import logging
+import re
+from typing import Iterator, NamedTuple, Optional
+
+try:
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_constants
+    import sre_parse
+
+_DIGIT = re.compile(r"\d")
+# Candidate chars that split the text into windows for anchored patterns, see `_CompiledPattern.anchor`
+_SEPARATORS = "\n\r\t "
+_REPEATS = (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT, getattr(sre_constants, "POSSESSIVE_REPEAT", None))
+_DIGIT_CATEGORIES = (sre_constants.CATEGORY_DIGIT,)
+_NON_SPACE_CATEGORIES = (sre_constants.CATEGORY_DIGIT, sre_constants.CATEGORY_WORD, sre_constants.CATEGORY_NOT_SPACE)
+
+
+class PIIMatch(NamedTuple):
+    kind: str
+    text: str
+    start: int
+    end: int
+
+
+def _is_ascii_digit(char: str) -> bool:
+    return "0" <= char <= "9"
+
+
+def _is_digit_set(items) -> bool:
+    """ True if a character set `[...]` can only match digits. """
+    for op, av in items:
+        if op is sre_constants.LITERAL and _is_ascii_digit(chr(av)):
+            continue
+        if op is sre_constants.RANGE and 48 <= av[0] <= av[1] <= 57:
+            continue
+        if op is sre_constants.CATEGORY and av in _DIGIT_CATEGORIES:
+            continue
+        return False
+    return bool(items)
+
+
+def _caseless(char: str) -> bool:
+    """ True if case-insensitive matching cannot match `char` with any other char. """
+    return char.lower() == char.upper() == char.casefold()
+
+
+def _ignorecase(av, ignorecase: bool) -> bool:
+    """ Whether the body of a group `(?flags:...)` is matched case-insensitively. """
+    _, add_flags, del_flags, _ = av
+    return (ignorecase or bool(add_flags & sre_constants.SRE_FLAG_IGNORECASE)) and not del_flags & sre_constants.SRE_FLAG_IGNORECASE
+
+
+def _required(items, ignorecase: bool = False) -> tuple[set[str], bool]:
+    """ Returns the literal chars every match must contain, and whether every match must contain a digit. Under
+    IGNORECASE only literals without a case are required, the text may hold them in either case. """
+    literals: set[str] = set()
+    needs_digit = False
+    for op, av in items:
+        if op is sre_constants.LITERAL:
+            if not ignorecase or _caseless(chr(av)):
+                literals.add(chr(av))
+            needs_digit |= _is_ascii_digit(chr(av))
+        elif op is sre_constants.IN:
+            needs_digit |= _is_digit_set(av)
+        elif op is sre_constants.SUBPATTERN:
+            sub_literals, sub_digit = _required(av[-1], _ignorecase(av, ignorecase))
+            literals |= sub_literals
+            needs_digit |= sub_digit
+        elif op in _REPEATS and av[0] >= 1:
+            sub_literals, sub_digit = _required(av[2], ignorecase)
+            literals |= sub_literals
+            needs_digit |= sub_digit
+        elif op is sre_constants.BRANCH:
+            branches = [_required(branch, ignorecase) for branch in av[1]]
+            literals |= set.intersection(*(branch_literals for branch_literals, _ in branches))
+            needs_digit |= all(branch_digit for _, branch_digit in branches)
+    return literals, needs_digit
+
+
+def _set_may_match(items, chars: str) -> bool:
+    for op, av in items:
+        if op is sre_constants.LITERAL:
+            if chr(av) in chars:
+                return True
+        elif op is sre_constants.RANGE:
+            if any(av[0] <= ord(c) <= av[1] for c in chars):
+                return True
+        elif op is sre_constants.CATEGORY:
+            if av not in _NON_SPACE_CATEGORIES:
+                return True
+        else:
+            return True
+    return False
+
+
+def _may_match(items, chars: str, ignorecase: bool = False) -> bool:
+    """ Conservatively determines whether a match could contain any of `chars`. Anything not understood counts as yes. """
+    if ignorecase and not all(_caseless(c) for c in chars):
+        return True
+    for op, av in items:
+        if op is sre_constants.LITERAL:
+            if chr(av) in chars:
+                return True
+        elif op is sre_constants.IN:
+            if _set_may_match(av, chars):
+                return True
+        elif op is sre_constants.SUBPATTERN:
+            if _may_match(av[-1], chars, _ignorecase(av, ignorecase)):
+                return True
+        elif op in _REPEATS:
+            if _may_match(av[2], chars, ignorecase):
+                return True
+        elif op is sre_constants.BRANCH:
+            if any(_may_match(branch, chars, ignorecase) for branch in av[1]):
+                return True
+        else:
+            # ANY, NOT_LITERAL, anchors, lookarounds, back references, ...
+            return True
+    return False
+
+
+class _CompiledPattern:
+    def __init__(self, kind: str, pattern: str):
+        self.kind: str = kind
+        self.regex: re.Pattern = re.compile(pattern)
+        self.literals: str = ""
+        self.needs_digit: bool = False
+        # Chars no match can contain. If the pattern also has a required literal, only the windows between
+        # separators around occurrences of that literal need to be searched.
+        self.separators: str = ""
+        self._separator: Optional[re.Pattern] = None
+
+        try:
+            parsed = sre_parse.parse(pattern)
+            # Scoped flags, (?i:...), are handled per group
+            ignorecase = bool(parsed.state.flags & sre_constants.SRE_FLAG_IGNORECASE)
+            literals, self.needs_digit = _required(parsed, ignorecase)
+            self.literals = "".join(sorted(literals))
+            self.separators = "".join(c for c in _SEPARATORS if not _may_match(parsed, c, ignorecase))
+            if self.separators:
+                self._separator = re.compile(f"[{re.escape(self.separators)}]")
+        except Exception:
+            logging.debug(f"Could not derive prefilters for PII pattern '{kind}', it will always be run", exc_info=True)
+            self.literals, self.needs_digit, self.separators, self._separator = "", False, "", None
+
+    def windows(self, text: str, anchor: Optional[str]) -> Iterator[tuple[int, int]]:
+        """ Yields the (start, end) ranges of `text` that can contain a match. """
+        if anchor is None or self._separator is None:
+            yield 0, len(text)
+            return
+
+        end = 0
+        position = text.find(anchor)
+        while position != -1:
+            start = max(max(text.rfind(c, end, position) for c in self.separators) + 1, end)
+            separator = self._separator.search(text, position)
+            end = separator.start() if separator else len(text)
+            yield start, end
+            position = text.find(anchor, end)
+
+
+class PIIScanner:
+    """ Matches a set of PII patterns against a text.
+
+    Each pattern is analysed once for the literal chars and digits every match must contain, so patterns that cannot
+    match are skipped after a cheap containment test. Patterns with a required literal that cannot match line breaks
+    (such as the '@' in an email address) are only run on the lines around the rarest of those literals, which avoids
+    backtracking through long runs of text that cannot match.
+    """
+
+    def __init__(self, patterns: dict[str, str]):
+        self.patterns: list[_CompiledPattern] = [_CompiledPattern(kind, pattern) for kind, pattern in patterns.items()]
+
+    def scan(self, text: str) -> Iterator[PIIMatch]:
+        """ Yields every match, grouped per pattern in definition order and ordered by offset within a pattern. """
+        has_digit = None
+        for pattern in self.patterns:
+            if pattern.needs_digit:
+                if has_digit is None:
+                    has_digit = _DIGIT.search(text) is not None
+                if not has_digit:
+                    continue
+            anchor = None
+            if pattern.literals:
+                counts = {c: text.count(c) for c in pattern.literals}
+                anchor = min(counts, key=counts.get)
+                if not counts[anchor]:
+                    continue
+
+            for start, end in pattern.windows(text, anchor):
+                for match in pattern.regex.finditer(text, start, end):
+                    if match.end() > match.start():
+                        yield PIIMatch(pattern.kind, match.group(0), match.start(), match.end())
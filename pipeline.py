@@ -0,0 +1,82 @@
+import logging
+from contextlib import nullcontext
+from typing import Any, Optional
+
+from classes import PossibleArtifactFinding
+from limits import LimitExceeded, PageGuard
+from profiling import Profiler, measure
+
+
+class PageDetector:
+    """ A detector that is run against each page of a document by the `PagePipeline`.
+
+    Detectors only get to see one page at a time and must not keep references to it: the page's layout cache is
+    released as soon as every detector has visited it. Findings are collected in `self.findings`.
+    """
+    name = "detector"
+
+    def __init__(self):
+        self.findings: list[PossibleArtifactFinding] = []
+
+    def visit_page(self, page: Any, is_last_page: bool):
+        raise NotImplementedError
+
+    def finish(self):
+        """ Called once after the last page, for detectors that buffer work across pages. """
+        pass
+
+
+class PagePipeline:
+    """ Parses each page of a document once and runs every registered detector against it.
+
+    With a `Profiler`, parsing the layout of each page and every detector's visit are measured as separate stages.
+    With a `PageGuard`, every page runs under the time and memory limits of the document: a page that runs out of time
+    is skipped, and a document that does stops with the findings collected so far.
+    """
+
+    def __init__(self, detectors: list[PageDetector], profiler: Optional[Profiler] = None, guard: Optional[PageGuard] = None):
+        self.detectors: list[PageDetector] = detectors
+        self.profiler: Optional[Profiler] = profiler
+        self.guard: Optional[PageGuard] = guard
+
+    def run(self, pdf, pages: Optional[slice] = None) -> list[PossibleArtifactFinding]:
+        """ Visits every page of `pdf`, or the page indices in `pages`, and returns the findings of all detectors, grouped
+        per detector in registration order. `is_last_page` always refers to the last page of the whole document. """
+        page_count = len(pdf.pages)
+        indices = range(page_count)[pages] if pages is not None else range(page_count)
+        try:
+            for i in indices:
+                page = pdf.pages[i]
+                with self._limited(page.page_number):
+                    try:
+                        with measure(self.profiler, "layout", page.page_number):
+                            page.load()
+                        for detector in self.detectors:
+                            with measure(self.profiler, detector.name, page.page_number):
+                                self._call(detector, pdf, page.page_number, detector.visit_page, page, i == page_count - 1)
+                    finally:
+                        # Drop the parsed layout of this page, peak memory should not grow with the page count
+                        page.close()
+
+            last_page_number = indices[-1] + 1 if indices else page_count
+            # Work left over after the last page (e.g. a partial OCR batch) is accounted to the last page
+            with self._limited(last_page_number):
+                for detector in self.detectors:
+                    with measure(self.profiler, detector.name, last_page_number):
+                        self._call(detector, pdf, last_page_number, detector.finish)
+        except LimitExceeded as e:
+            logging.warning(f"Stopped processing PDF: {pdf.path.as_posix()}, it {e}. Keeping the findings collected so far")
+
+        return [finding for detector in self.detectors for finding in detector.findings]
+
+    def _limited(self, page_number: int):
+        return self.guard.page(page_number) if self.guard is not None else nullcontext()
+
+    @staticmethod
+    def _call(detector: PageDetector, pdf, page_number: int, fn, *args):
+        try:
+            fn(*args)
+        except Exception as e:
+            errmsg = f"Error in {detector.name} detector on page {page_number} of PDF: {pdf.path.as_posix()}"
+            logging.error(errmsg, exc_info=True)
+            raise RuntimeError(errmsg) from e
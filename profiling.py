@@ -0,0 +1,241 @@
+import heapq
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Optional
+
+try:
+    import resource
+except ImportError:  # not available on Windows, peak memory growth is then reported as 0
+    resource = None
+
+METRICS_FILE = "metrics.prom"
+
+# Upper bounds in seconds of the histogram buckets, shared by the per-document summaries and the aggregated metrics
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SLOWEST = 5
+
+
+def _peak_rss_kb() -> int:
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def _bucket(seconds: float) -> int:
+    for i, bound in enumerate(BUCKETS):
+        if seconds <= bound:
+            return i
+    return len(BUCKETS)
+
+
+class StageStats:
+    def __init__(self):
+        self.calls: int = 0
+        self.wall_seconds: float = 0.0
+        self.cpu_seconds: float = 0.0
+        self.peak_rss_growth_kb: int = 0
+        self.max_wall_seconds: float = 0.0
+        self.buckets: list[int] = [0] * (len(BUCKETS) + 1)
+
+    def add(self, wall: float, cpu: float, rss_growth_kb: int):
+        self.calls += 1
+        self.wall_seconds += wall
+        self.cpu_seconds += cpu
+        self.peak_rss_growth_kb += rss_growth_kb
+        self.max_wall_seconds = max(self.max_wall_seconds, wall)
+        self.buckets[_bucket(wall)] += 1
+
+    def to_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "wall_seconds": round(self.wall_seconds, 6),
+            "cpu_seconds": round(self.cpu_seconds, 6),
+            "peak_rss_growth_kb": self.peak_rss_growth_kb,
+            "max_wall_seconds": round(self.max_wall_seconds, 6),
+            "buckets": self.buckets,
+        }
+
+
+class Profiler:
+    """ Records wall time, CPU time and growth of the peak RSS of every stage of `process_pdf`, per page.
+
+    A stage is measured per call: once per page for the detectors and layout parsing, once per document for opening it.
+    Peak RSS only grows when a stage needs more memory than any stage before it in this process, so it points at the
+    stages that drive memory use rather than measuring every allocation.
+    """
+
+    def __init__(self):
+        self.stages: dict[str, StageStats] = {}
+        self.page_seconds: dict[int, float] = {}
+        self.page_slowest_stage: dict[int, tuple[float, str]] = {}
+
+    @contextmanager
+    def measure(self, stage: str, page_number: Optional[int] = None):
+        wall, cpu, rss = time.perf_counter(), time.process_time(), _peak_rss_kb()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            self.stages.setdefault(stage, StageStats()).add(wall, cpu, _peak_rss_kb() - rss)
+            if page_number is not None:
+                self.page_seconds[page_number] = self.page_seconds.get(page_number, 0.0) + wall
+                if wall > self.page_slowest_stage.get(page_number, (-1.0, ""))[0]:
+                    self.page_slowest_stage[page_number] = (wall, stage)
+
+    def summary(self) -> dict:
+        """ The profile attached to a document's result: totals and a histogram per stage, and its slowest pages. """
+        slowest = heapq.nlargest(SLOWEST, self.page_seconds.items(), key=lambda item: item[1])
+        return {
+            "wall_seconds": round(sum(stage.wall_seconds for stage in self.stages.values()), 6),
+            "cpu_seconds": round(sum(stage.cpu_seconds for stage in self.stages.values()), 6),
+            "pages": len(self.page_seconds),
+            "stages": {name: stage.to_dict() for name, stage in self.stages.items()},
+            "slowest_pages": [
+                {"page": page, "wall_seconds": round(seconds, 6), "slowest_stage": self.page_slowest_stage[page][1]}
+                for page, seconds in slowest
+            ],
+        }
+
+
+def merge_profiles(profiles: list[dict]) -> dict:
+    """ Combines the summaries of the shards of one document. Times are summed over the shards, which ran in parallel,
+    so the document's `wall_seconds` is the work spent on it rather than how long it took. """
+    stages: dict[str, dict] = {}
+    for profile in profiles:
+        for name, data in profile["stages"].items():
+            stage = stages.setdefault(name, {"calls": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0, "peak_rss_growth_kb": 0, "max_wall_seconds": 0.0, "buckets": [0] * (len(BUCKETS) + 1)})
+            stage["calls"] += data["calls"]
+            stage["wall_seconds"] = round(stage["wall_seconds"] + data["wall_seconds"], 6)
+            stage["cpu_seconds"] = round(stage["cpu_seconds"] + data["cpu_seconds"], 6)
+            stage["peak_rss_growth_kb"] += data["peak_rss_growth_kb"]
+            stage["max_wall_seconds"] = max(stage["max_wall_seconds"], data["max_wall_seconds"])
+            stage["buckets"] = [a + b for a, b in zip(stage["buckets"], data["buckets"])]
+    slowest = [page for profile in profiles for page in profile["slowest_pages"]]
+    return {
+        "wall_seconds": round(sum(profile["wall_seconds"] for profile in profiles), 6),
+        "cpu_seconds": round(sum(profile["cpu_seconds"] for profile in profiles), 6),
+        "pages": sum(profile["pages"] for profile in profiles),
+        "stages": stages,
+        "slowest_pages": heapq.nlargest(SLOWEST, slowest, key=lambda page: page["wall_seconds"]),
+        "shards": len(profiles),
+    }
+
+
+def measure(profiler: Optional[Profiler], stage: str, page_number: Optional[int] = None):
+    """ `profiler.measure(...)`, or nothing at all when profiling is off. """
+    return profiler.measure(stage, page_number) if profiler else nullcontext()
+
+
+def _label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class MetricsCollector:
+    """ Aggregates the profiles of many documents and writes them as Prometheus text exposition format. """
+
+    def __init__(self, slowest: int = 10):
+        self.slowest: int = slowest
+        self.documents: int = 0
+        self.failed: int = 0
+        self.cached: int = 0
+        self.pages: int = 0
+        self.stages: dict[str, StageStats] = {}
+        self.document_buckets: list[int] = [0] * (len(BUCKETS) + 1)
+        self.document_seconds: float = 0.0
+        self.slowest_documents: list[tuple[float, str]] = []
+        self.slowest_pages: list[tuple[float, str, int, str]] = []
+
+    def add(self, path: str, profile: Optional[dict]):
+        self.documents += 1
+        if not profile:
+            return
+        if profile.get("cached"):
+            self.cached += 1
+        self.pages += profile["pages"]
+        self.document_seconds += profile["wall_seconds"]
+        self.document_buckets[_bucket(profile["wall_seconds"])] += 1
+        for name, data in profile["stages"].items():
+            stage = self.stages.setdefault(name, StageStats())
+            stage.calls += data["calls"]
+            stage.wall_seconds += data["wall_seconds"]
+            stage.cpu_seconds += data["cpu_seconds"]
+            stage.peak_rss_growth_kb += data["peak_rss_growth_kb"]
+            stage.max_wall_seconds = max(stage.max_wall_seconds, data["max_wall_seconds"])
+            stage.buckets = [a + b for a, b in zip(stage.buckets, data["buckets"])]
+
+        self._keep_slowest(self.slowest_documents, (profile["wall_seconds"], path))
+        for page in profile["slowest_pages"]:
+            self._keep_slowest(self.slowest_pages, (page["wall_seconds"], path, page["page"], page["slowest_stage"]))
+
+    def add_failure(self):
+        self.failed += 1
+
+    def _keep_slowest(self, heap: list, item: tuple):
+        if len(heap) < self.slowest:
+            heapq.heappush(heap, item)
+        else:
+            heapq.heappushpop(heap, item)
+
+    @staticmethod
+    def _histogram(lines: list[str], name: str, buckets: list[int], total: float, labels: str = ""):
+        cumulative = 0
+        for bound, count in zip([*BUCKETS, "+Inf"], buckets):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels}{"," if labels else ""}le="{bound}"}} {cumulative}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {total:.6f}")
+        lines.append(f"{name}_count{suffix} {cumulative}")
+
+    def to_prometheus(self) -> str:
+        lines = [
+            "# HELP pdf_scraper_documents_total Documents handled in this run, by outcome.",
+            "# TYPE pdf_scraper_documents_total counter",
+            f'pdf_scraper_documents_total{{status="processed"}} {self.documents - self.cached}',
+            f'pdf_scraper_documents_total{{status="cached"}} {self.cached}',
+            f'pdf_scraper_documents_total{{status="failed"}} {self.failed}',
+            "# HELP pdf_scraper_pages_total Pages processed in this run.",
+            "# TYPE pdf_scraper_pages_total counter",
+            f"pdf_scraper_pages_total {self.pages}",
+            "# HELP pdf_scraper_document_seconds Wall time per processed document.",
+            "# TYPE pdf_scraper_document_seconds histogram",
+        ]
+        self._histogram(lines, "pdf_scraper_document_seconds", self.document_buckets, self.document_seconds)
+
+        lines += [
+            "# HELP pdf_scraper_stage_seconds Wall time per call of a stage: per page for layout and the detectors, per document for cache_lookup and open.",
+            "# TYPE pdf_scraper_stage_seconds histogram",
+        ]
+        for name, stage in sorted(self.stages.items()):
+            self._histogram(lines, "pdf_scraper_stage_seconds", stage.buckets, stage.wall_seconds, f'stage="{_label(name)}"')
+
+        lines += [
+            "# HELP pdf_scraper_stage_cpu_seconds_total CPU time spent per stage.",
+            "# TYPE pdf_scraper_stage_cpu_seconds_total counter",
+        ]
+        lines += [f'pdf_scraper_stage_cpu_seconds_total{{stage="{_label(name)}"}} {stage.cpu_seconds:.6f}' for name, stage in sorted(self.stages.items())]
+        lines += [
+            "# HELP pdf_scraper_stage_peak_rss_growth_bytes_total Growth of the workers' peak RSS while running a stage.",
+            "# TYPE pdf_scraper_stage_peak_rss_growth_bytes_total counter",
+        ]
+        lines += [f'pdf_scraper_stage_peak_rss_growth_bytes_total{{stage="{_label(name)}"}} {stage.peak_rss_growth_kb * 1024}' for name, stage in sorted(self.stages.items())]
+
+        lines += [
+            "# HELP pdf_scraper_slowest_document_seconds Wall time of the slowest documents of this run.",
+            "# TYPE pdf_scraper_slowest_document_seconds gauge",
+        ]
+        for rank, (seconds, path) in enumerate(sorted(self.slowest_documents, reverse=True), start=1):
+            lines.append(f'pdf_scraper_slowest_document_seconds{{rank="{rank}",path="{_label(path)}"}} {seconds:.6f}')
+        lines += [
+            "# HELP pdf_scraper_slowest_page_seconds Wall time of the slowest pages of this run, with their slowest stage.",
+            "# TYPE pdf_scraper_slowest_page_seconds gauge",
+        ]
+        for rank, (seconds, path, page, stage) in enumerate(sorted(self.slowest_pages, reverse=True), start=1):
+            lines.append(f'pdf_scraper_slowest_page_seconds{{rank="{rank}",path="{_label(path)}",page="{page}",stage="{_label(stage)}"}} {seconds:.6f}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: Path):
+        path.write_text(self.to_prometheus())
@@ -0,0 +1,114 @@
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Iterator
+
+from classes import ScannedPDF
+
+JSONL_RESULTS = "results.jsonl"
+JSON_RESULTS = "results.json"
+
+
+class JsonlResultsWriter:
+    """ Appends one `ScannedPDF.to_dict()` line per finished document to a JSONL file.
+
+    Every line is flushed to the OS straight away and fsynced at most every `fsync_interval` seconds (0 fsyncs every
+    line), so a crash loses at most the documents finished within the last interval.
+    """
+
+    def __init__(self, path: Path, fsync_interval: float = 5.0):
+        self.path: Path = path
+        self.fsync_interval: float = fsync_interval
+        _drop_partial_line(path)
+        self._file = open(path, "a", encoding="utf-8")
+        self._last_fsync = time.monotonic()
+
+    def write(self, scanned_pdf: ScannedPDF):
+        self._file.write(json.dumps(scanned_pdf.to_dict()) + "\n")
+        self._file.flush()
+        if time.monotonic() - self._last_fsync >= self.fsync_interval:
+            self._fsync()
+
+    def _fsync(self):
+        os.fsync(self._file.fileno())
+        self._last_fsync = time.monotonic()
+
+    def close(self):
+        self._file.flush()
+        self._fsync()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _drop_partial_line(path: Path):
+    """ Truncates a line left half-written by a crash, so the next record starts on a line of its own. """
+    if not path.exists() or path.stat().st_size == 0:
+        return
+    with open(path, "rb+") as f:
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) == b"\n":
+            return
+        position = f.tell()
+        end_of_last_line = 0
+        while position > 0:
+            chunk_start = max(0, position - (1 << 16))
+            f.seek(chunk_start)
+            newline = f.read(position - chunk_start).rfind(b"\n")
+            if newline != -1:
+                end_of_last_line = chunk_start + newline + 1
+                break
+            position = chunk_start
+        logging.warning(f"Dropping incomplete last record of {path}")
+        f.truncate(end_of_last_line)
+
+
+def _read_records(path: Path) -> Iterator[tuple[int, dict]]:
+    """ Yields (offset, record) for every complete line of a JSONL results file. """
+    with open(path, "rb") as f:
+        offset = 0
+        for line in f:
+            try:
+                yield offset, json.loads(line)
+            except ValueError:
+                logging.warning(f"Skipping unreadable record at offset {offset} of {path}")
+            offset += len(line)
+
+
+def recorded_paths(path: Path) -> set[str]:
+    """ The paths of every document already recorded in a JSONL results file, unless its last record is partial (see
+    `ScannedPDF.status`), so that resuming retries it. """
+    if not path.exists():
+        return set()
+    statuses = {record["path"]: record.get("status", "complete") for _, record in _read_records(path)}
+    return {pdf_path for pdf_path, status in statuses.items() if status == "complete"}
+
+
+def compact_results(jsonl_path: Path, json_path: Path) -> int:
+    """ Writes the records of a JSONL results file as a `results.json` array, one entry per path.
+
+    When a path was recorded more than once (e.g. after rerunning it), its last record wins. Records are streamed, only
+    their offsets are kept in memory.
+    """
+    offsets: dict[str, int] = {}
+    for offset, record in _read_records(jsonl_path):
+        offsets[record["path"]] = offset
+
+    with open(jsonl_path, "rb") as source, open(json_path, "w", encoding="utf-8") as f:
+        if not offsets:
+            f.write("[]")
+            return 0
+        # Same layout as json.dump(records, f, indent=4)
+        f.write("[\n")
+        for i, offset in enumerate(offsets.values()):
+            source.seek(offset)
+            entry = json.dumps(json.loads(source.readline()), indent=4)
+            f.write(("" if i == 0 else ",\n") + "\n".join("    " + line for line in entry.splitlines()))
+        f.write("\n]")
+    return len(offsets)
@@ -0,0 +1,198 @@
+import ipaddress
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional, Union
+
+from cache import ResultCache
+from classes import ProcessingResult
+from executor import run_in_pool, start_pool, warm_up
+
+# A one-off run evicts from the result cache when it is done, a server every so often after a scan
+EVICT_INTERVAL_SECONDS = 300
+
+
+class Scanner:
+    """ Keeps the OCR model and the worker pool warm between scans.
+
+    With 0 workers documents are processed in the server process itself, one at a time.
+    """
+
+    def __init__(self, kwargs: dict, workers: int, shard_pages: int = 0):
+        self.kwargs: dict = kwargs
+        self.workers: int = workers
+        self.shard_pages: int = shard_pages
+        self._lock = threading.Lock()
+        self._eviction_lock = threading.Lock()
+        self._next_eviction: float = 0.0
+        start = time.perf_counter()
+        if workers > 0:
+            self.pool = start_pool(workers, kwargs)
+        else:
+            self.pool = None
+            warm_up(kwargs)
+        logging.info(f"Warmed up {workers or 'in-process'} workers in {time.perf_counter() - start:.1f}s")
+
+    def scan(self, pdf_path: Path, write_result: bool = True) -> ProcessingResult:
+        """ Scans a document, writing its result file to the output directory unless `write_result` is off. """
+        kwargs = self.kwargs if write_result else dict(self.kwargs, output_path=None)
+        if self.pool is None:
+            with self._lock:
+                result = next(run_in_pool([pdf_path], kwargs, 0))
+        else:
+            result = next(run_in_pool([pdf_path], kwargs, self.workers, shard_pages=self.shard_pages, pool=self.pool))
+        self.evict_cache()
+        return result
+
+    def evict_cache(self):
+        """ Keeps the result cache within its size and age limits, at most every `EVICT_INTERVAL_SECONDS`. """
+        cache_config = self.kwargs.get("cache_config")
+        if not cache_config or not cache_config.enabled:
+            return
+        with self._eviction_lock:
+            if time.monotonic() < self._next_eviction:
+                return
+            self._next_eviction = time.monotonic() + EVICT_INTERVAL_SECONDS
+        try:
+            cache = ResultCache(cache_config.path)
+            try:
+                cache.evict(cache_config.max_size_mb, cache_config.max_age_days)
+            finally:
+                cache.close()
+        except Exception:
+            logging.warning(f"Could not evict from result cache {cache_config.path}", exc_info=True)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """ `POST /scan` with a JSON body `{"path": "/path/to/file.pdf"}`, or with the PDF itself as `application/pdf`,
+    answers with `ScannedPDF.to_dict()`. `GET /health` answers once the server is warm. """
+
+    scanner: Scanner = None
+
+    def do_GET(self):
+        if self.path != "/health":
+            return self._reply(404, {"error": f"Unknown path: {self.path}"})
+        self._reply(200, {"status": "ok", "workers": self.scanner.workers})
+
+    def do_POST(self):
+        if self.path != "/scan":
+            return self._reply(404, {"error": f"Unknown path: {self.path}"})
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.headers.get("Content-Type", "").startswith("application/pdf"):
+            # An upload: scanned from a temporary file, which is reported under the name given in X-Filename
+            name = Path(self.headers.get("X-Filename", "upload.pdf")).name
+            if name in ("", ".", "..") or "\0" in name:
+                return self._reply(400, {"error": f"Not a file name: {self.headers.get('X-Filename')!r}"})
+            with tempfile.TemporaryDirectory() as tmp:
+                pdf_path = Path(tmp) / name
+                pdf_path.write_bytes(body)
+                # Its temporary path is new every time, a result file per upload would pile up in the output directory
+                return self._reply_result(self.scanner.scan(pdf_path, write_result=False), name)
+
+        try:
+            pdf_path = Path(json.loads(body)["path"])
+        except (ValueError, KeyError, TypeError):
+            return self._reply(400, {"error": 'Expected a JSON body {"path": "..."} or an application/pdf upload'})
+        if not pdf_path.is_file():
+            return self._reply(400, {"error": f"No such file: {pdf_path}"})
+        self._reply_result(self.scanner.scan(pdf_path))
+
+    def _reply_result(self, result: ProcessingResult, name: Optional[str] = None):
+        if not result.ok:
+            logging.error(f"Error processing PDF {result.pdf_path}:\n{result.error}")
+            return self._reply(500, {"error": result.error})
+        data = result.scanned_pdf.to_dict()
+        if name is not None:
+            data["path"] = name
+        self._reply(200, data)
+
+    def _reply(self, status: int, data: dict):
+        payload = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def address_string(self) -> str:
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else "unix socket"
+
+    def log_message(self, format, *args):
+        logging.debug(f"{self.address_string()} - {format % args}")
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _IPv6HTTPServer(ThreadingHTTPServer):
+    address_family = socket.AF_INET6
+
+
+def is_loopback(host: str) -> bool:
+    """ Whether every address `host` resolves to is on this machine only. """
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, None)}
+    except OSError:
+        return False
+    return bool(addresses) and all(ipaddress.ip_address(address.split("%")[0]).is_loopback for address in addresses)
+
+
+def parse_address(address: str, allow_remote: bool = False) -> Union[str, tuple[str, int]]:
+    """ `[HOST:]PORT` as a (host, port) pair, on localhost unless a host is given. Anything else, and anything with a
+    "/", is a Unix socket path.
+
+    Anyone who can reach the server can have it read any file it can read, so a host that is not a loopback address
+    is refused unless `allow_remote` is set.
+    """
+    host, _, port = address.rpartition(":")
+    if "/" in address or not port.isdigit():
+        return address
+    host = host.strip("[]") or "127.0.0.1"
+    if not allow_remote and not is_loopback(host):
+        raise ValueError(f"Refusing to serve on {host}, which is reachable from other machines; pass --allow-remote to do so anyway")
+    return host, int(port)
+
+
+def make_server(address: str, scanner: Scanner, allow_remote: bool = False) -> socketserver.BaseServer:
+    """ Binds to `address`, see `parse_address`. """
+    handler = type("Handler", (_Handler,), {"scanner": scanner})
+    parsed = parse_address(address, allow_remote)
+    if isinstance(parsed, str):
+        if os.path.exists(parsed):
+            os.unlink(parsed)
+        return _UnixHTTPServer(parsed, handler)
+    return (_IPv6HTTPServer if ":" in parsed[0] else ThreadingHTTPServer)(parsed, handler)
+
+
+def serve(address: str, kwargs: dict, workers: int, shard_pages: int = 0, allow_remote: bool = False):
+    """ Runs the scan server until interrupted. """
+    parsed = parse_address(address, allow_remote)
+    scanner = Scanner(kwargs, workers, shard_pages)
+    server = make_server(address, scanner, allow_remote)
+    logging.info(f"Serving scans on {address}")
+    # Stopped like a daemon as well as from a terminal, cleaning up the pool and socket either way
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        scanner.close()
+        if isinstance(parsed, str) and os.path.exists(parsed):
+            os.unlink(parsed)
@@ -0,0 +1,145 @@
+from itertools import chain
+from operator import itemgetter
+from typing import Optional
+
+import numpy as np
+
+# Text render mode 3 draws neither fill nor stroke (PDF 32000-1:2008, 9.3.6)
+RENDER_INVISIBLE = 3
+
+
+def _rgb(color) -> tuple[float, float, float]:
+    # pdfplumber keeps colours in their own colour space: a grey level, RGB or CMYK, or the name of a pattern
+    if color is None or color == ():
+        return 0.0, 0.0, 0.0  # the initial colour of every page is black
+    if isinstance(color, (int, float)):
+        color = (color,)
+    try:
+        if len(color) == 1:
+            return float(color[0]), float(color[0]), float(color[0])
+        if len(color) == 3:
+            return float(color[0]), float(color[1]), float(color[2])
+        if len(color) == 4:
+            c, m, y, k = map(float, color)
+            return (1 - c) * (1 - k), (1 - m) * (1 - k), (1 - y) * (1 - k)
+    except (TypeError, ValueError):
+        pass
+    return np.nan, np.nan, np.nan
+
+
+def to_rgb(colors: list) -> np.ndarray:
+    """ Converts pdfplumber colours to an (n, 3) array of RGB in [0, 1], NaN for colours that are not known. """
+    # A page uses a handful of colours, each is converted once
+    distinct: dict = {}
+    try:
+        indices = np.fromiter((distinct.setdefault(color, len(distinct)) for color in colors), dtype=np.int64, count=len(colors))
+    except TypeError:  # unhashable, e.g. a list
+        return np.array([_rgb(color) for color in colors], dtype=float).reshape(-1, 3)
+    return np.array([_rgb(color) for color in distinct], dtype=float).reshape(-1, 3)[indices]
+
+
+def _column(chars: list[dict], key: str, default, dtype) -> np.ndarray:
+    # An engine reports a key for all of its chars or for none of them
+    if chars and key in chars[0]:
+        return np.fromiter(map(itemgetter(key), chars), dtype=dtype, count=len(chars))
+    return np.full(len(chars), default, dtype=dtype)
+
+
+class PageChars:
+    """ The chars of a single page as columns: box, fill colour as RGB, font size, render mode and drawing order.
+
+    Built once per page (see `DocumentPage.char_columns`) and shared by the detectors, which test colour and geometry
+    on whole columns at once instead of looping over the char dicts. Chars keep their order in the content stream.
+    `order` is their position in the drawing order of the page, comparable with `PageImage.order`, or -1 when the
+    engine does not report it; so is a render mode of 0 for engines that do not report one.
+    """
+
+    def __init__(self, texts: list[str], boxes: np.ndarray, rgb: np.ndarray, size: Optional[np.ndarray] = None, render_mode: Optional[np.ndarray] = None, order: Optional[np.ndarray] = None):
+        self.texts: list[str] = texts
+        self.x0, self.y0, self.x1, self.y1 = boxes.reshape(-1, 4).T
+        self.rgb: np.ndarray = rgb.reshape(-1, 3)
+        self.size: np.ndarray = size if size is not None else np.zeros(len(texts))
+        self.render_mode: np.ndarray = render_mode if render_mode is not None else np.zeros(len(texts), dtype=np.int8)
+        self.order: np.ndarray = order if order is not None else np.full(len(texts), -1, dtype=np.int64)
+        self.line: np.ndarray = self._lines()
+
+    @staticmethod
+    def from_chars(chars: list[dict]) -> 'PageChars':
+        """ Columns of char dicts with pdfplumber's keys, and `size`, `render_mode` and `seqno` when present. """
+        return PageChars(
+            texts=list(map(itemgetter('text'), chars)),
+            boxes=np.fromiter(chain.from_iterable(map(itemgetter('x0', 'y0', 'x1', 'y1'), chars)), dtype=float, count=4 * len(chars)),
+            rgb=to_rgb([char.get('non_stroking_color') for char in chars]),
+            size=_column(chars, 'size', 0.0, float),
+            render_mode=_column(chars, 'render_mode', 0, np.int8),
+            order=_column(chars, 'seqno', -1, np.int64),
+        )
+
+    def __len__(self):
+        return len(self.texts)
+
+    def _lines(self) -> np.ndarray:
+        # A char starts a new line when its vertical centre moves by more than half a char height from the previous one
+        if not len(self.texts):
+            return np.zeros(0, dtype=np.int64)
+        centre, height = (self.y0 + self.y1) / 2, self.y1 - self.y0
+        moved = np.abs(np.diff(centre)) > np.maximum(height[1:], height[:-1]) / 2
+        return np.concatenate(([0], np.cumsum(moved)))
+
+    def light(self, threshold: float = 0.8) -> np.ndarray:
+        """ Chars filled with a colour of which every RGB component is at least `threshold`. """
+        return np.all(self.rgb >= threshold, axis=1)
+
+    def within(self, x0: float, y0: float, x1: float, y1: float) -> np.ndarray:
+        """ Chars whose centre lies within the given box. """
+        x, y = (self.x0 + self.x1) / 2, (self.y0 + self.y1) / 2
+        return (x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)
+
+    def runs(self, mask: np.ndarray) -> list[str]:
+        """ The texts of the runs of consecutive chars in `mask` that stay on one line. """
+        indices = np.flatnonzero(mask)
+        if not len(indices):
+            return []
+        breaks = np.flatnonzero((np.diff(indices) != 1) | (np.diff(self.line[indices]) != 0)) + 1
+        return ["".join(self.texts[i] for i in run) for run in np.split(indices, breaks)]
+
+
+class CharIndex:
+    """ A spatial index over the chars of a single page.
+
+    Char boxes are rounded to whole points (as the rectangle matching always did) and kept in NumPy arrays sorted
+    along both axes. A containment query narrows the candidates with a binary search on whichever axis is more
+    selective for the queried box, then tests the remaining bounds vectorized.
+    """
+
+    def __init__(self, chars: PageChars):
+        self.texts: list[str] = chars.texts
+        # half-to-even, same as round() on the individual floats
+        self.x0, self.y0, self.x1, self.y1 = np.rint(chars.x0), np.rint(chars.y0), np.rint(chars.x1), np.rint(chars.y1)
+
+        self._by_x = np.argsort(self.x0, kind="stable")
+        self._by_y = np.argsort(self.y0, kind="stable")
+        self._sorted_x0 = self.x0[self._by_x]
+        self._sorted_y0 = self.y0[self._by_y]
+
+    def __len__(self):
+        return len(self.texts)
+
+    def contained(self, x0: float, y0: float, x1: float, y1: float) -> np.ndarray:
+        """ Returns the indices, in page order, of the chars whose box lies entirely within the given box. """
+        # A contained char starts inside the box on both axes
+        x_lo, x_hi = np.searchsorted(self._sorted_x0, x0, side="left"), np.searchsorted(self._sorted_x0, x1, side="right")
+        y_lo, y_hi = np.searchsorted(self._sorted_y0, y0, side="left"), np.searchsorted(self._sorted_y0, y1, side="right")
+        if x_hi - x_lo <= y_hi - y_lo:
+            candidates = self._by_x[x_lo:x_hi]
+        else:
+            candidates = self._by_y[y_lo:y_hi]
+
+        mask = (
+            (self.x0[candidates] >= x0) & (self.x1[candidates] <= x1) &
+            (self.y0[candidates] >= y0) & (self.y1[candidates] <= y1)
+        )
+        return np.sort(candidates[mask])
+
+    def text_within(self, x0: float, y0: float, x1: float, y1: float) -> str:
+        return "".join(self.texts[i] for i in self.contained(x0, y0, x1, y1))
@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# The modules live at the top of the repository, which is not a package
+sys.path.insert(0, str(ROOT))
@@ -0,0 +1,133 @@
+""" The result cache (see `cache.ResultCache`): lookups by file content and settings, eviction, and rebuilding a cache
+file that cannot be read. """
+import asyncio
+import shutil
+import sqlite3
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+import cache
+import helpers
+from cache import ResultCache
+from classes import CacheConfiguration, OCRConfiguration
+from helpers import detector_settings, has_cached_result, process_pdf
+
+DOCUMENT = Path(__file__).resolve().parent / "data" / "testdoc.pdf"
+DAY = 24 * 3600
+
+
+@pytest.fixture
+def document(tmp_path: Path) -> Path:
+    # A copy, so that it can be changed
+    return Path(shutil.copy(DOCUMENT, tmp_path / DOCUMENT.name))
+
+
+@pytest.fixture
+def cache_config(tmp_path: Path) -> CacheConfiguration:
+    return CacheConfiguration(tmp_path / "cache" / "results_cache.sqlite")
+
+
+@pytest.fixture
+def clock(monkeypatch) -> SimpleNamespace:
+    """ The time as the cache sees it, set by the test. """
+    now = SimpleNamespace(value=100 * DAY)
+    monkeypatch.setattr(cache, "time", SimpleNamespace(time=lambda: now.value))
+    return now
+
+
+def scan(pdf_path: Path, cache_config: CacheConfiguration):
+    return asyncio.run(process_pdf(pdf_path, False, None, cache_config=cache_config))
+
+
+def test_unchanged_file_is_not_reopened(document: Path, cache_config: CacheConfiguration, monkeypatch):
+    first = scan(document, cache_config)
+    assert has_cached_result(document, False, cache_config=cache_config)
+
+    def not_opened(*args):
+        raise AssertionError("the document was opened")
+
+    monkeypatch.setattr(helpers, "open_document", not_opened)
+    assert scan(document, cache_config).to_dict() == first.to_dict()
+
+
+def test_changed_file_misses(document: Path, cache_config: CacheConfiguration):
+    scan(document, cache_config)
+    with open(document, "ab") as f:
+        f.write(b"\n% changed\n")
+    assert not has_cached_result(document, False, cache_config=cache_config)
+
+
+@pytest.mark.parametrize("settings", [
+    dict(do_regex=False),
+    dict(engine="pymupdf"),
+    dict(keep_page_text=True),
+    dict(ocr_config=OCRConfiguration(languages=["en"])),
+    dict(ocr_config=OCRConfiguration(min_entropy=0.5)),
+])
+def test_changed_settings_miss(document: Path, cache_config: CacheConfiguration, settings: dict):
+    # Stored directly, with regexes on the images of the document would need OCR
+    results = ResultCache(cache_config.path)
+    results.put(ResultCache.key_for(document, detector_settings(True)), {})
+    results.close()
+    assert has_cached_result(document, True, cache_config=cache_config)
+    assert not has_cached_result(document, settings.pop("do_regex", True), cache_config=cache_config, **settings)
+
+
+def test_evicts_least_recently_used_above_size(cache_config: CacheConfiguration, clock: SimpleNamespace):
+    results = ResultCache(cache_config.path)
+    for key in ("a", "b", "c"):
+        results.put(key, {"padding": "x" * 1000})
+        clock.value += 1
+    results.get("a")
+    # Room for two entries, "b" was used longest ago
+    assert results.evict(2100 / (1024 * 1024), 0) == 1
+    assert [key for key in "abc" if results.get(key) is not None] == ["a", "c"]
+    results.close()
+
+
+def test_evicts_unused_entries_by_age(cache_config: CacheConfiguration, clock: SimpleNamespace):
+    results = ResultCache(cache_config.path)
+    results.put("old", {})
+    results.put("used", {})
+    clock.value += 10 * DAY
+    results.put("new", {})
+    results.get("used")
+    clock.value += 5 * DAY
+    assert results.evict(0, 7) == 1
+    assert [key for key in ("old", "used", "new") if results.get(key) is not None] == ["used", "new"]
+    results.close()
+
+
+def test_no_limits_evict_nothing(cache_config: CacheConfiguration, clock: SimpleNamespace):
+    results = ResultCache(cache_config.path)
+    results.put("old", {"padding": "x" * 1000})
+    clock.value += 1000 * DAY
+    assert results.evict(0, 0) == 0
+    results.close()
+
+
+def test_unreadable_file_is_rebuilt(cache_config: CacheConfiguration):
+    cache_config.path.parent.mkdir()
+    cache_config.path.write_bytes(b"not a database " * 100)
+    results = ResultCache(cache_config.path)
+    results.put("key", {"found": True})
+    assert results.get("key") == {"found": True}
+    results.close()
+
+
+def test_table_of_another_version_is_rebuilt(cache_config: CacheConfiguration):
+    cache_config.path.parent.mkdir()
+    connection = sqlite3.connect(cache_config.path)
+    connection.execute("CREATE TABLE results (key TEXT PRIMARY KEY, result TEXT NOT NULL)")
+    connection.execute("INSERT INTO results VALUES ('key', '{}')")
+    connection.commit()
+    connection.close()
+
+    results = ResultCache(cache_config.path)
+    assert results.get("key") is None
+    results.put("key", {"found": True})
+    assert results.get("key") == {"found": True}
+    assert results.evict(1, 1) == 0
+    results.close()
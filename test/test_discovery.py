@@ -0,0 +1,37 @@
+""" Finding documents in directories (see `discovery.py`) and writing one result file per document. """
+import asyncio
+import json
+import shutil
+from pathlib import Path
+
+from discovery import discover_pdfs
+from helpers import process_pdf, result_file
+
+DOCUMENT = Path(__file__).resolve().parent / "data" / "testdoc.pdf"
+
+
+def test_documents_with_the_same_name(tmp_path: Path):
+    root, output_dir = tmp_path / "scan", tmp_path / "output"
+    for directory in ("a", "b", "b/c"):
+        (root / directory).mkdir(parents=True)
+        shutil.copy(DOCUMENT, root / directory / "report.pdf")
+    output_dir.mkdir()
+
+    found = list(discover_pdfs([root]))
+    assert sorted(path.relative_to(root).as_posix() for path in found) == ["a/report.pdf", "b/c/report.pdf", "b/report.pdf"]
+
+    for pdf_path in found:
+        asyncio.run(process_pdf(pdf_path, False, output_dir))
+    assert len({result_file(pdf_path, output_dir) for pdf_path in found}) == len(found)
+    for pdf_path in found:
+        with open(result_file(pdf_path, output_dir)) as f:
+            assert json.load(f)["path"] == pdf_path.as_posix()
+    assert len(list(output_dir.glob("report-*.json"))) == len(found)
+
+
+def test_include_and_exclude(tmp_path: Path):
+    for name in ("invoices/one.PDF", "invoices/archive/two.pdf", "other/three.pdf", "other/notes.txt"):
+        (tmp_path / name).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / name).touch()
+    found = discover_pdfs([tmp_path], include=["invoices/*.pdf"], exclude=["archive"])
+    assert [path.relative_to(tmp_path).as_posix() for path in found] == ["invoices/one.PDF"]
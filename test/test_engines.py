@@ -0,0 +1,102 @@
+""" Parity of the pdfplumber and pymupdf extraction engines (see `backends.py`): what the detectors see on each page,
+and the findings `process_pdf` reports, on the sample documents. """
+import asyncio
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from backends import open_document
+from helpers import process_pdf
+
+DOCUMENTS = sorted((Path(__file__).resolve().parent / "data").glob("*.pdf"))
+
+# Char boxes are rounded to whole points by the detectors, font metrics may put them one point apart
+MAX_BOX_DIFFERENCE = 1
+# libjpeg builds in MuPDF and Pillow round the colour conversion of JPEG images differently
+MAX_MEAN_PIXEL_DIFFERENCE = 2.0
+
+# Findings only one engine reports, for a known reason:
+# (engine, document name, page, artifact type, matched data, data type) -> reason
+KNOWN_DIFFERENCES = {
+    ("pdfplumber", "sample.pdf", 1, "text", "5202\nnu", "postcode"): "pdfplumber reads the rotated arXiv stamp back to front",
+    ("pymupdf", "sample.pdf", 1, "text", "2025\nEM", "postcode"): "pymupdf reads the rotated arXiv stamp in order",
+}
+
+
+def _boxes(objects: list[dict]) -> np.ndarray:
+    return np.rint(np.array([(o['x0'], o['y0'], o['x1'], o['y1']) for o in objects], dtype=float).reshape(-1, 4))
+
+
+def compare_pages(pdf_path: Path) -> list[str]:
+    """ Compares the chars, rects and images every page exposes to the detectors under both engines. """
+    problems = []
+    reference, candidate = open_document(pdf_path, "pdfplumber"), open_document(pdf_path, "pymupdf")
+    with reference, candidate:
+        if len(reference.pages) != len(candidate.pages):
+            return [f"{pdf_path.name}: {len(reference.pages)} != {len(candidate.pages)} pages"]
+        for expected, actual in zip(reference.pages, candidate.pages):
+            where = f"{pdf_path.name} page {expected.page_number}"
+            if [c['text'] for c in expected.chars] != [c['text'] for c in actual.chars]:
+                problems.append(f"{where}: chars differ")
+            elif len(expected.chars):
+                difference = np.abs(_boxes(expected.chars) - _boxes(actual.chars)).max()
+                if difference > MAX_BOX_DIFFERENCE:
+                    problems.append(f"{where}: char boxes differ by up to {difference} points")
+
+            if len(expected.rects) != len(actual.rects):
+                problems.append(f"{where}: {len(expected.rects)} != {len(actual.rects)} rects")
+            elif expected.rects and (not np.array_equal(_boxes(expected.rects), _boxes(actual.rects)) or
+                                     [r['fill'] for r in expected.rects] != [r['fill'] for r in actual.rects]):
+                problems.append(f"{where}: rects differ")
+
+            expected_images, actual_images = expected.images, actual.images
+            if len(expected_images) != len(actual_images):
+                problems.append(f"{where}: {len(expected_images)} != {len(actual_images)} images")
+            for i, (expected_image, actual_image) in enumerate(zip(expected_images, actual_images)):
+                a, b = expected_image.decode().pixels, actual_image.decode().pixels
+                if a.shape != b.shape:
+                    problems.append(f"{where} image {i}: shape {a.shape} != {b.shape}")
+                elif np.abs(a.astype(int) - b.astype(int)).mean() > MAX_MEAN_PIXEL_DIFFERENCE:
+                    problems.append(f"{where} image {i}: pixels differ")
+            expected.close()
+            actual.close()
+    return problems
+
+
+def scan(pdf_path: Path, output_dir: Path) -> dict[str, dict]:
+    return {
+        engine: asyncio.run(process_pdf(pdf_path, True, output_dir, cache_config=None, engine=engine)).to_dict()
+        for engine in ("pdfplumber", "pymupdf")
+    }
+
+
+def finding_differences(pdf_path: Path, results: dict[str, dict]) -> set[tuple]:
+    """ The findings only one engine reports, keyed like `KNOWN_DIFFERENCES`. """
+    def findings(result: dict) -> Counter:
+        return Counter(
+            (pdf_path.name, f['page_number'], f['artifact_type'], f['matched_data'], f['matched_data_type'])
+            for f in result['findings']
+        )
+    expected, actual = findings(results["pdfplumber"]), findings(results["pymupdf"])
+    return {("pdfplumber", *finding) for finding in expected - actual} | {("pymupdf", *finding) for finding in actual - expected}
+
+
+@pytest.mark.parametrize("pdf_path", DOCUMENTS, ids=lambda path: path.name)
+def test_pages_match(pdf_path: Path):
+    assert compare_pages(pdf_path) == []
+
+
+@pytest.mark.parametrize("pdf_path", DOCUMENTS, ids=lambda path: path.name)
+def test_findings_match(pdf_path: Path, tmp_path: Path):
+    # process_pdf loads the OCR model for the images
+    pytest.importorskip("easyocr")
+    results = scan(pdf_path, tmp_path)
+    expected, actual = results["pdfplumber"], results["pymupdf"]
+    for field in expected:
+        if field not in ("findings", "stats"):
+            assert expected[field] == actual[field], field
+    known = {difference for difference in KNOWN_DIFFERENCES if difference[1] == pdf_path.name}
+    # A known difference that went away should be dropped from KNOWN_DIFFERENCES as well
+    assert finding_differences(pdf_path, results) == known
@@ -0,0 +1,96 @@
+""" Parity of `helpers.extract_text_inside_filled_rectangles` with the original rects x chars loop. """
+import random
+from pathlib import Path
+from types import SimpleNamespace
+
+import pdfplumber
+import pytest
+
+from backends import DocumentPage, open_document
+from helpers import extract_text_inside_filled_rectangles
+
+DATA = Path(__file__).resolve().parent / "data"
+
+
+def reference_extract_text_inside_filled_rectangles(pdf):
+    """ The original O(rects x chars) implementation, kept as the parity oracle. """
+    last_y_offset = -1
+    for page in pdf.pages:
+        captured_text = ""
+        for rect in page.objects.get("rect", []):
+            x0, y0, x1, y1 = round(rect['x0']), round(rect['y0']), round(rect['x1']), round(rect['y1'])
+            if last_y_offset != y0:
+                if captured_text:
+                    yield (page.page_number, captured_text)
+                    captured_text = ""
+                last_y_offset = y0
+            if not rect.get('fill', None) == True:
+                continue
+            non_stroking_color = rect.get('non_stroking_color', [])
+            if isinstance(non_stroking_color, float) or isinstance(non_stroking_color, int):
+                non_stroking_color = [non_stroking_color]
+            if not all(0.0 <= c <= 0.2 for c in non_stroking_color):
+                continue
+            for char in page.objects.get("char", []):
+                if (
+                    round(char['x0']) >= x0 and round(char['x1']) <= x1 and
+                    round(char['y0']) >= y0 and round(char['y1']) <= y1
+                ):
+                    captured_text += char['text']
+        if captured_text:
+            yield (page.page_number, captured_text)
+
+
+class _SyntheticPage(DocumentPage):
+    def __init__(self, chars: list[dict], rects: list[dict]):
+        self.page_number = 1
+        self.objects = {'rect': rects, 'char': chars}
+
+    @property
+    def chars(self) -> list[dict]:
+        return self.objects['char']
+
+    @property
+    def rects(self) -> list[dict]:
+        return self.objects['rect']
+
+
+def synthetic_pdf(n_rects: int, n_chars: int, seed: int = 0):
+    """ A single page stand-in shaped like a redacted form: rows of small chars, many small dark rects. """
+    rng = random.Random(seed)
+    width, height = 1200.0, 1600.0
+    chars = []
+    for i in range(n_chars):
+        x0 = rng.uniform(0, width - 6)
+        y0 = rng.uniform(0, height - 9)
+        chars.append({'x0': x0, 'x1': x0 + 5.5, 'y0': y0, 'y1': y0 + 8.5, 'text': chr(ord('a') + i % 26)})
+    rects = []
+    for _ in range(n_rects):
+        x0 = rng.uniform(0, width - 80)
+        y0 = float(rng.randrange(0, int(height) - 12, 12))
+        rects.append({
+            'x0': x0, 'x1': x0 + rng.uniform(10, 80), 'y0': y0, 'y1': y0 + 12,
+            'fill': rng.random() < 0.9,
+            'non_stroking_color': rng.choice([0, 0.1, (0.0, 0.0, 0.0), (1.0, 1.0, 1.0)]),
+        })
+    rects.sort(key=lambda r: r['y0'])
+    page = _SyntheticPage(chars, rects)
+    return SimpleNamespace(pages=[page], path=Path("synthetic.pdf"))
+
+
+@pytest.mark.parametrize("pdf_path", sorted(DATA.glob("*.pdf")), ids=lambda path: path.name)
+def test_parity_on_sample_documents(pdf_path: Path):
+    with pdfplumber.open(pdf_path) as pdf:
+        expected = list(reference_extract_text_inside_filled_rectangles(pdf))
+    with open_document(pdf_path, "pdfplumber") as pdf:
+        actual = [(a.page_number, a.text) for a in extract_text_inside_filled_rectangles(pdf, None)]
+    assert actual == expected
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_parity_on_synthetic_page(seed: int):
+    pdf = synthetic_pdf(500, 3000, seed)
+    expected = list(reference_extract_text_inside_filled_rectangles(pdf))
+    actual = [(a.page_number, a.text) for a in extract_text_inside_filled_rectangles(pdf, None)]
+    assert expected
+    assert actual == expected
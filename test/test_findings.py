@@ -0,0 +1,81 @@
+""" Findings hold a snippet around their match and the match's offsets in the text it was found in (see
+`classes.PossibleArtifactFinding`), which for page text is kept in `ScannedPDF.page_texts` by `keep_page_text`. """
+import asyncio
+from pathlib import Path
+
+import pymupdf
+import pytest
+
+from backends import ENGINES
+from classes import SNIPPET_CONTEXT, ArtifactType, OCRConfiguration, ScannedPDF
+from helpers import process_pdf
+from ocr import OCRService
+
+DOCUMENTS = sorted((Path(__file__).resolve().parent / "data").glob("*.pdf"))
+# What OCR reads in every image, see `fake_ocr`
+IMAGE_LINES = ["Contact:", "piet.pieters@example.nl"]
+
+
+@pytest.fixture(autouse=True)
+def fake_ocr(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(OCRService, "readtext_batch", lambda self, images: [IMAGE_LINES for _ in images])
+
+
+def make_text_pdf(path: Path):
+    """ Matches at the very start of a page, in the middle of a long line and on its last line, over two pages. """
+    doc = pymupdf.open()
+    for page_number in range(2):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"jan.jansen{page_number}@example.nl opens the page", fontsize=10)
+        page.insert_text((72, 100), "filler " * 12 + "call 06-12345678 today " + "filler " * 12, fontsize=6)
+        page.insert_text((72, 130), "the page ends with 1234 AB", fontsize=10)
+    doc.save(path)
+    doc.close()
+
+
+def scan(pdf_path: Path, engine: str) -> ScannedPDF:
+    # Without deduplication, images recognised by earlier tests are not taken from the OCR cache
+    return asyncio.run(process_pdf(pdf_path, True, None, OCRConfiguration(cache_size=0), engine=engine, keep_page_text=True))
+
+
+def check_offsets(scanned_pdf: ScannedPDF) -> int:
+    """ Checks every finding against the text it was found in, returns how many were checked. """
+    for finding in scanned_pdf.findings:
+        if finding.artifact_type is ArtifactType.REGULAR_TEXT:
+            text = scanned_pdf.page_texts[finding.page_number]
+        elif finding.artifact_type is ArtifactType.IMAGE:
+            text = " ".join(IMAGE_LINES)
+        else:
+            # Hidden text and text in filled rectangles is reported whole
+            text = finding.matched_data
+        assert text[finding.start:finding.end] == finding.matched_data
+        assert finding.text == text[max(0, finding.start - SNIPPET_CONTEXT):finding.end + SNIPPET_CONTEXT]
+    return len(scanned_pdf.findings)
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_offsets_in_page_text(tmp_path: Path, engine: str):
+    pdf_path = tmp_path / "text.pdf"
+    make_text_pdf(pdf_path)
+    scanned_pdf = scan(pdf_path, engine)
+    assert sorted(scanned_pdf.page_texts) == [1, 2]
+    assert check_offsets(scanned_pdf) >= 6
+    found = {(f.page_number, f.matched_data.strip()) for f in scanned_pdf.findings}
+    assert {(1, "jan.jansen0@example.nl"), (2, "jan.jansen1@example.nl"), (1, "06-12345678"), (2, "1234 AB")} <= found
+    # A match at the very start of the page has no context before it
+    first = next(f for f in scanned_pdf.findings if f.matched_data == "jan.jansen0@example.nl")
+    assert first.start == 0 and first.text.startswith(first.matched_data)
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("pdf_path", DOCUMENTS, ids=lambda path: path.name)
+def test_offsets_in_sample_documents(engine: str, pdf_path: Path):
+    scanned_pdf = scan(pdf_path, engine)
+    assert check_offsets(scanned_pdf) > 0
+
+
+def test_offsets_survive_the_result_file(tmp_path: Path):
+    pdf_path = tmp_path / "text.pdf"
+    make_text_pdf(pdf_path)
+    scanned_pdf = ScannedPDF.from_dict(scan(pdf_path, "pymupdf").to_dict())
+    assert check_offsets(scanned_pdf) >= 6
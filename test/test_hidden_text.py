@@ -0,0 +1,148 @@
+""" Hidden text: white, invisible and covered text (see `helpers.extract_white_text_from_page` and its neighbours). """
+from pathlib import Path
+from typing import Optional
+
+import pymupdf
+import pytest
+
+from backends import ENGINES, open_document
+from helpers import MIN_VISIBLE_FONT_SIZE, WHITE_TEXT_MIN, extract_covered_text_from_page, extract_invisible_text_from_page, extract_white_text_from_page
+from spatial import RENDER_INVISIBLE
+
+DOCUMENTS = sorted((Path(__file__).resolve().parent / "data").glob("*.pdf"))
+
+# The image of `make_covered_text_pdf` in PDF coordinates, and the left part of it a clip leaves visible
+IMAGE_BBOX = (60, 632, 300, 662)
+LEFT_OF_IMAGE = (0, 600, 145, 100)
+
+
+def make_covered_text_pdf(path: Path, paths_before_text: int, clip: Optional[tuple] = None, rotation: int = 0, text_after_image: str = ""):
+    """ A page that draws `paths_before_text` vector rects, then a line of text, then an opaque image over that line,
+    then `text_after_image` over the image and more text. A `clip` (x, y, width, height in PDF coordinates) limits
+    what shows of the image. """
+    doc = pymupdf.open()
+    page = doc.new_page()
+    for i in range(paths_before_text):
+        page.draw_rect(pymupdf.Rect(10 + i, 10, 11 + i, 11), color=None, fill=(0, 0, 0))
+    page.insert_text((72, 200), "covered jan.jansen@example.nl", fontsize=12)
+    pixmap = pymupdf.Pixmap(pymupdf.csRGB, pymupdf.IRect(0, 0, 40, 10), False)
+    pixmap.set_rect(pixmap.irect, (200, 10, 10))
+    page.insert_image(pymupdf.Rect(60, 180, 300, 210), pixmap=pixmap, keep_proportion=False)
+    if clip:
+        xref = page.get_contents()[-1]
+        doc.update_stream(xref, doc.xref_stream(xref).replace(b"q\n", b"q\n%g %g %g %g re W n\n" % clip, 1))
+    if text_after_image:
+        page.insert_text((72, 190), text_after_image, fontsize=8)
+    page.insert_text((72, 400), "visible", fontsize=12)
+    page.set_rotation(rotation)
+    doc.save(path)
+    doc.close()
+
+
+def make_hidden_text_pdf(path: Path):
+    """ A page with a line of each kind of hidden text, next to text that shows. """
+    doc = pymupdf.open()
+    page = doc.new_page()
+    page.insert_text((72, 100), "visible jan@example.nl", fontsize=12)
+    page.insert_text((72, 130), "white piet@example.nl", fontsize=12, color=(1, 1, 1))
+    page.insert_text((72, 160), "render mode kees@example.nl", fontsize=12, render_mode=3)
+    page.insert_text((72, 190), "tiny anna@example.nl", fontsize=0.5)
+    page.insert_text((72, 220), "white on dark", fontsize=12, color=(1, 1, 1))
+    page.insert_text((72, 250), "invisible under image", fontsize=12, render_mode=3)
+    page.insert_image(pymupdf.Rect(60, 235, 300, 260), pixmap=pymupdf.Pixmap(pymupdf.csRGB, pymupdf.IRect(0, 0, 40, 10), False), keep_proportion=False)
+    # A dark backdrop behind the white line at y 220, as "re f": pdfminer takes the "re h f" of `draw_rect` for a curve
+    xref = page.get_contents()[-1]
+    doc.update_stream(xref, b"q 0 g 60 617 340 20 re f Q\n" + doc.xref_stream(xref))
+    doc.save(path)
+    doc.close()
+
+
+def covered_text(pdf_path: Path) -> str:
+    with open_document(pdf_path, "pymupdf") as pdf:
+        return "".join(artifact.text for artifact in extract_covered_text_from_page(pdf.pages[0]))
+
+
+def reference_hidden_text(page) -> tuple[str, str]:
+    """ The white and the invisible chars of a page, by a loop over its char dicts that ignores backdrops and images. """
+    white = invisible = ""
+    for char in page.chars:
+        render_mode = char.get('render_mode', 0)
+        if render_mode == RENDER_INVISIBLE or 0 < char.get('size', 0) < MIN_VISIBLE_FONT_SIZE:
+            invisible += char['text']
+        elif all(WHITE_TEXT_MIN <= c <= 1.0 for c in char.get('non_stroking_color') or [0]):
+            white += char['text']
+    return white, invisible
+
+
+def hidden_text(page) -> tuple[str, str]:
+    return "".join(a.text for a in extract_white_text_from_page(page)), "".join(a.text for a in extract_invisible_text_from_page(page))
+
+
+# The images are ordered among the text spans by the drawing operations before them, vector paths included
+@pytest.mark.parametrize("paths_before_text", [0, 50])
+@pytest.mark.parametrize("rotation", [0, 90])
+def test_text_under_image(tmp_path: Path, paths_before_text: int, rotation: int):
+    pdf_path = tmp_path / "covered.pdf"
+    make_covered_text_pdf(pdf_path, paths_before_text, rotation=rotation)
+    assert covered_text(pdf_path) == "covered jan.jansen@example.nl"
+
+
+def test_text_beside_clipped_image(tmp_path: Path):
+    pdf_path = tmp_path / "clipped.pdf"
+    make_covered_text_pdf(pdf_path, 0, clip=(250, 600, 50, 60))
+    assert covered_text(pdf_path) == ""
+
+
+def test_image_partly_clipped(tmp_path: Path):
+    pdf_path = tmp_path / "clipped.pdf"
+    make_covered_text_pdf(pdf_path, 0, clip=LEFT_OF_IMAGE)
+    with open_document(pdf_path, "pymupdf") as pdf:
+        image = pdf.pages[0].images[0]
+        assert image.bbox == pytest.approx(IMAGE_BBOX)
+        assert image.visible_bbox == pytest.approx((60, 632, 145, 662))
+    # Only the chars centred left of x 145 are covered
+    assert covered_text(pdf_path) == "covered jan.ja"
+
+
+def test_text_after_image(tmp_path: Path):
+    pdf_path = tmp_path / "after.pdf"
+    make_covered_text_pdf(pdf_path, 0, text_after_image="drawn over the image")
+    assert covered_text(pdf_path) == "covered jan.jansen@example.nl"
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("pdf_path", DOCUMENTS, ids=lambda path: path.name)
+def test_hidden_text_matches_reference(engine: str, pdf_path: Path):
+    with open_document(pdf_path, engine) as pdf:
+        for page in pdf.pages:
+            # Runs are split per line, so the texts are compared without whitespace
+            expected, actual = reference_hidden_text(page), hidden_text(page)
+            assert ["".join(text.split()) for text in actual] == ["".join(text.split()) for text in expected], f"page {page.page_number}"
+            page.close()
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_hidden_text_kinds(tmp_path: Path, engine: str):
+    pdf_path = tmp_path / "hidden.pdf"
+    make_hidden_text_pdf(pdf_path)
+    with open_document(pdf_path, engine) as pdf:
+        page = pdf.pages[0]
+        white = [a.text for a in extract_white_text_from_page(page)]
+        invisible = [a.text for a in extract_invisible_text_from_page(page)]
+    assert white == ["white piet@example.nl"]
+    # pdfplumber does not report the render mode of text, only the font size shows it is invisible
+    assert invisible == (["tiny anna@example.nl"] if engine == "pdfplumber" else ["render mode kees@example.nl", "tiny anna@example.nl"])
+
+
+@pytest.mark.parametrize("clip", [None, LEFT_OF_IMAGE, (250, 600, 50, 60)])
+def test_engines_agree_on_hidden_text(tmp_path: Path, clip: Optional[tuple]):
+    pdf_path = tmp_path / "covered.pdf"
+    make_covered_text_pdf(pdf_path, 10, clip=clip, text_after_image="drawn over the image")
+    results = []
+    for engine in ENGINES:
+        with open_document(pdf_path, engine) as pdf:
+            page = pdf.pages[0]
+            results.append((hidden_text(page), page.images[0].bbox))
+    (reference, reference_bbox), (candidate, candidate_bbox) = results
+    assert reference == candidate
+    assert candidate_bbox == pytest.approx(reference_bbox, abs=1)
@@ -0,0 +1,138 @@
+""" Decoding of image XObjects to OCR input (see `images.decode_image`): the NumPy decoder against the source pixels,
+Pillow and MuPDF, for every image kind it decodes itself. """
+import io
+from pathlib import Path
+
+import numpy as np
+import pdfplumber
+import pymupdf
+import pytest
+from PIL import Image
+
+from images import decode_image, decode_xref, open_fitz_document
+
+KINDS = ["gray", "gray16", "rgb", "cmyk", "indexed", "bilevel", "jpeg"]
+PALETTE = np.array([[0, 0, 0], [255, 255, 255], [200, 30, 30], [30, 30, 200]], dtype=np.uint8)
+
+# The NumPy decoder converts CMYK with the naive formula, MuPDF with a colour profile
+MAX_CMYK_PROFILE_DIFFERENCE = 40
+# Every other kind decodes to the same pixels, up to rounding
+MAX_MUPDF_DIFFERENCE = 2
+
+
+def _scan_like(size: int, rng: np.random.Generator) -> np.ndarray:
+    """ A grayscale 'scan': white paper, noise and dark text-like bars. """
+    pixels = np.full((size, size), 235, dtype=np.uint8)
+    pixels -= rng.integers(0, 20, size=(size, size), dtype=np.uint8)
+    for row in range(40, size - 40, 30):
+        width = int(rng.integers(size // 3, size - 80))
+        pixels[row:row + 12, 40:40 + width] = 20
+    return pixels
+
+
+def _cmyk(pixels: np.ndarray) -> np.ndarray:
+    return np.stack([np.zeros_like(pixels), np.zeros_like(pixels), 255 - pixels // 2, 255 - pixels], axis=-1)
+
+
+def _image_object(pixels: np.ndarray, kind: str) -> tuple[str, bytes]:
+    """ The dictionary entries and unencoded stream of an image XObject of the given kind, built from grayscale pixels. """
+    if kind == "gray":
+        return "/ColorSpace /DeviceGray /BitsPerComponent 8", pixels.tobytes()
+    if kind == "gray16":
+        return "/ColorSpace /DeviceGray /BitsPerComponent 16", (pixels.astype(">u2") * 257).tobytes()
+    if kind == "rgb":
+        rgb = np.stack([pixels, pixels // 2 + 100, pixels], axis=-1)
+        return "/ColorSpace /DeviceRGB /BitsPerComponent 8", rgb.tobytes()
+    if kind == "cmyk":
+        return "/ColorSpace /DeviceCMYK /BitsPerComponent 8", _cmyk(pixels).tobytes()
+    if kind == "indexed":
+        return f"/ColorSpace [/Indexed /DeviceRGB 3 <{PALETTE.tobytes().hex()}>] /BitsPerComponent 8", (pixels // 64).tobytes()
+    if kind == "bilevel":
+        return "/ColorSpace /DeviceGray /BitsPerComponent 1", np.packbits(pixels > 128, axis=1).tobytes()
+    if kind == "jpeg":
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, format="JPEG", quality=80)
+        return "/ColorSpace /DeviceGray /BitsPerComponent 8", buffer.getvalue()
+    raise ValueError(kind)
+
+
+def make_scanned_pdf(path: Path, pages: int, size: int, kinds: list[str], seed: int = 0) -> list[np.ndarray]:
+    """ Writes a PDF with one full-page image per page, cycling through the given image kinds, and returns the
+    grayscale pixels each image was built from. """
+    rng = np.random.default_rng(seed)
+    doc = pymupdf.open()
+    sources = []
+    for i in range(pages):
+        kind = kinds[i % len(kinds)]
+        pixels = _scan_like(size, rng)
+        sources.append(pixels)
+        page = doc.new_page(width=595, height=842)
+        entries, stream = _image_object(pixels, kind)
+        xref = doc.get_new_xref()
+        doc.update_object(xref, f"<< /Type /XObject /Subtype /Image /Width {size} /Height {size} {entries} >>")
+        if kind == "jpeg":
+            doc.update_stream(xref, stream, compress=False)
+            doc.xref_set_key(xref, "Filter", "/DCTDecode")
+        else:
+            doc.update_stream(xref, stream)  # FlateDecode
+        doc.xref_set_key(page.xref, "Resources", f"<< /XObject << /Im0 {xref} 0 R >> >>")
+        contents = doc.get_new_xref()
+        doc.update_object(contents, "<< >>")
+        doc.update_stream(contents, b"q 575 0 0 822 10 10 cm /Im0 Do Q")
+        doc.xref_set_key(page.xref, "Contents", f"{contents} 0 R")
+    doc.save(path)
+    doc.close()
+    return sources
+
+
+def expected_pixels(pixels: np.ndarray, kind: str, stream: bytes) -> np.ndarray:
+    """ What the image should decode to, worked out from its source pixels (and from Pillow for JPEG). """
+    if kind in ("gray", "gray16"):
+        return pixels
+    if kind == "rgb":
+        return np.stack([pixels, pixels // 2 + 100, pixels], axis=-1)
+    if kind == "cmyk":
+        cmyk = _cmyk(pixels).astype(int)
+        return ((255 - cmyk[..., :3]) * (255 - cmyk[..., 3:4]) // 255).astype(np.uint8)
+    if kind == "indexed":
+        return PALETTE[pixels // 64]
+    if kind == "bilevel":
+        return np.where(pixels > 128, 255, 0).astype(np.uint8)
+    if kind == "jpeg":
+        return np.asarray(Image.open(io.BytesIO(stream)))
+    raise ValueError(kind)
+
+
+@pytest.fixture(scope="module")
+def decoded(tmp_path_factory) -> dict[str, tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """ For every kind: the expected pixels, the NumPy decoder's and MuPDF's. """
+    pdf_path = tmp_path_factory.mktemp("images") / "kinds.pdf"
+    sources = make_scanned_pdf(pdf_path, len(KINDS), 200, KINDS)
+    fitz_doc = open_fitz_document(pdf_path)
+    result = {}
+    with pdfplumber.open(pdf_path) as pdf:
+        for kind, pixels, page in zip(KINDS, sources, pdf.pages):
+            image = page.images[0]
+            mupdf_pixels = np.array(decode_xref(fitz_doc, image['stream'].objid).pixels)
+            result[kind] = (expected_pixels(pixels, kind, image['stream'].get_data()), decode_image(image).pixels, mupdf_pixels)
+    fitz_doc.close()
+    return result
+
+
+def _max_difference(a: np.ndarray, b: np.ndarray) -> int:
+    assert a.shape == b.shape
+    return int(np.abs(a.astype(int) - b.astype(int)).max())
+
+
+@pytest.mark.parametrize("kind", KINDS)
+def test_numpy_decoder(decoded, kind: str):
+    expected, numpy_pixels, _ = decoded[kind]
+    assert numpy_pixels.dtype == np.uint8
+    assert _max_difference(numpy_pixels, expected) == 0
+
+
+@pytest.mark.parametrize("kind", KINDS)
+def test_numpy_decoder_matches_mupdf(decoded, kind: str):
+    _, numpy_pixels, mupdf_pixels = decoded[kind]
+    tolerance = MAX_CMYK_PROFILE_DIFFERENCE if kind == "cmyk" else MAX_MUPDF_DIFFERENCE
+    assert _max_difference(numpy_pixels, mupdf_pixels) <= tolerance
@@ -0,0 +1,85 @@
+""" Time limits inside the process that processes a document (see `limits.PageGuard`). """
+import time
+from pathlib import Path
+
+import numpy as np
+import pymupdf
+import pytest
+
+from backends import open_document
+from classes import LimitsConfiguration, OCRConfiguration, ProcessingStatus
+from helpers import ImagePIIDetector
+from limits import PageGuard
+from ocr import OCRService, get_ocr_cache
+from pipeline import PagePipeline
+
+# One page with one image, which is left for the OCR batch after the last page
+DOCUMENT = Path(__file__).resolve().parent / "data" / "testdoc.pdf"
+
+
+@pytest.mark.parametrize("limits, status", [
+    (LimitsConfiguration(page_seconds=0.2), ProcessingStatus.PAGE_TIMEOUT),
+    (LimitsConfiguration(document_seconds=0.2), ProcessingStatus.TIMEOUT),
+])
+def test_interrupted_ocr_batch_is_counted(monkeypatch: pytest.MonkeyPatch, limits: LimitsConfiguration, status: ProcessingStatus):
+    monkeypatch.setattr(OCRService, "readtext_batch", lambda self, images: time.sleep(5))
+    stats = {}
+    guard = PageGuard(limits)
+    with open_document(DOCUMENT) as pdf:
+        assert PagePipeline([ImagePIIDetector(DOCUMENT, OCRConfiguration(cache_size=0), stats)], guard=guard).run(pdf) == []
+    assert guard.status is status
+    assert stats["ocr_skipped"] == stats["ocr_skipped_timeout"] == 1
+
+
+def make_images_pdf(path: Path, seeds: list[int]):
+    """ A page with a noise image per seed, the same seed gives the same image. """
+    doc = pymupdf.open()
+    page = doc.new_page()
+    for i, seed in enumerate(seeds):
+        pixels = np.random.default_rng(seed).integers(0, 256, (100, 100, 3), dtype=np.uint8)
+        pixmap = pymupdf.Pixmap(pymupdf.csRGB, 100, 100, pixels.tobytes(), False)
+        page.insert_image(pymupdf.Rect(50 + 120 * i, 50, 150 + 120 * i, 150), pixmap=pixmap)
+    doc.save(path)
+    doc.close()
+
+
+def test_interrupted_ocr_batch_keeps_known_text(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    # The first image is in the OCR cache, the second is to be read and the third repeats it
+    pdf_path = tmp_path / "images.pdf"
+    make_images_pdf(pdf_path, [1, 2, 2])
+    config = OCRConfiguration(cache_size=17)
+    with open_document(pdf_path, "pymupdf") as pdf:
+        cached = pdf.pages[0].images[0]
+        get_ocr_cache(config).put(cached.key(config.languages), ["mail jan.jansen@example.nl"])
+    monkeypatch.setattr(OCRService, "readtext_batch", lambda self, images: time.sleep(5))
+
+    stats = {}
+    detector = ImagePIIDetector(pdf_path, config, stats)
+    guard = PageGuard(LimitsConfiguration(page_seconds=0.2))
+    with open_document(pdf_path, "pymupdf") as pdf:
+        findings = PagePipeline([detector], guard=guard).run(pdf)
+    assert guard.status is ProcessingStatus.PAGE_TIMEOUT
+    assert stats["ocr_skipped"] == stats["ocr_skipped_timeout"] == 2
+    assert "jan.jansen@example.nl" in [finding.matched_data for finding in findings]
+
+
+def test_batches_read_before_interruption_are_kept(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    # One image per batch, both filled by the same page: the first is read, the second runs out of time
+    pdf_path = tmp_path / "images.pdf"
+    make_images_pdf(pdf_path, [3, 4])
+    calls = []
+
+    def readtext_batch(self, images):
+        if calls:
+            time.sleep(5)
+        calls.append(images)
+        return [["mail jan.jansen@example.nl"]]
+
+    monkeypatch.setattr(OCRService, "readtext_batch", readtext_batch)
+    stats = {}
+    guard = PageGuard(LimitsConfiguration(page_seconds=0.2))
+    with open_document(pdf_path, "pymupdf") as pdf:
+        findings = PagePipeline([ImagePIIDetector(pdf_path, OCRConfiguration(batch_size=1, cache_size=0), stats)], guard=guard).run(pdf)
+    assert guard.status is ProcessingStatus.PAGE_TIMEOUT
+    assert stats["ocr_skipped_timeout"] == 1
+    assert [finding.matched_data for finding in findings] == ["jan.jansen@example.nl"]
@@ -0,0 +1,93 @@
+""" Deduplication of OCR (see `ocr.OCRResultCache`): the in-memory LRU, the SQLite file shared by workers and runs,
+and repeats of an image within a batch. """
+import hashlib
+from collections import Counter
+from pathlib import Path
+
+import pytest
+
+from backends import open_document
+from classes import OCRConfiguration
+from helpers import ImagePIIDetector
+from ocr import OCRResultCache, OCRService
+from pipeline import PagePipeline
+from test_limits import make_images_pdf
+
+
+@pytest.fixture
+def read_images(monkeypatch: pytest.MonkeyPatch) -> list[int]:
+    """ The sizes of the batches handed to OCR, which recognises every image as an address named after its pixels. """
+    batches = []
+
+    def readtext_batch(self, images):
+        batches.append(len(images))
+        return [[f"{hashlib.sha256(image.tobytes()).hexdigest()[:8]}@example.nl"] for image in images]
+
+    monkeypatch.setattr(OCRService, "readtext_batch", readtext_batch)
+    return batches
+
+
+def scan(pdf_path: Path, config: OCRConfiguration) -> tuple[list[str], dict]:
+    stats = {}
+    with open_document(pdf_path, "pymupdf") as pdf:
+        findings = PagePipeline([ImagePIIDetector(pdf_path, config, stats)]).run(pdf)
+    return [finding.matched_data for finding in findings], stats
+
+
+def test_lru_keeps_the_recently_used():
+    cache = OCRResultCache(2)
+    cache.put("a", ["a"])
+    cache.put("b", ["b"])
+    assert cache.get("a") == ["a"]
+    cache.put("c", ["c"])
+    assert cache.get("b") is None
+    assert cache.get("a") == ["a"]
+    assert cache.get("c") == ["c"]
+    cache.put("d", ["d"])
+    assert [key for key in "abcd" if cache.get(key) is not None] == ["c", "d"]
+
+
+def test_miss():
+    cache = OCRResultCache(2)
+    cache.put("a", [])
+    assert cache.get("b") is None
+    # An image without text is a hit all the same
+    assert cache.get("a") == []
+
+
+def test_sqlite_is_shared_by_instances(tmp_path: Path):
+    path = tmp_path / "ocr" / "ocr_cache.sqlite"
+    first = OCRResultCache(1, path)
+    for key in "abc":
+        first.put(key, [key, "line"])
+    second = OCRResultCache(1, path)
+    assert [second.get(key) for key in "abcd"] == [["a", "line"], ["b", "line"], ["c", "line"], None]
+
+
+def test_repeats_in_a_batch_are_read_once(tmp_path: Path, read_images: list[int]):
+    pdf_path = tmp_path / "images.pdf"
+    make_images_pdf(pdf_path, [1, 2, 2, 1, 3])
+    found, stats = scan(pdf_path, OCRConfiguration(cache_path=tmp_path / "ocr.sqlite"))
+    assert read_images == [3]
+    assert (stats["ocr_cache_hits"], stats["ocr_cache_misses"]) == (2, 3)
+    # Every repeat has the text of the image it repeats
+    assert sorted(Counter(found).values()) == [1, 2, 2]
+
+
+def test_repeats_across_documents_are_not_read(tmp_path: Path, read_images: list[int]):
+    config = OCRConfiguration(cache_path=tmp_path / "ocr.sqlite")
+    make_images_pdf(tmp_path / "first.pdf", [1, 2])
+    make_images_pdf(tmp_path / "second.pdf", [2, 1])
+    first, _ = scan(tmp_path / "first.pdf", config)
+    second, stats = scan(tmp_path / "second.pdf", config)
+    assert read_images == [2]
+    assert (stats["ocr_cache_hits"], stats["ocr_cache_misses"]) == (2, 0)
+    assert sorted(second) == sorted(first)
+
+
+def test_without_cache_every_image_is_read(tmp_path: Path, read_images: list[int]):
+    pdf_path = tmp_path / "images.pdf"
+    make_images_pdf(pdf_path, [1, 1, 1])
+    found, stats = scan(pdf_path, OCRConfiguration(cache_size=0))
+    assert read_images == [3]
+    assert len(set(found)) == 1 and len(found) == 3
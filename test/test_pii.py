@@ -0,0 +1,54 @@
+""" Parity of `pii.PIIScanner`, whose prefilters skip patterns and text, with a plain `re.finditer` per pattern. """
+import random
+import re
+
+import pytest
+
+from pii import PIIScanner
+from regexes import re_objects
+
+# Patterns whose prefilters must respect global and scoped flags
+FLAG_PATTERNS = {
+    "scoped_iban": r"(?i:nl)\d{2}[A-Z]{4}\d{10}",
+    "global_iban": r"(?i)iban:\s?nl\d{2}",
+    "scoped_off": r"(?i)(?-i:NL)x\d",
+    "scoped_word": r"(?i:kvk nummer):?\s\d{8}",
+    "kelvin": r"(?i:k)\d{3}",
+    "branch": r"(?:(?i:ab)|AB)@\d",
+}
+
+FRAGMENTS = [
+    "NL91ABNA0417164300", "nl91ABNA0417164300", "Nl91abna0417164300", "IBAN: NL91", "iban:nl12", "IbAn: Nl34",
+    "NLx1", "nlx2", "nLX3", "KvK nummer: 12345678", "KVK NUMMER 87654321", "kvk\nnummer 12345678", "K123", "k456", "\u212a321",
+    "K789", "ab@1", "AB@2", "aB@3", "jan.jansen@example.nl", "06-12345678", "1234 AB", "123456789",
+]
+
+
+def text(seed: int) -> str:
+    rng = random.Random(seed)
+    words = "de het een van the of and invoice page total".split()
+    return "".join(rng.choice(FRAGMENTS + words) + rng.choice(" \n\t") for _ in range(2000))
+
+
+def reference(patterns: dict[str, str], text: str) -> list[tuple[str, str, int, int]]:
+    return [
+        (kind, match.group(0), match.start(), match.end())
+        for kind, pattern in patterns.items()
+        for match in re.compile(pattern).finditer(text)
+        if match.group(0)
+    ]
+
+
+@pytest.mark.parametrize("patterns", [re_objects, FLAG_PATTERNS], ids=["repo", "flags"])
+@pytest.mark.parametrize("seed", range(3))
+def test_scan_matches_finditer(patterns: dict[str, str], seed: int):
+    sample = text(seed)
+    expected = reference(patterns, sample)
+    assert expected
+    assert [tuple(match) for match in PIIScanner(patterns).scan(sample)] == expected
+
+
+def test_every_flag_pattern_matches():
+    sample = "".join(fragment + " " for fragment in FRAGMENTS)
+    found = {match.kind for match in PIIScanner(FLAG_PATTERNS).scan(sample)}
+    assert found == set(FLAG_PATTERNS)
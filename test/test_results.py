@@ -0,0 +1,93 @@
+""" Streamed results (see `results.py`): `--jsonl`, `--resume` after a crash, and compacting into `results.json`. """
+import json
+import shutil
+import sys
+from pathlib import Path
+
+import pytest
+
+import main
+from results import JSON_RESULTS, JSONL_RESULTS, compact_results
+
+DATA = Path(__file__).resolve().parent / "data"
+
+
+@pytest.fixture
+def documents(tmp_path: Path) -> Path:
+    directory = tmp_path / "documents"
+    directory.mkdir()
+    for name in ("sample.pdf", "testdoc.pdf"):
+        shutil.copy(DATA / name, directory / name)
+    return directory
+
+
+def run(monkeypatch, documents: Path, output_dir: Path, *options: str):
+    monkeypatch.setattr(sys, "argv", ["main.py", str(documents), "-o", str(output_dir), "--no-regex", "--no-cache", "-w", "0", *options])
+    main.main()
+
+
+def read_lines(path: Path) -> list[bytes]:
+    return path.read_bytes().splitlines(keepends=True)
+
+
+def test_resume_skips_recorded_documents(monkeypatch, documents: Path, tmp_path: Path):
+    run(monkeypatch, documents, tmp_path, "--jsonl")
+    jsonl_path = tmp_path / JSONL_RESULTS
+    first_run = read_lines(jsonl_path)
+    assert len(first_run) == 2
+
+    run(monkeypatch, documents, tmp_path, "--resume")
+    assert read_lines(jsonl_path) == first_run
+
+
+def test_resume_reprocesses_truncated_last_record(monkeypatch, documents: Path, tmp_path: Path):
+    run(monkeypatch, documents, tmp_path, "--jsonl")
+    jsonl_path = tmp_path / JSONL_RESULTS
+    complete, truncated = read_lines(jsonl_path)
+    # As left by a crash halfway through writing the second record
+    jsonl_path.write_bytes(complete + truncated[:len(truncated) // 2])
+
+    run(monkeypatch, documents, tmp_path, "--resume")
+    lines = read_lines(jsonl_path)
+    assert lines[0] == complete
+    assert [json.loads(line)["path"] for line in lines] == [json.loads(complete)["path"], json.loads(truncated)["path"]]
+
+
+def test_resume_retries_partial_results(monkeypatch, documents: Path, tmp_path: Path):
+    run(monkeypatch, documents, tmp_path, "--jsonl")
+    jsonl_path = tmp_path / JSONL_RESULTS
+    complete, partial = read_lines(jsonl_path)
+    record = json.loads(partial)
+    record["status"] = "timeout"
+    jsonl_path.write_bytes(complete + json.dumps(record).encode() + b"\n")
+
+    run(monkeypatch, documents, tmp_path, "--resume")
+    records = [json.loads(line) for line in read_lines(jsonl_path)]
+    assert [(r["path"], r["status"]) for r in records] == [(json.loads(complete)["path"], "complete"), (record["path"], "timeout"), (record["path"], "complete")]
+
+
+def test_compact_matches_json_dump(monkeypatch, documents: Path, tmp_path: Path):
+    run(monkeypatch, documents, tmp_path, "--jsonl")
+    jsonl_path = tmp_path / JSONL_RESULTS
+    records = [json.loads(line) for line in read_lines(jsonl_path)]
+    # A document recorded again, after a rerun: its last record wins and keeps its place
+    rerun = dict(records[0], title="rerun")
+    with open(jsonl_path, "a") as f:
+        f.write(json.dumps(rerun) + "\n")
+
+    assert compact_results(jsonl_path, tmp_path / JSON_RESULTS) == 2
+    assert (tmp_path / JSON_RESULTS).read_text() == json.dumps([rerun, records[1]], indent=4)
+
+
+def test_compact_empty(tmp_path: Path):
+    (tmp_path / JSONL_RESULTS).write_text("")
+    assert compact_results(tmp_path / JSONL_RESULTS, tmp_path / JSON_RESULTS) == 0
+    assert json.loads((tmp_path / JSON_RESULTS).read_text()) == []
+
+
+def test_compact_matches_a_run_without_jsonl(monkeypatch, documents: Path, tmp_path: Path):
+    streamed, whole = tmp_path / "streamed", tmp_path / "whole"
+    run(monkeypatch, documents, streamed, "--jsonl")
+    run(monkeypatch, documents, whole)
+    compact_results(streamed / JSONL_RESULTS, streamed / JSON_RESULTS)
+    assert (streamed / JSON_RESULTS).read_text() == (whole / JSON_RESULTS).read_text()
@@ -0,0 +1,115 @@
+""" The scan server (see `server.py`), with documents processed in the server process itself. """
+import http.client
+import json
+import threading
+from pathlib import Path
+
+import pytest
+
+from cache import ResultCache
+from classes import CacheConfiguration
+from helpers import has_cached_result
+from server import Scanner, make_server, parse_address
+
+DOCUMENT = Path(__file__).resolve().parent / "data" / "testdoc.pdf"
+
+
+@pytest.fixture
+def cache_config(tmp_path: Path) -> CacheConfiguration:
+    return CacheConfiguration(tmp_path / "results_cache.sqlite", max_size_mb=0.01, max_age_days=0)
+
+
+def test_scan_evicts_from_the_result_cache(tmp_path: Path, cache_config: CacheConfiguration):
+    cache = ResultCache(cache_config.path)
+    for i in range(10):
+        cache.put(f"stale-{i}", {"padding": "x" * 4096})
+    cache.close()
+
+    scanner = Scanner(dict(do_regex=False, output_path=tmp_path, cache_config=cache_config), 0)
+    try:
+        assert scanner.scan(DOCUMENT).ok
+    finally:
+        scanner.close()
+
+    cache = ResultCache(cache_config.path)
+    total = cache._connection.execute("SELECT SUM(size) FROM results").fetchone()[0]
+    cache.close()
+    assert total <= cache_config.max_size_mb * 1024 * 1024
+
+
+def test_scans_from_separate_threads(tmp_path: Path):
+    # Like the request threads of the server, with the result cache on
+    cache_config = CacheConfiguration(tmp_path / "results_cache.sqlite")
+    scanner = Scanner(dict(do_regex=False, output_path=tmp_path, cache_config=cache_config), 0)
+    results = []
+    try:
+        for _ in range(2):
+            thread = threading.Thread(target=lambda: results.append(scanner.scan(DOCUMENT)))
+            thread.start()
+            thread.join()
+    finally:
+        scanner.close()
+    assert [result.ok for result in results] == [True, True]
+    assert results[0].scanned_pdf.to_dict() == results[1].scanned_pdf.to_dict()
+    assert has_cached_result(DOCUMENT, False, cache_config=cache_config)
+
+
+@pytest.mark.parametrize("address, expected", [
+    ("8765", ("127.0.0.1", 8765)),
+    ("localhost:8080", ("localhost", 8080)),
+    ("127.0.0.1:8080", ("127.0.0.1", 8080)),
+    ("[::1]:8080", ("::1", 8080)),
+    ("scraper.sock", "scraper.sock"),
+    ("/tmp/scraper.sock", "/tmp/scraper.sock"),
+    ("run/scraper:main", "run/scraper:main"),
+    ("run/scraper:8765", "run/scraper:8765"),
+])
+def test_parse_address(address: str, expected):
+    assert parse_address(address) == expected
+
+
+@pytest.mark.parametrize("address", ["0.0.0.0:8765", "192.0.2.1:8765", "[::]:8765"])
+def test_remote_addresses_need_opt_in(address: str):
+    with pytest.raises(ValueError):
+        parse_address(address)
+    assert parse_address(address, allow_remote=True)[1] == 8765
+
+
+@pytest.fixture
+def server(tmp_path: Path):
+    output_dir = tmp_path / "output"
+    output_dir.mkdir()
+    scanner = Scanner(dict(do_regex=False, output_path=output_dir, cache_config=None), 0)
+    server = make_server("127.0.0.1:0", scanner)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+    scanner.close()
+
+
+def upload(server, name: str) -> tuple[int, dict]:
+    connection = http.client.HTTPConnection(*server.server_address)
+    try:
+        connection.request("POST", "/scan", DOCUMENT.read_bytes(), {"Content-Type": "application/pdf", "X-Filename": name})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        connection.close()
+
+
+def test_uploads_write_no_result_files(server, tmp_path: Path):
+    for _ in range(2):
+        status, data = upload(server, "report.pdf")
+        assert status == 200
+        assert data["path"] == "report.pdf"
+    assert list((tmp_path / "output").iterdir()) == []
+
+
+@pytest.mark.parametrize("name", ["", ".", "..", "dir/.."])
+def test_upload_needs_a_file_name(server, name: str):
+    status, data = upload(server, name)
+    assert status == 400
+    assert "error" in data
@@ -0,0 +1,118 @@
+""" Merging the page-range shards of a document (see `helpers.merge_shards`), also when the worker of a shard was killed. """
+import asyncio
+import time
+from concurrent.futures import Future
+from pathlib import Path
+
+import pytest
+
+import backends
+from backends import UnreadablePDF, page_count
+from classes import CacheConfiguration, LimitsConfiguration, ProcessingStatus, ScannedPDF
+from executor import _collect, plan_shards, run_in_pool
+from helpers import has_cached_result, merge_shards, process_pdf
+from workers import WorkerKilled
+
+DOCUMENT = Path(__file__).resolve().parent / "data" / "sample.pdf"
+SHARDS = [slice(0, 1), slice(1, None)]
+
+
+def scan(pages, output_dir: Path, **kwargs) -> ScannedPDF:
+    return asyncio.run(process_pdf(DOCUMENT, False, output_dir, pages=pages, **kwargs))
+
+
+def killed() -> ScannedPDF:
+    """ What the executor reports for a shard whose worker was killed. """
+    future = Future()
+    future.set_exception(WorkerKilled("The worker process was killed"))
+    return _collect(future, DOCUMENT).scanned_pdf
+
+
+def metadata(scanned_pdf: ScannedPDF) -> dict:
+    data = scanned_pdf.to_dict()
+    return {key: value for key, value in data.items() if key not in ("findings", "stats", "status", "potential_signatures")}
+
+
+@pytest.fixture
+def whole(tmp_path: Path) -> ScannedPDF:
+    return scan(None, tmp_path)
+
+
+def test_merge_matches_whole_document(whole: ScannedPDF, tmp_path: Path):
+    merged = merge_shards(DOCUMENT, [scan(pages, tmp_path) for pages in SHARDS], False, tmp_path)
+    assert merged.to_dict() == whole.to_dict()
+
+
+def test_merge_with_killed_first_shard(whole: ScannedPDF, tmp_path: Path):
+    cache_config = CacheConfiguration(tmp_path / "results_cache.sqlite")
+    merged = merge_shards(DOCUMENT, [killed(), scan(SHARDS[1], tmp_path)], False, tmp_path, cache_config=cache_config)
+    assert merged.status is ProcessingStatus.KILLED
+    # Metadata comes from the shard that finished, the signature check on the last page still counts
+    assert metadata(merged) == metadata(whole)
+    assert merged.potential_signatures == whole.potential_signatures
+    assert all(finding.page_number == 2 for finding in merged.findings)
+    assert not has_cached_result(DOCUMENT, False, cache_config=cache_config)
+
+
+def test_merge_with_killed_last_shard(whole: ScannedPDF, tmp_path: Path):
+    merged = merge_shards(DOCUMENT, [scan(SHARDS[0], tmp_path), killed()], False, tmp_path)
+    assert merged.status is ProcessingStatus.KILLED
+    assert metadata(merged) == metadata(whole)
+    # The last page was never checked
+    assert merged.potential_signatures is None
+    assert merged.to_dict()["potential_signatures"] is None
+
+
+def test_merge_with_unstarted_shard(whole: ScannedPDF, tmp_path: Path):
+    cache_config = CacheConfiguration(tmp_path / "results_cache.sqlite")
+    merged = merge_shards(DOCUMENT, [scan(SHARDS[0], tmp_path), None], False, tmp_path, cache_config=cache_config)
+    assert merged.status is ProcessingStatus.TIMEOUT
+    assert metadata(merged) == metadata(whole)
+    assert merged.potential_signatures is None
+    assert not has_cached_result(DOCUMENT, False, cache_config=cache_config)
+
+
+def test_shard_stops_at_document_deadline(tmp_path: Path):
+    # The deadline of the document is shorter than the time limit the shard would get by itself
+    shard = scan(SHARDS[1], tmp_path, limits=LimitsConfiguration(document_seconds=60), deadline=time.time() - 1)
+    assert shard.status is ProcessingStatus.TIMEOUT
+    assert shard.findings == []
+
+
+def test_shards_share_document_time_limit(tmp_path: Path, caplog: pytest.LogCaptureFixture):
+    kwargs = dict(do_regex=False, output_path=tmp_path, limits=LimitsConfiguration(document_seconds=0.01))
+    # One shard at a time: the second is due after the document ran out of time and is not started
+    [result] = run_in_pool([DOCUMENT], kwargs, workers=1, max_in_flight=1, shard_pages=1)
+    assert result.ok
+    assert result.scanned_pdf.status is ProcessingStatus.TIMEOUT
+    assert result.scanned_pdf.findings == []
+    assert result.scanned_pdf.potential_signatures is None
+    assert "not starting shard 2" in caplog.text
+
+
+def test_shards_of_cached_document(whole: ScannedPDF, tmp_path: Path):
+    cache_config = CacheConfiguration(tmp_path / "results_cache.sqlite")
+    scan(None, tmp_path, cache_config=cache_config)
+    # Planned without looking at the cache, the shards take their pages from the cached result
+    assert plan_shards(DOCUMENT, dict(cache_config=cache_config), 1) == SHARDS
+    shards = [scan(pages, tmp_path, cache_config=cache_config) for pages in SHARDS]
+    assert all(finding.page_number == 1 for finding in shards[0].findings)
+    assert shards[0].potential_signatures is None
+    merged = merge_shards(DOCUMENT, shards, False, tmp_path)
+    assert merged.to_dict() == whole.to_dict()
+
+
+def test_page_count_is_read_once(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    opened = []
+    load_fitz = backends.load_fitz
+    monkeypatch.setattr(backends, "load_fitz", lambda: opened.append(1) or load_fitz())
+    pdf_path = tmp_path / "sample.pdf"
+    pdf_path.write_bytes(DOCUMENT.read_bytes())
+    assert page_count(pdf_path) == page_count(pdf_path) == 2
+    assert plan_shards(pdf_path, {}, 1) == SHARDS
+    assert len(opened) == 1
+    # Read again once the file changes
+    pdf_path.write_bytes(b"not a PDF")
+    with pytest.raises(UnreadablePDF):
+        page_count(pdf_path)
+    assert plan_shards(pdf_path, {}, 1) == [None]
@@ -0,0 +1,112 @@
+""" OCR triage and budget (see `triage.ImageTriage`): every reason to skip an image is counted in the stats of the
+result, and the images that are not skipped still reach OCR. """
+import asyncio
+import time
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pymupdf
+import pytest
+
+from backends import ENGINES
+from classes import ArtifactType, LimitsConfiguration, OCRConfiguration, ProcessingStatus
+from helpers import process_pdf
+from ocr import OCRService
+from triage import SKIP_REASONS
+
+# Drawn on every page, recognised as `FOUND`
+GOOD_IMAGE = np.random.default_rng(0).integers(0, 256, (100, 100), dtype=np.uint8)
+FOUND = "jan.jansen@example.nl"
+
+
+def low_entropy() -> np.ndarray:
+    # Far from blank, but 50 dark pixels among white ones carry less than 0.1 bit per pixel
+    pixels = np.full((100, 100), 255, dtype=np.uint8)
+    pixels.flat[:50] = 0
+    return pixels
+
+
+# reason -> the image skipped for it (None: a second good image) and the `OCRConfiguration` options that skip it
+CASES = {
+    "small": (np.random.default_rng(1).integers(0, 256, (10, 10), dtype=np.uint8), {}),
+    "aspect": (np.random.default_rng(2).integers(0, 256, (40, 2000), dtype=np.uint8), {}),
+    "text_layer": (np.random.default_rng(3).integers(0, 256, (200, 150), dtype=np.uint8), {}),
+    "blank": (np.full((100, 100), 200, dtype=np.uint8), {}),
+    "low_entropy": (low_entropy(), {}),
+    "budget": (None, dict(max_images=1)),
+}
+
+
+@pytest.fixture
+def read_images(monkeypatch: pytest.MonkeyPatch) -> list[np.ndarray]:
+    """ The images handed to OCR, which finds `FOUND` in each. From the second batch on OCR takes 5 seconds. """
+    images_read = []
+
+    def readtext_batch(self, images):
+        if images_read:
+            time.sleep(5)
+        images_read.extend(images)
+        return [[FOUND] for _ in images]
+
+    monkeypatch.setattr(OCRService, "readtext_batch", readtext_batch)
+    return images_read
+
+
+def insert_pixels(page, rect: pymupdf.Rect, pixels: np.ndarray):
+    height, width = pixels.shape
+    page.insert_image(rect, pixmap=pymupdf.Pixmap(pymupdf.csGRAY, width, height, pixels.tobytes(), False), keep_proportion=False)
+
+
+def make_triage_pdf(path: Path, skipped: Optional[np.ndarray], text_layer: bool = False):
+    """ A page with the image to skip (a second good image for None), then the good one. A `text_layer` page has the
+    image to skip cover the whole page, under a line of text. """
+    doc = pymupdf.open()
+    page = doc.new_page()
+    if text_layer:
+        insert_pixels(page, page.rect, skipped)
+        page.insert_text((72, 400), "The text layer of a scanned page, over the scan", fontsize=10)
+    else:
+        insert_pixels(page, pymupdf.Rect(50, 50, 250, 150), skipped if skipped is not None else GOOD_IMAGE[::-1])
+    insert_pixels(page, pymupdf.Rect(300, 50, 400, 150), GOOD_IMAGE)
+    doc.save(path)
+    doc.close()
+
+
+def skipped_stats(stats: dict) -> dict:
+    return {key: value for key, value in stats.items() if key.startswith("ocr_skipped") and value}
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("reason", CASES)
+def test_skip_reason(tmp_path: Path, read_images: list[np.ndarray], engine: str, reason: str):
+    skipped, options = CASES[reason]
+    # Without deduplication, so that every image that is not skipped is read
+    config = OCRConfiguration(cache_size=0, **options)
+    pdf_path = tmp_path / f"{reason}.pdf"
+    make_triage_pdf(pdf_path, skipped, text_layer=reason == "text_layer")
+
+    scanned_pdf = asyncio.run(process_pdf(pdf_path, True, None, config, engine=engine))
+    assert skipped_stats(scanned_pdf.stats) == {"ocr_skipped": 1, f"ocr_skipped_{reason}": 1}
+    # The good image, or the first of the two when the budget leaves room for one
+    assert len(read_images) == 1
+    assert np.array_equal(read_images[0], GOOD_IMAGE if skipped is not None else GOOD_IMAGE[::-1])
+    assert [finding.matched_data for finding in scanned_pdf.findings if finding.artifact_type is ArtifactType.IMAGE] == [FOUND]
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_skip_reason_timeout(tmp_path: Path, read_images: list[np.ndarray], engine: str):
+    # One image per batch: the first is read, OCR of the second runs out of time
+    pdf_path = tmp_path / "timeout.pdf"
+    make_triage_pdf(pdf_path, None)
+    config = OCRConfiguration(batch_size=1, cache_size=0)
+
+    scanned_pdf = asyncio.run(process_pdf(pdf_path, True, None, config, engine=engine, limits=LimitsConfiguration(page_seconds=0.5)))
+    assert scanned_pdf.status is ProcessingStatus.PAGE_TIMEOUT
+    assert skipped_stats(scanned_pdf.stats) == {"ocr_skipped": 1, "ocr_skipped_timeout": 1}
+    assert len(read_images) == 1
+    assert [finding.matched_data for finding in scanned_pdf.findings if finding.artifact_type is ArtifactType.IMAGE] == [FOUND]
+
+
+def test_every_reason_is_covered():
+    assert set(CASES) | {"timeout"} == set(SKIP_REASONS)
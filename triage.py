@@ -0,0 +1,58 @@
+from typing import Optional
+
+import numpy as np
+
+from backends import DocumentPage, PageImage
+from classes import OCRConfiguration
+from images import DecodedImage
+
+# Why an image was not recognised, reported as `ocr_skipped_<reason>` in the stats of a result
+SKIP_REASONS = ("small", "aspect", "text_layer", "blank", "low_entropy", "budget", "timeout")
+
+# Pixel statistics are taken on a sample of about this many pixels per side
+_SAMPLE_SIDE = 256
+# Only images covering at least this fraction of their page are checked against the text layer: scans of the page,
+# rather than figures that happen to have a caption or labels drawn over them
+TEXT_LAYER_MIN_COVER = 0.5
+# Standard deviation of the grey levels below which an image is considered empty
+BLANK_STD = 2.0
+
+
+class ImageTriage:
+    """ Cheap checks that keep images which are not worth recognising away from OCR.
+
+    Pixel size, aspect ratio and whether the image is a scan of a page that already has a text layer are checked before
+    it is decoded. Blankness and the entropy of its grey levels are checked on the decoded pixels, before OCR.
+    """
+
+    def __init__(self, config: OCRConfiguration):
+        self.config: OCRConfiguration = config
+
+    def before_decode(self, page: DocumentPage, img: PageImage) -> Optional[str]:
+        """ The reason to skip an image, judging by its size and placement, or None to decode it. """
+        width, height = img.size
+        if min(width, height) < max(self.config.min_image_side, 1):
+            return "small"
+        if self.config.max_aspect_ratio and max(width, height) > self.config.max_aspect_ratio * min(width, height):
+            return "aspect"
+        if self.config.text_layer_chars:
+            x0, y0, x1, y1 = img.bbox
+            if (x1 - x0) * (y1 - y0) >= TEXT_LAYER_MIN_COVER * page.area and len(page.char_index.contained(x0, y0, x1, y1)) >= self.config.text_layer_chars:
+                return "text_layer"
+        return None
+
+    def after_decode(self, image: DecodedImage) -> Optional[str]:
+        """ The reason to skip an image, judging by its pixels, or None to recognise it. """
+        pixels = image.pixels
+        step = max(1, max(pixels.shape[:2]) // _SAMPLE_SIDE)
+        sample = pixels[::step, ::step]
+        if sample.ndim == 3:
+            sample = sample.mean(axis=2).astype(np.uint8)
+        if sample.std() < BLANK_STD:
+            return "blank"
+        if self.config.min_entropy:
+            counts = np.bincount(sample.ravel(), minlength=256)
+            p = counts[counts > 0] / sample.size
+            if -(p * np.log2(p)).sum() < self.config.min_entropy:
+                return "low_entropy"
+        return None
@@ -0,0 +1,222 @@
+import collections
+import logging
+import multiprocessing as mp
+import threading
+import time
+import traceback
+from concurrent.futures import Executor, Future
+from multiprocessing.connection import wait
+from typing import Callable, Optional
+
+from classes import LimitsConfiguration
+from limits import KILL_GRACE_SECONDS, rss_mb, set_progress_callback
+
+# How often the pool checks its busy workers against the limits
+POLL_SECONDS = 0.5
+
+
+class WorkerKilled(Exception):
+    """ The worker running a task died, or was killed for exceeding a limit, before it returned a result. """
+
+
+def _work(conn, initializer: Optional[Callable], initargs: tuple):
+    if initializer is not None:
+        initializer(*initargs)
+    set_progress_callback(lambda: conn.send(("progress", None)))
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            # The pool is gone
+            return
+        if task is None:
+            return
+        fn, args, kwargs = task
+        try:
+            reply = ("result", fn(*args, **kwargs))
+        except Exception:
+            reply = ("error", traceback.format_exc())
+        try:
+            conn.send(reply)
+        except Exception:
+            conn.send(("error", traceback.format_exc()))
+
+
+class _Worker:
+    def __init__(self, context, initializer: Optional[Callable], initargs: tuple):
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=_work, args=(child, initializer, initargs))
+        self.process.start()
+        child.close()
+        self.future: Optional[Future] = None
+        # When the current task started, and when it last reported progress
+        self.started: float = 0.0
+        self.progress: float = 0.0
+        # When the current task must be done, for a shard sharing the time limit of its document
+        self.deadline: Optional[float] = None
+        self.over_memory_since: Optional[float] = None
+        self.tasks_done: int = 0
+
+
+class WorkerPool(Executor):
+    """ A process pool whose workers can be killed one at a time, which `ProcessPoolExecutor` does not allow: killing one
+    of its processes breaks the whole pool.
+
+    Busy workers are killed, and replaced, when their task runs `KILL_GRACE_SECONDS` past the document time limit, when
+    they report no progress (see `limits.report_progress`) for that long past the page time limit, or when they stay
+    above the memory limit for that long. A task submitted with `submit_by` is also killed that long past its deadline. Their task fails with `WorkerKilled`, like the task of a worker that died.
+    Idle workers above the memory limit are recycled. Workers are started as tasks need them, and spawned rather than
+    forked: torch/easyocr and CUDA do not survive a fork of an initialised parent.
+    """
+
+    def __init__(self, workers: int, limits: Optional[LimitsConfiguration] = None, initializer: Optional[Callable] = None, initargs: tuple = ()):
+        self.max_workers: int = workers
+        self.limits: LimitsConfiguration = limits or LimitsConfiguration()
+        self._context = mp.get_context("spawn")
+        self._initializer = initializer
+        self._initargs: tuple = initargs
+        self._workers: list[_Worker] = []
+        self._queue: collections.deque[tuple[Future, Optional[float], Callable, tuple, dict]] = collections.deque()
+        # Reentrant, the callbacks of a future run while it is held and may submit more work
+        self._lock = threading.RLock()
+        self._shutdown: bool = False
+        self._wakeup_reader, self._wakeup_writer = mp.Pipe(duplex=False)
+        self._woken: bool = False
+        self._thread = threading.Thread(target=self._manage, name="WorkerPool", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        return self.submit_by(None, fn, *args, **kwargs)
+
+    def submit_by(self, deadline: Optional[float], fn, /, *args, **kwargs) -> Future:
+        """ Like `submit`, for a task that must be done by `deadline`, a wall-clock time (`time.time()`), such as a
+        shard of a document whose shards share the document time limit. """
+        future = Future()
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("Cannot submit to a worker pool that is shut down")
+            self._queue.append((future, deadline, fn, args, kwargs))
+            self._wakeup()
+        return future
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        with self._lock:
+            self._shutdown = True
+            if cancel_futures:
+                while self._queue:
+                    self._queue.popleft()[0].cancel()
+            self._wakeup()
+        if wait:
+            self._thread.join()
+
+    def _wakeup(self):
+        # At most one message in the pipe, a full pipe would block the caller while it holds the lock
+        if not self._woken:
+            self._woken = True
+            self._wakeup_writer.send(None)
+
+    def _manage(self):
+        while True:
+            with self._lock:
+                self._dispatch()
+                if self._shutdown and not self._queue and all(worker.future is None for worker in self._workers):
+                    break
+                waitables = [self._wakeup_reader] + [worker.conn for worker in self._workers] + [worker.process.sentinel for worker in self._workers]
+            wait(waitables, timeout=POLL_SECONDS)
+            with self._lock:
+                if self._woken:
+                    self._wakeup_reader.recv()
+                    self._woken = False
+                for worker in list(self._workers):
+                    self._receive(worker)
+                self._enforce_limits()
+
+        for worker in self._workers:
+            self._stop(worker)
+        self._workers.clear()
+
+    def _dispatch(self):
+        while self._queue:
+            worker = next((worker for worker in self._workers if worker.future is None), None)
+            if worker is None:
+                if len(self._workers) >= self.max_workers:
+                    return
+                worker = _Worker(self._context, self._initializer, self._initargs)
+                self._workers.append(worker)
+            future, deadline, fn, args, kwargs = self._queue.popleft()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                worker.conn.send((fn, args, kwargs))
+            except Exception as e:
+                # Could not be pickled, nothing was sent
+                future.set_exception(e)
+                continue
+            worker.future = future
+            worker.started = worker.progress = time.monotonic()
+            worker.deadline = None if deadline is None else worker.started + deadline - time.time()
+            worker.over_memory_since = None
+
+    def _receive(self, worker: _Worker):
+        try:
+            while worker.conn.poll():
+                kind, value = worker.conn.recv()
+                if kind == "progress":
+                    worker.progress = time.monotonic()
+                    continue
+                future, worker.future = worker.future, None
+                worker.tasks_done += 1
+                if kind == "result":
+                    future.set_result(value)
+                else:
+                    future.set_exception(RuntimeError(value))
+        except (EOFError, OSError):
+            pass
+        if not worker.process.is_alive():
+            self._discard(worker, f"The worker process exited with code {worker.process.exitcode}")
+
+    def _enforce_limits(self):
+        now = time.monotonic()
+        for worker in list(self._workers):
+            rss = rss_mb(worker.process.pid) if self.limits.memory_mb > 0 else None
+            over_memory = rss is not None and rss > self.limits.memory_mb
+            if worker.future is None:
+                if over_memory and worker.tasks_done:
+                    logging.info(f"Recycling worker {worker.process.pid}, it uses {rss:.0f}MB of memory")
+                    self._workers.remove(worker)
+                    self._stop(worker)
+                continue
+
+            reason = None
+            worker.over_memory_since = (worker.over_memory_since or now) if over_memory else None
+            if self.limits.document_seconds > 0 and now - worker.started > self.limits.document_seconds + KILL_GRACE_SECONDS:
+                reason = f"it took longer than {self.limits.document_seconds}s"
+            elif worker.deadline is not None and now > worker.deadline + KILL_GRACE_SECONDS:
+                reason = f"its document took longer than {self.limits.document_seconds}s"
+            elif self.limits.page_seconds > 0 and now - worker.progress > self.limits.page_seconds + KILL_GRACE_SECONDS:
+                reason = f"it spent longer than {self.limits.page_seconds}s on a page"
+            elif worker.over_memory_since is not None and now - worker.over_memory_since > KILL_GRACE_SECONDS:
+                reason = f"it used {rss:.0f}MB of memory, more than {self.limits.memory_mb}MB"
+            if reason:
+                logging.warning(f"Killing worker {worker.process.pid}, {reason}")
+                worker.process.kill()
+                self._discard(worker, f"The worker process was killed, {reason}")
+
+    def _discard(self, worker: _Worker, message: str):
+        self._workers.remove(worker)
+        worker.process.join()
+        worker.conn.close()
+        if worker.future is not None:
+            worker.future.set_exception(WorkerKilled(message))
+
+    @staticmethod
+    def _stop(worker: _Worker):
+        try:
+            worker.conn.send(None)
+        except OSError:
+            pass
+        worker.process.join(KILL_GRACE_SECONDS)
+        if worker.process.is_alive():
+            worker.process.kill()
+            worker.process.join()
+        worker.conn.close()